@@ -0,0 +1,107 @@
+"""
+Benchmarks for reading distortion models and lookup tables.
+"""
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from stwcs.distortion import models, mutil
+from stwcs.updatewcs import npol
+from stwcs.updatewcs.corrections import TDDCorr
+
+from .common import DETECTORS, make_datasets
+from stwcs.tests.synthetic import DETECTORS as SPECS, make_idctab
+
+
+class ReadIDCtab(object):
+    params = DETECTORS
+    param_names = ['detector']
+
+    def setup_cache(self):
+        return make_datasets()
+
+    def setup(self, datasets, detector):
+        fname, refs = datasets[detector]
+        self.idctab = refs['IDCTAB']
+        self.offtab = refs.get('OFFTAB')
+        spec = SPECS[detector]
+        self.chip = spec['chips'][0]
+        self.date = spec['date']
+        filters = list(spec['filters'].values())
+        self.filter1 = filters[0]
+        self.filter2 = filters[1] if len(filters) > 1 else 'CLEAR'
+        mutil.idctab_cache.clear()
+
+    def _read(self, use_cache):
+        mutil.readIDCtab(self.idctab, chip=self.chip, date=self.date,
+                         filter1=self.filter1, filter2=self.filter2,
+                         offtab=self.offtab, use_cache=use_cache)
+
+    def time_readIDCtab(self, datasets, detector):
+        self._read(False)
+
+    def time_readIDCtab_cached(self, datasets, detector):
+        self._read(True)
+
+
+class NPOLCorr(object):
+    """ Time to build the WCSDVARR extensions from an NPOLFILE. """
+    params = ['ACS/WFC', 'WFC3/UVIS']
+    param_names = ['detector']
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, detector):
+        self.fobj = fits.open(datasets[detector][0])
+
+    def teardown(self, datasets, detector):
+        self.fobj.close()
+
+    def time_applyNPOLCorr(self, datasets, detector):
+        npol.NPOLCorr.applyNPOLCorr(self.fobj)
+
+
+class ApplyIDCModel(object):
+    """ Time to apply ACS/WFC distortion models to 10**7 positions. """
+    params = [4, 5]
+    param_names = ['norder']
+    timeout = 120
+
+    def setup_cache(self):
+        return dict((norder, make_idctab(os.path.abspath('idc_order{0}.fits'.format(norder)),
+                                         'ACS/WFC', norder=norder))
+                    for norder in self.params)
+
+    def setup(self, idctabs, norder):
+        mutil.idctab_cache.clear()
+        self.models = [models.IDCModel(idctabs[norder], chip=chip, filter1='F606W',
+                                       filter2='CLEAR2L')
+                       for chip in SPECS['ACS/WFC']['chips']]
+        rng = np.random.RandomState(0)
+        self.pixpos = rng.uniform(1, 4096, size=(10 ** 7, 2))
+        self.index = rng.randint(len(self.models), size=10 ** 7)
+
+    def time_apply(self, idctabs, norder):
+        self.models[0].apply(self.pixpos)
+
+    def time_apply_models(self, idctabs, norder):
+        models.apply_models(self.models, self.pixpos, self.index)
+
+
+class TDDCoefficients(object):
+    """ Time to apply the ACS/WFC TDD correction for many observation dates. """
+    params = [10, 10000]
+    param_names = ['ndates']
+
+    def setup_cache(self):
+        return make_idctab(os.path.abspath('idc_tdd.fits'), 'ACS/WFC')
+
+    def setup(self, idctab, ndates):
+        mutil.idctab_cache.clear()
+        self.model = models.IDCModel(idctab, chip=1, filter1='F606W', filter2='CLEAR2L')
+        self.dates = np.linspace(2002.5, 2020., ndates)
+
+    def time_tdd_coeffs(self, idctab, ndates):
+        TDDCorr.tdd_coeffs(self.model, self.dates)
@@ -0,0 +1,165 @@
+"""
+Benchmarks for creating and applying headerlets.
+"""
+import io
+import os
+import shutil
+import tempfile
+
+from astropy.io import fits
+
+from stwcs import updatewcs
+from stwcs.tests import synthetic
+from stwcs.wcsutil import headerlet, hletstore
+
+from .common import DETECTORS, ScratchCopy, make_datasets
+
+
+class Headerlet(ScratchCopy):
+    params = DETECTORS
+    param_names = ['detector']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, detector):
+        ScratchCopy.setup(self, datasets, detector)
+        self.hdrlet = os.path.join(self.tmpdir, 'bench_hlet.fits')
+        headerlet.create_headerlet(self.fname, hdrname='BENCH').tofile(self.hdrlet)
+
+    def time_create_headerlet(self, datasets, detector):
+        headerlet.create_headerlet(self.fname, hdrname='BENCH')
+
+    def time_apply_headerlet_as_primary(self, datasets, detector):
+        headerlet.apply_headerlet_as_primary(self.fname, self.hdrlet,
+                                             attach=False, archive=False)
+
+
+class HeaderletLookup(ScratchCopy):
+    params = [10, 50]
+    param_names = ['nheaderlets']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, nheaderlets):
+        ScratchCopy.setup(self, datasets, 'ACS/WFC')
+        for i in range(nheaderlets):
+            headerlet.archive_as_headerlet(self.fname, 'HLET%d' % i, wcskey='PRIMARY')
+        self.fobj = fits.open(self.fname)
+        self.names = ['HLET%d' % i for i in range(nheaderlets)]
+
+    def teardown(self, datasets, nheaderlets):
+        self.fobj.close()
+        ScratchCopy.teardown(self, datasets, 'ACS/WFC')
+
+    def time_find_headerlet_HDUs(self, datasets, nheaderlets):
+        for name in self.names:
+            headerlet.find_headerlet_HDUs(self.fobj, hdrname=name)
+
+
+class HeaderletSummary(ScratchCopy):
+    params = [False, True]
+    param_names = ['compress']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, compress):
+        ScratchCopy.setup(self, datasets, 'ACS/WFC')
+        hlet = headerlet.create_headerlet(self.fname, hdrname='BENCH')
+        with fits.open(self.fname, mode='append') as fobj:
+            for i in range(10):
+                fobj.append(headerlet.HeaderletHDU.fromheaderlet(hlet, compress=compress))
+
+    def teardown(self, datasets, compress):
+        ScratchCopy.teardown(self, datasets, 'ACS/WFC')
+
+    def time_headerlet_summary(self, datasets, compress):
+        headerlet.headerlet_summary(self.fname, quiet=True)
+
+
+class HeaderletSharedTables(ScratchCopy):
+    params = [False, True]
+    param_names = ['share_tables']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, share_tables):
+        ScratchCopy.setup(self, datasets, 'ACS/WFC')
+
+    def teardown(self, datasets, share_tables):
+        ScratchCopy.teardown(self, datasets, 'ACS/WFC')
+
+    def _archive(self, share_tables):
+        for i in range(10):
+            headerlet.archive_as_headerlet(self.fname, 'HLET%d' % i, wcskey='PRIMARY',
+                                           share_tables=share_tables)
+
+    def time_archive_as_headerlet(self, datasets, share_tables):
+        self._archive(share_tables)
+
+    def track_file_size(self, datasets, share_tables):
+        self._archive(share_tables)
+        return os.path.getsize(self.fname)
+    track_file_size.unit = 'bytes'
+
+
+class ApplyHeaderlets(object):
+    params = [1, 4]
+    param_names = ['workers']
+    timeout = 600
+
+    def setup(self, workers):
+        self.tmpdir = tempfile.mkdtemp()
+        refs = synthetic.make_reference_files(self.tmpdir, 'ACS/WFC')
+        self.headerlets = {}
+        for i in range(8):
+            fname = synthetic.make_observation(os.path.join(self.tmpdir, 'acs%d_flt.fits' % i),
+                                               'ACS/WFC', refs)
+            updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+            hdrlet = os.path.join(self.tmpdir, 'acs%d_hlet.fits' % i)
+            headerlet.create_headerlet(fname, hdrname='BENCH').tofile(hdrlet)
+            self.headerlets[fname] = hdrlet
+
+    def teardown(self, workers):
+        shutil.rmtree(self.tmpdir)
+
+    def time_apply_headerlets(self, workers):
+        headerlet.apply_headerlets(self.headerlets, as_primary=False, workers=workers)
+
+
+class HeaderletStoreQuery(object):
+    timeout = 300
+
+    def setup_cache(self):
+        path = os.path.abspath('hletstore')
+        hdu = fits.PrimaryHDU()
+        hdu.header['DISTNAME'] = 'bench'
+        with hletstore.HeaderletStore(path) as store:
+            for i in range(5000):
+                hdu.header['DESTIM'] = 'obs%04d' % (i // 5)
+                hdu.header['HDRNAME'] = 'HLET%d' % (i % 5)
+                hdu.header['CATALOG'] = 'GAIA' if i % 5 == 0 else 'GSC'
+                buf = io.BytesIO()
+                hdu.writeto(buf)
+                store.insert(buf.getvalue())
+        return path
+
+    def setup(self, path):
+        self.store = hletstore.HeaderletStore(path)
+
+    def teardown(self, path):
+        self.store.close()
+
+    def time_query_destim(self, path):
+        for i in range(100):
+            self.store.query(destim='obs%04d' % i)
+
+    def time_query_catalog(self, path):
+        self.store.query(catalog='GAIA', distname='bench')
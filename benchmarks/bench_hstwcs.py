@@ -0,0 +1,219 @@
+"""
+Benchmarks for coordinate transformations with the full distortion model.
+"""
+import pickle
+
+import numpy as np
+from astropy.io import fits
+
+from stwcs.wcsutil import HSTWCS, ParallelHSTWCS
+
+from .common import DETECTORS, make_datasets
+
+
+class AllWorld2Pix(object):
+    params = (DETECTORS, [10000, 1000000])
+    param_names = ['detector', 'npoints']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, detector, npoints):
+        with fits.open(datasets[detector][0]) as f:
+            self.wcs = HSTWCS(f, ext=('SCI', 1))
+        rng = np.random.RandomState(0)
+        self.x = rng.uniform(1, self.wcs.naxis1, npoints)
+        self.y = rng.uniform(1, self.wcs.naxis2, npoints)
+        self.ra, self.dec = self.wcs.all_pix2world(self.x, self.y, 1)
+
+    def time_all_world2pix(self, datasets, detector, npoints):
+        self.wcs.all_world2pix(self.ra, self.dec, 1, accuracy=1e-4, maxiter=20)
+
+    def time_all_pix2world(self, datasets, detector, npoints):
+        self.wcs.all_pix2world(self.x, self.y, 1)
+
+
+class AllWorld2PixMethod(object):
+    params = (DETECTORS, ['fixed-point', 'newton'], [1e-4, 1e-8])
+    param_names = ['detector', 'method', 'accuracy']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, detector, method, accuracy):
+        AllWorld2Pix.setup(self, datasets, detector, 1000000)
+
+    def time_all_world2pix(self, datasets, detector, method, accuracy):
+        self.wcs.all_world2pix(self.ra, self.dec, 1, accuracy=accuracy,
+                               maxiter=20, method=method)
+
+
+class InverseSIPWorld2Pix(object):
+    """ all_world2pix starting from inverse SIP polynomials (AP, BP). """
+    params = (DETECTORS, [False, True], [1e-2, 1e-4])
+    param_names = ['detector', 'inverse_sip', 'accuracy']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, detector, inverse_sip, accuracy):
+        AllWorld2Pix.setup(self, datasets, detector, 1000000)
+        if inverse_sip:
+            self.wcs.fit_inverse_sip(max_error=1e-3)
+
+    def time_all_world2pix(self, datasets, detector, inverse_sip, accuracy):
+        self.wcs.all_world2pix(self.ra, self.dec, 1, accuracy=accuracy, maxiter=20)
+
+
+class ChunkedWorld2Pix(object):
+    params = ([None, 100000],)
+    param_names = ['chunk_size']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, chunk_size):
+        AllWorld2Pix.setup(self, datasets, 'ACS/WFC', 1000000)
+
+    def time_all_world2pix(self, datasets, chunk_size):
+        self.wcs.all_world2pix(self.ra, self.dec, 1, chunk_size=chunk_size)
+
+    def peakmem_all_world2pix(self, datasets, chunk_size):
+        self.wcs.all_world2pix(self.ra, self.dec, 1, chunk_size=chunk_size)
+
+
+class ParallelTransforms(object):
+    """ Full 4096x2048 ACS/WFC chip pixel grid converted with 1-8 threads. """
+    params = ([1, 2, 4, 8],)
+    param_names = ['nthreads']
+    timeout = 600
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, nthreads):
+        with fits.open(datasets['ACS/WFC'][0]) as f:
+            wcs = HSTWCS(f, ext=('SCI', 1))
+        self.pwcs = ParallelHSTWCS(wcs, nthreads=nthreads)
+        y, x = np.mgrid[1:2049, 1:4097]
+        self.x = x.ravel().astype(np.float64)
+        self.y = y.ravel().astype(np.float64)
+        self.ra, self.dec = wcs.all_pix2world(self.x, self.y, 1)
+
+    def teardown(self, datasets, nthreads):
+        self.pwcs.close()
+
+    def time_all_pix2world(self, datasets, nthreads):
+        self.pwcs.all_pix2world(self.x, self.y, 1)
+
+    def time_pix2foc(self, datasets, nthreads):
+        self.pwcs.pix2foc(self.x, self.y, 1)
+
+    def time_all_world2pix(self, datasets, nthreads):
+        self.pwcs.all_world2pix(self.ra, self.dec, 1)
+
+
+class DistortionGridTransforms(object):
+    """ Full 4096x2048 ACS/WFC chip with the exact model and a distortion grid. """
+    params = ([8, 16, 64], [1, 3])
+    param_names = ['step', 'order']
+    timeout = 300
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, step, order):
+        with fits.open(datasets['ACS/WFC'][0]) as f:
+            self.wcs = HSTWCS(f, ext=('SCI', 1))
+        self.grid = self.wcs.distortion_grid(step=step, order=order)
+        self.xs = np.arange(1, 4097, dtype=np.float64)
+        self.ys = np.arange(1, 2049, dtype=np.float64)
+        y, x = np.mgrid[1:2049, 1:4097]
+        self.x = x.ravel().astype(np.float64)
+        self.y = y.ravel().astype(np.float64)
+
+    def time_build(self, datasets, step, order):
+        self.wcs.distortion_grid(step=step, order=order)
+
+    def time_exact_pix2foc(self, datasets, step, order):
+        self.wcs.pix2foc(self.x, self.y, 1)
+
+    def time_pix2foc(self, datasets, step, order):
+        self.grid.pix2foc(self.x, self.y, 1)
+
+    def time_pix2foc_grid(self, datasets, step, order):
+        self.grid.pix2foc_grid(self.xs, self.ys, 1)
+
+    def time_all_pix2world_grid(self, datasets, step, order):
+        self.grid.all_pix2world_grid(self.xs, self.ys, 1)
+
+    def track_max_error(self, datasets, step, order):
+        return self.grid.max_error
+
+
+class CreateHSTWCS(object):
+    params = ([False, True],)
+    param_names = ['lazy_distortion']
+
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets, lazy_distortion):
+        self.fobj = fits.open(datasets['ACS/WFC'][0])
+
+    def teardown(self, datasets, lazy_distortion):
+        self.fobj.close()
+
+    def time_hstwcs(self, datasets, lazy_distortion):
+        HSTWCS(self.fobj, ext=('SCI', 1), lazy_distortion=lazy_distortion)
+
+
+class CopyHSTWCS(object):
+    """ Per-chip copy of the reference WCS made by makecorr. """
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets):
+        with fits.open(datasets['ACS/WFC'][0]) as f:
+            self.wcs = HSTWCS(f, ext=('SCI', 1))
+            self.wcs.readModel()
+
+    def time_deepcopy(self, datasets):
+        self.wcs.deepcopy()
+
+    def time_linear_copy(self, datasets):
+        self.wcs.linear_copy()
+
+
+class SerializeHSTWCS(object):
+    def setup_cache(self):
+        return make_datasets(updated=True)
+
+    def setup(self, datasets):
+        with fits.open(datasets['ACS/WFC'][0]) as f:
+            self.wcs = HSTWCS(f, ext=('SCI', 1))
+        self.data = self.wcs.to_bytes()
+        self.pickled = pickle.dumps(self.wcs)
+
+    def time_to_bytes(self, datasets):
+        self.wcs.to_bytes()
+
+    def time_from_bytes(self, datasets):
+        HSTWCS.from_bytes(self.data)
+
+    def time_pickle(self, datasets):
+        pickle.dumps(self.wcs)
+
+    def time_unpickle(self, datasets):
+        pickle.loads(self.pickled)
+
+    def track_size(self, datasets):
+        return len(self.data)
@@ -0,0 +1,34 @@
+"""
+Benchmarks for updatewcs on synthetic full size observations.
+
+Run with ``asv run`` from the top level directory.
+"""
+from stwcs import updatewcs
+
+from .common import DETECTORS, ScratchCopy, make_datasets
+
+
+class UpdateWCS(ScratchCopy):
+    """
+    Time and peak memory of updatewcs. Only headers and the small lookup
+    table extensions change, so the peak memory should not scale with the
+    size of the file (64 MB for ACS/WFC and WFC3/UVIS).
+    """
+    params = DETECTORS
+    param_names = ['detector']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_datasets()
+
+    def time_updatewcs(self, datasets, detector):
+        updatewcs.updatewcs(self.fname, checkfiles=False, use_db=False)
+
+    def peakmem_updatewcs(self, datasets, detector):
+        updatewcs.updatewcs(self.fname, checkfiles=False, use_db=False)
+
+    def time_makecorr(self, datasets, detector):
+        updatewcs.makecorr(self.fname, ['MakeWCS', 'CompSIP', 'VACorr'])
+
+    def peakmem_makecorr(self, datasets, detector):
+        updatewcs.makecorr(self.fname, ['MakeWCS', 'CompSIP', 'VACorr'])
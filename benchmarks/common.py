@@ -0,0 +1,60 @@
+"""
+Synthetic datasets shared by the benchmarks.
+
+Reference files and full size observations are generated with
+`stwcs.tests.synthetic` in the asv cache directory, so the benchmarks
+do not need CRDS or archive access.
+"""
+import os
+import shutil
+import tempfile
+
+from stwcs import updatewcs
+from stwcs.tests import synthetic
+
+os.environ['ASTROMETRY_STEP_CONTROL'] = 'Off'
+
+DETECTORS = ['ACS/WFC', 'WFC3/UVIS', 'WFC3/IR', 'WFPC2']
+
+
+def make_datasets(updated=False):
+    """
+    Write reference files and an observation for each detector
+    in the current directory.
+
+    Parameters
+    ----------
+    updated : bool
+        If True, run updatewcs on the observations.
+
+    Returns
+    -------
+    datasets : dict
+        {detector: (observation, reference files)}
+    """
+    datasets = {}
+    for detector in DETECTORS:
+        refs = synthetic.make_reference_files(os.getcwd(), detector)
+        name = os.path.abspath(detector.replace('/', '_').lower() + '_flt.fits')
+        synthetic.make_observation(name, detector, refs)
+        if updated:
+            updatewcs.updatewcs(name, checkfiles=False, use_db=False)
+        datasets[detector] = (name, refs)
+    return datasets
+
+
+class ScratchCopy(object):
+    """
+    Mixin copying the observation to a temporary directory before each
+    repeat, for benchmarks which modify it.
+    """
+    # setup runs once per repeat: time a single call on each fresh copy
+    number = 1
+    def setup(self, datasets, detector):
+        fname, self.refs = datasets[detector]
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, os.path.basename(fname))
+        shutil.copyfile(fname, self.fname)
+
+    def teardown(self, datasets, detector):
+        shutil.rmtree(self.tmpdir)
@@ -88,12 +88,13 @@ setup(
         'requests',
         'lxml'
     ],
-    packages = find_packages(),
+    packages = find_packages(exclude=['benchmarks']),
     tests_require = ['pytest'],
     package_data = {
         'stwcs/gui': ['*.help'],
         'stwcs/gui/pars': ['*'],
         'stwcs/gui/htmlhelp': ['*'],
+        'stwcs/tests/data': ['*.fits', '*.txt'],
     },
     cmdclass = {"test": PyTest}
 )
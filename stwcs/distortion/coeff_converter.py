@@ -2,6 +2,8 @@ import numpy as np
 from astropy.io import fits
 from astropy import wcs as pywcs
 
+from . import mutil
+
 
 def sip2idc(wcs):
     """
@@ -104,6 +106,70 @@ def _read_sip_kw(header):
     return a, b
 
 
+def fit_inverse_sip(a, b, crpix, naxis, max_error=1e-3, max_order=9, npoints=64):
+    """
+    Fit inverse SIP polynomials (AP, BP) to forward SIP coefficients.
+
+    The forward transformation ``U = u + A(u, v)``, ``V = v + B(u, v)`` is
+    sampled on a grid of ``npoints x npoints`` positions covering the image
+    and ``AP(U, V) = u - U``, ``BP(U, V) = v - V`` are fit with least squares.
+    The order of the inverse polynomials is increased, starting from 1, until
+    the largest residual on a grid of ``2 * npoints + 1`` positions per axis
+    is smaller than ``max_error``.
+
+    Parameters
+    ----------
+    a, b : ndarray
+        Forward SIP coefficients, ``a[p, q]`` is the coefficient of ``u**p * v**q``.
+    crpix : sequence
+        Reference pixel (1-based) of the SIP polynomials.
+    naxis : sequence
+        Size of the image, (NAXIS1, NAXIS2).
+    max_error : float
+        Required residual in pixels.
+    max_order : int
+        Largest order tried.
+    npoints : int
+        Number of fit positions along each axis.
+
+    Returns
+    -------
+    ap, bp : ndarray
+        Inverse SIP coefficients. If ``max_error`` is not reached, the
+        coefficients of the order with the smallest residual are returned.
+    max_residual, rms_residual : float
+        Largest and RMS residual in pixels on the validation grid.
+    """
+    def forward(npts):
+        u, v = np.meshgrid(np.linspace(1., naxis[0], npts) - crpix[0],
+                           np.linspace(1., naxis[1], npts) - crpix[1])
+        u = u.ravel()
+        v = v.ravel()
+        return u, v, u + mutil.horner2d(u, v, a), v + mutil.horner2d(u, v, b)
+
+    u, v, fu, fv = forward(npoints)
+    tu, tv, tfu, tfv = forward(2 * npoints + 1)
+    # scale the coordinates to keep the normal equations well conditioned
+    scale = max(np.abs(fu).max(), np.abs(fv).max(), 1.)
+    best = None
+    for order in range(1, max_order + 1):
+        powers = [(p, q) for p in range(order + 1) for q in range(order + 1 - p)]
+        design = np.column_stack([(fu / scale) ** p * (fv / scale) ** q for p, q in powers])
+        sol = np.linalg.lstsq(design, np.column_stack([u - fu, v - fv]), rcond=None)[0]
+        ap = np.zeros((order + 1, order + 1), dtype=np.float64)
+        bp = np.zeros((order + 1, order + 1), dtype=np.float64)
+        for (p, q), cu, cv in zip(powers, sol[:, 0], sol[:, 1]):
+            ap[p, q] = cu / scale ** (p + q)
+            bp[p, q] = cv / scale ** (p + q)
+        residual = np.hypot(tfu + mutil.horner2d(tfu, tfv, ap) - tu,
+                            tfv + mutil.horner2d(tfu, tfv, bp) - tv)
+        result = (ap, bp, residual.max(), np.sqrt(np.mean(residual ** 2)))
+        if best is None or result[2] < best[2]:
+            best = result
+        if best[2] < max_error:
+            break
+    return best
+
 """
 def idc2sip(wcsobj, idctab = None):
     if isinstance(wcs,pywcs.WCS):
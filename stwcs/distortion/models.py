@@ -1,3 +1,5 @@
+import copy
+
 import numpy as np
 from . import mutil
 from .mutil import combin
@@ -56,6 +58,19 @@ class GeometryModel:
 
         self.pscale = 1.0
 
+    def copy(self):
+        """
+        Return a copy of the model with its own coefficient arrays and
+        reference point dictionary, which the corrections modify in place.
+        """
+        new = copy.copy(self)
+        for attr in ['cx', 'cy', 'ocx', 'ocy']:
+            value = getattr(self, attr, None)
+            if value is not None:
+                setattr(new, attr, value.copy())
+        new.refpix = copy.deepcopy(self.refpix)
+        return new
+
     def shift(self, xs, ys):
         """
         Shift reference position of coefficients to new center
@@ -191,15 +206,11 @@ class GeometryModel:
             _p = np.array(_p, dtype=np.float64)
             _convert = True
 
-        dxy = _p - (self.refpix['XREF'], self.refpix['YREF'])
         # Apply coefficients from distortion model here...
-        c = _p * 0.
-        for i in range(order + 1):
-            for j in range(i + 1):
-                c[:, 0] = c[:, 0] + _cx[i][j] * pow(dxy[:, 0], j) * pow(dxy[:, 1], (i - j))
-                c[:, 1] = c[:, 1] + _cy[i][j] * pow(dxy[:, 0], j) * pow(dxy[:, 1], (i - j))
-        xc = c[:, 0]
-        yc = c[:, 1]
+        dx = _p[:, 0] - self.refpix['XREF']
+        dy = _p[:, 1] - self.refpix['YREF']
+        xc = mutil.horner2d(dx, dy, _idc2poly(_cx, order))
+        yc = mutil.horner2d(dx, dy, _idc2poly(_cy, order))
 
         # Convert results back to same form as original input
         if _convert:
@@ -220,11 +231,61 @@ class GeometryModel:
         self.pscale = pscale
 
 
+def apply_models(models, pixpos, index, scale=1.0, order=None):
+    """
+    Apply the distortion models of several chips to a set of positions.
+
+    Parameters
+    ----------
+    models : list of `GeometryModel`
+        Models of the chips.
+    pixpos : ndarray
+        Nx2 array of pixel positions.
+    index : ndarray
+        Index in ``models`` of the model applied to each position.
+    scale, order :
+        See `GeometryModel.apply`.
+
+    Returns
+    -------
+    xc, yc : ndarray
+        Adjusted positions in arcseconds from the reference position
+        of the chip of each position.
+    """
+    pixpos = np.asarray(pixpos, dtype=np.float64)
+    index = np.asarray(index)
+    xc = np.empty(pixpos.shape[0], dtype=np.float64)
+    yc = np.empty(pixpos.shape[0], dtype=np.float64)
+    # group the positions by chip
+    order_by_chip = np.argsort(index, kind='stable')
+    bounds = np.searchsorted(index[order_by_chip], np.arange(len(models) + 1))
+    for i, model in enumerate(models):
+        rows = order_by_chip[bounds[i]:bounds[i + 1]]
+        if rows.size:
+            xc[rows], yc[rows] = model.apply(pixpos[rows], scale=scale, order=order)
+    return xc, yc
+
+
+def _idc2poly(coeffs, order):
+    """
+    Rearrange IDC coefficients ``c[i, j]`` of ``x**j * y**(i - j)`` as
+    coefficients ``p[j, k]`` of ``x**j * y**k`` up to degree ``order``.
+    """
+    poly = np.zeros((order + 1, order + 1), dtype=np.float64)
+    for i in range(order + 1):
+        for j in range(i + 1):
+            poly[j, i - j] = coeffs[i][j]
+    return poly
+
+
 class IDCModel(GeometryModel):
     """
     This class will open the IDCTAB, select proper row based on
     chip/direction and populate cx,cy arrays.
     We also need to read in SCALE, XCOM,YCOM, XREF,YREF as well.
+
+    ``idcfile`` is either a file name or a `~stwcs.distortion.mutil.IDCTable`,
+    which avoids reading the table again for each chip.
     """
     def __init__(self, idcfile, date=None, chip=1, direction='forward',
                  filter1='CLEAR1', filter2='CLEAR2', offtab=None, binned=1):
@@ -236,7 +297,10 @@ class IDCModel(GeometryModel):
         # Read in table.
         # Populate cx,cy,scale, and other variables here.
         #
-        self.name = idcfile
+        if isinstance(idcfile, mutil.IDCTable):
+            self.name = idcfile.filename
+        else:
+            self.name = idcfile
         self.cx, self.cy, self.refpix, self.norder = mutil.readIDCtab(idcfile,
                                                                       chip=chip, direction=direction, filter1=filter1, filter2=filter2,
                                                                       date=date, offtab=offtab)
@@ -1,7 +1,118 @@
+import os
+import copy
+import threading
+from collections import OrderedDict
+
 from stsci.tools import fileutil
+
+from .. import instrumentation
 import numpy as np
 import calendar
 
+
+class IDCTabCache(object):
+    """
+    Bounded LRU cache of distortion models read from IDCTAB files.
+
+    An entry is keyed by the resolved path and modification time of the
+    IDCTAB, the chip, filters and direction, the OFFTAB and, when an OFFTAB
+    is used, the observation date (V2REF/V3REF are interpolated in time).
+    Modifying an IDCTAB on disk changes its mtime and invalidates
+    the entries read from it.
+
+    Cached coefficient arrays are read-only; `get` returns new copies of
+    ``(fx, fy, refpix, order)`` so callers can modify them freely.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of models kept in the cache.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, key):
+        """ Return a copy of the model stored under ``key`` or None. """
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                self.misses += 1
+                return None
+            self._models.move_to_end(key)
+            self.hits += 1
+        fx, fy, refpix, order = model
+        return fx.copy(), fy.copy(), copy.deepcopy(refpix), order
+
+    def put(self, key, model):
+        """ Store a read-only copy of ``model = (fx, fy, refpix, order)``. """
+        if self.maxsize <= 0:
+            return
+        fx, fy, refpix, order = model
+        fx = fx.copy()
+        fy = fy.copy()
+        fx.flags.writeable = False
+        fy.flags.writeable = False
+        with self._lock:
+            self._models[key] = (fx, fy, copy.deepcopy(refpix), order)
+            self._models.move_to_end(key)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+
+    def clear(self):
+        """ Remove all models and reset the counters. """
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """ Return a dictionary with the cache statistics. """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._models), 'maxsize': self.maxsize}
+
+
+# Process-wide cache used by readIDCtab
+idctab_cache = IDCTabCache()
+
+
+def _file_signature(fname):
+    """
+    Return (absolute path, mtime) of a reference file or None if the file
+    can not be found on disk.
+    """
+    if fname is None:
+        return None
+    path = os.path.abspath(fileutil.osfn(fname))
+    try:
+        return path, os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _idctab_cache_key(tabname, chip, date, direction, filter1, filter2, offtab):
+    tabsig = _file_signature(tabname)
+    if tabsig is None:
+        return None
+    if offtab:
+        offsig = _file_signature(offtab)
+        if offsig is None:
+            return None
+        # DATE-OBS has a resolution of one day
+        datekey = str(date).strip()
+    else:
+        offsig = None
+        datekey = None
+    return (tabsig, int(chip), str(filter1).strip(), str(filter2).strip(),
+            str(direction).strip(), offsig, datekey)
+
+
 # This function read the IDC table and generates the two matrices with
 # the geometric correction coefficients.
 #
@@ -14,7 +125,7 @@ import calendar
 
 
 def readIDCtab(tabname, chip=1, date=None, direction='forward',
-               filter1=None, filter2=None, offtab=None):
+               filter1=None, filter2=None, offtab=None, use_cache=True):
 
     """
         Read IDCTAB, and optional OFFTAB if sepcified, and generate
@@ -23,6 +134,11 @@ def readIDCtab(tabname, chip=1, date=None, direction='forward',
         If tabname == None, then return a default, undistorted solution.
         If offtab is specified, dateobs also needs to be given.
 
+        tabname may also be an `IDCTable` instance.
+
+        If use_cache is True, models are looked up in and stored to
+        `idctab_cache`.
+
     """
 
     # Return a default geometry model if no IDCTAB filename
@@ -31,218 +147,287 @@ def readIDCtab(tabname, chip=1, date=None, direction='forward',
         print('Warning: No IDCTAB specified! No distortion correction will be applied.')
         return defaultModel()
 
-    # Implement default values for filters here to avoid the default
-    # being overwritten by values of None passed by user.
-    if filter1 is None or filter1.find('CLEAR') == 0 or filter1.strip() == '':
-        filter1 = 'CLEAR'
-    if filter2 is None or filter2.find('CLEAR') == 0 or filter2.strip() == '':
-        filter2 = 'CLEAR'
-
-    # Insure that tabname is full filename with fully expanded
-    # IRAF variables; i.e. 'jref$mc41442gj_idc.fits' should get
-    # expanded to '/data/cdbs7/jref/mc41442gj_idc.fits' before
-    # being used here.
-    # Open up IDC table now...
-    try:
-        ftab = fileutil.openImage(tabname)
-    except:
-        err_str = "------------------------------------------------------------------------ \n"
-        err_str += "WARNING: the IDCTAB geometric distortion file specified in the image     \n"
-        err_str += "header was not found on disk. Please verify that your environment        \n"
-        err_str += "variable ('jref'/'uref'/'oref'/'nref') has been correctly defined. If    \n"
-        err_str += "you do not have the IDCTAB file, you may obtain the latest version       \n"
-        err_str += "of it from the relevant instrument page on the STScI HST website:        \n"
-        err_str += "http://www.stsci.edu/hst/ For WFPC2, STIS and NICMOS data, the           \n"
-        err_str += "present run will continue using the old coefficients provided in         \n"
-        err_str += "the Dither Package (ca. 1995-1998).                                      \n"
-        err_str += "------------------------------------------------------------------------ \n"
-        raise IOError(err_str)
-
-    # First thing we need, is to read in the coefficients from the IDC
-    # table and populate the Fx and Fy matrices.
-
-    if 'DETECTOR' in ftab['PRIMARY'].header:
-        detector = ftab['PRIMARY'].header['DETECTOR']
-    else:
-        if 'CAMERA' in ftab['PRIMARY'].header:
-            detector = str(ftab['PRIMARY'].header['CAMERA'])
-        else:
-            detector = 1
-    # First, read in TDD coeffs if present
-    phdr = ftab['PRIMARY'].header
-    instrument = phdr['INSTRUME']
-    if instrument == 'ACS' and detector == 'WFC':
-        skew_coeffs = read_tdd_coeffs(phdr, chip=chip)
-    else:
-        skew_coeffs = None
-
-    # Set default filters for SBC
-    if detector == 'SBC':
-        if filter1 == 'CLEAR':
-            filter1 = 'F115LP'
-            filter2 = 'N/A'
-        if filter2 == 'CLEAR':
-            filter2 = 'N/A'
-
-    # Read FITS header to determine order of fit, i.e. k
-    norder = ftab['PRIMARY'].header['NORDER']
-    if norder < 3:
-        order = 3
+    key = None
+    if use_cache and not isinstance(tabname, IDCTable):
+        key = _idctab_cache_key(tabname, chip, date, direction,
+                                filter1, filter2, offtab)
+    if key is not None:
+        model = idctab_cache.get(key)
+        if model is not None:
+            return model
+
+    model = _readIDCtab(tabname, chip=chip, date=date, direction=direction,
+                        filter1=filter1, filter2=filter2, offtab=offtab)
+    if key is not None:
+        idctab_cache.put(key, model)
+    return model
+
+
+def _readIDCtab(tabname, chip=1, date=None, direction='forward',
+                filter1=None, filter2=None, offtab=None):
+    if isinstance(tabname, IDCTable):
+        idctable = tabname
     else:
-        order = norder
+        idctable = IDCTable(tabname)
+    return idctable.get_model(chip=chip, date=date, direction=direction,
+                              filter1=filter1, filter2=filter2, offtab=offtab)
 
-    fx = np.zeros(shape=(order + 1, order + 1), dtype=np.float64)
-    fy = np.zeros(shape=(order + 1, order + 1), dtype=np.float64)
 
-    # Determine row from which to get the coefficients.
-    # How many rows do we have in the table...
-    fshape = ftab[1].data.shape
-    colnames = ftab[1].data.names
-    row = -1
+def _normalize_filter(name):
+    """ Filter names containing 'CLEAR' all match 'CLEAR'. """
+    name = str(name)
+    if name.find('CLEAR') > -1:
+        name = name[:5]
+    return name
 
-    # Loop over all the rows looking for the one which corresponds
-    # to the value of CCDCHIP we are working on...
-    for i in range(fshape[0]):
 
+class IDCTable(object):
+    """
+    In-memory IDCTAB with an index over the columns used to select a row.
+
+    The table is read once; FILTER1/FILTER2 (or OPT_ELEM/FILTER), DETCHIP
+    and DIRECTION are normalized into NumPy arrays, so a row matching
+    a (chip, filters, direction) combination is found with a vectorized
+    mask. An `IDCTable` can be passed to `readIDCtab` and to
+    `~stwcs.distortion.models.IDCModel` instead of a file name.
+
+    Parameters
+    ----------
+    tabname : str
+        IDCTAB file name. IRAF-style environment variables
+        (e.g. 'jref$') are expanded.
+    """
+    def __init__(self, tabname):
+        self.filename = tabname
+        # Insure that tabname is full filename with fully expanded
+        # IRAF variables; i.e. 'jref$mc41442gj_idc.fits' should get
+        # expanded to '/data/cdbs7/jref/mc41442gj_idc.fits' before
+        # being used here.
+        # Open up IDC table now...
         try:
-            # Match FILTER combo to appropriate row,
-            # if there is a filter column in the IDCTAB...
-            if 'FILTER1' in colnames and 'FILTER2' in colnames:
-
-                filt1 = ftab[1].data.field('FILTER1')[i]
-                if filt1.find('CLEAR') > -1: filt1 = filt1[: 5]
-
-                filt2 = ftab[1].data.field('FILTER2')[i]
-                if filt2.find('CLEAR') > -1: filt2 = filt2[: 5]
-            else:
+            ftab = fileutil.openImage(tabname)
+        except:
+            err_str = "------------------------------------------------------------------------ \n"
+            err_str += "WARNING: the IDCTAB geometric distortion file specified in the image     \n"
+            err_str += "header was not found on disk. Please verify that your environment        \n"
+            err_str += "variable ('jref'/'uref'/'oref'/'nref') has been correctly defined. If    \n"
+            err_str += "you do not have the IDCTAB file, you may obtain the latest version       \n"
+            err_str += "of it from the relevant instrument page on the STScI HST website:        \n"
+            err_str += "http://www.stsci.edu/hst/ For WFPC2, STIS and NICMOS data, the           \n"
+            err_str += "present run will continue using the old coefficients provided in         \n"
+            err_str += "the Dither Package (ca. 1995-1998).                                      \n"
+            err_str += "------------------------------------------------------------------------ \n"
+            raise IOError(err_str)
+        instrumentation.ref_file_opened(ftab.filename(), 'IDCTAB')
+        try:
+            self.phdr = ftab['PRIMARY'].header.copy()
+            data = ftab[1].data
+            self.colnames = list(data.names)
+            self.columns = {}
+            for name in self.colnames:
+                col = np.array(data.field(name))
+                if col.dtype.kind in 'SU':
+                    # trailing blanks are not significant in FITS strings
+                    col = np.char.rstrip(col)
+                self.columns[name] = col
+        finally:
+            ftab.close()
+            del ftab
+        self.nrows = len(self.columns[self.colnames[0]]) if self.colnames else 0
+
+        if 'DETECTOR' in self.phdr:
+            self.detector = self.phdr['DETECTOR']
+        elif 'CAMERA' in self.phdr:
+            self.detector = str(self.phdr['CAMERA'])
+        else:
+            self.detector = 1
+        self.instrument = self.phdr['INSTRUME']
+        self.norder = self.phdr['NORDER']
+        self._build_index()
+
+    def _build_index(self):
+        """
+        Normalize the selection columns. Columns which are not present
+        are represented by None and match any value.
+        """
+        colnames = self.colnames
+        self.filter1 = None
+        self.filter2 = None
+        if 'FILTER1' in colnames and 'FILTER2' in colnames:
+            self.filter1 = self._normalized('FILTER1')
+            self.filter2 = self._normalized('FILTER2')
+        else:
+            if 'OPT_ELEM' in colnames:
+                self.filter1 = self._normalized('OPT_ELEM')
+            if 'FILTER' in colnames:
                 if 'OPT_ELEM' in colnames:
-                    filt1 = ftab[1].data.field('OPT_ELEM')
-                    if filt1.find('CLEAR') > -1: filt1 = filt1[:5]
+                    self.filter2 = self._normalized('FILTER')
                 else:
-                    filt1 = filter1
-
-                if 'FILTER' in colnames:
-                    _filt = ftab[1].data.field('FILTER')[i]
-                    if _filt.find('CLEAR') > -1: _filt = _filt[:5]
-                    if 'OPT_ELEM' in colnames:
-                        filt2 = _filt
-                    else:
-                        filt1 = _filt
-                        filt2 = 'CLEAR'
-                else:
-                    filt2 = filter2
-        except:
-            # Otherwise assume all rows apply and compare to input filters...
-            filt1 = filter1
-            filt2 = filter2
+                    self.filter1 = self._normalized('FILTER')
+                    self.filter2 = np.array(['CLEAR'] * self.nrows)
 
         if 'DETCHIP' in colnames:
-            detchip = ftab[1].data.field('DETCHIP')[i]
-            if not str(detchip).isdigit():
-                detchip = 1
+            self.detchip = np.array([int(d) if str(d).isdigit() else 1
+                                     for d in self.columns['DETCHIP']])
         else:
-            detchip = 1
+            self.detchip = np.ones(self.nrows, dtype=int)
 
         if 'DIRECTION' in colnames:
-            direct = ftab[1].data.field('DIRECTION')[i].lower().strip()
+            self.direction = np.array([str(d).lower().strip()
+                                       for d in self.columns['DIRECTION']])
         else:
-            direct = 'forward'
-
-        if filt1 == filter1.strip() and filt2 == filter2.strip():
-            if direct == direction.strip():
-                if int(detchip) == int(chip) or int(detchip) == -999:
-                    row = i
-                    break
-
-    joinstr = ','
-    if 'CLEAR' in filter1:
-        f1str = ''
-        joinstr = ''
-    else:
-        f1str = filter1.strip()
-    if 'CLEAR' in filter2:
-        f2str = ''
-        joinstr = ''
-    else:
-        f2str = filter2.strip()
-    filtstr = (joinstr.join([f1str, f2str])).strip()
-    if row < 0:
-        err_str = '\nProblem finding row in IDCTAB! Could not find row matching:\n'
-        err_str += '        CHIP: ' + str(detchip) + '\n'
-        err_str += '     FILTERS: ' + filtstr + '\n'
-        ftab.close()
-        del ftab
-        raise LookupError(err_str)
-    else:
+            self.direction = np.array(['forward'] * self.nrows)
+
+    def _normalized(self, colname):
+        return np.array([_normalize_filter(f) for f in self.columns[colname]])
+
+    def find_row(self, chip=1, filter1='CLEAR', filter2='CLEAR', direction='forward'):
+        """
+        Return the index of the first row matching the selection or -1.
+
+        ``filter1`` and ``filter2`` are expected to be normalized
+        as in `readIDCtab`.
+        """
+        mask = (self.direction == direction.strip())
+        mask &= (self.detchip == int(chip)) | (self.detchip == -999)
+        if self.filter1 is not None:
+            mask &= (self.filter1 == filter1.strip())
+        if self.filter2 is not None:
+            mask &= (self.filter2 == filter2.strip())
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return -1
+        return int(rows[0])
+
+    def get_model(self, chip=1, date=None, direction='forward',
+                  filter1=None, filter2=None, offtab=None):
+        """
+        Return ``(fx, fy, refpix, order)`` for the selected row.
+
+        The parameters have the same meaning as in `readIDCtab`.
+        """
+        # Implement default values for filters here to avoid the default
+        # being overwritten by values of None passed by user.
+        if filter1 is None or filter1.find('CLEAR') == 0 or filter1.strip() == '':
+            filter1 = 'CLEAR'
+        if filter2 is None or filter2.find('CLEAR') == 0 or filter2.strip() == '':
+            filter2 = 'CLEAR'
+
+        detector = self.detector
+        # First, read in TDD coeffs if present
+        if self.instrument == 'ACS' and detector == 'WFC':
+            skew_coeffs = read_tdd_coeffs(self.phdr, chip=chip)
+        else:
+            skew_coeffs = None
+
+        # Set default filters for SBC
+        if detector == 'SBC':
+            if filter1 == 'CLEAR':
+                filter1 = 'F115LP'
+                filter2 = 'N/A'
+            if filter2 == 'CLEAR':
+                filter2 = 'N/A'
+
+        # Read FITS header to determine order of fit, i.e. k
+        norder = self.norder
+        if norder < 3:
+            order = 3
+        else:
+            order = norder
+
+        fx = np.zeros(shape=(order + 1, order + 1), dtype=np.float64)
+        fy = np.zeros(shape=(order + 1, order + 1), dtype=np.float64)
+
+        # Determine row from which to get the coefficients.
+        row = self.find_row(chip=chip, filter1=filter1, filter2=filter2,
+                            direction=direction)
+
+        joinstr = ','
+        if 'CLEAR' in filter1:
+            f1str = ''
+            joinstr = ''
+        else:
+            f1str = filter1.strip()
+        if 'CLEAR' in filter2:
+            f2str = ''
+            joinstr = ''
+        else:
+            f2str = filter2.strip()
+        filtstr = (joinstr.join([f1str, f2str])).strip()
+        if row < 0:
+            err_str = '\nProblem finding row in IDCTAB! Could not find row matching:\n'
+            err_str += '        CHIP: ' + str(chip) + '\n'
+            err_str += '     FILTERS: ' + filtstr + '\n'
+            raise LookupError(err_str)
+        detchip = self.detchip[row]
         print('- IDCTAB: Distortion model from row', str(row + 1), 'for chip',
               detchip, ':', filtstr)
 
-    # Read in V2REF and V3REF: this can either come from current table,
-    # or from an OFFTAB if time-dependent (i.e., for WFPC2)
-    theta = None
-    if 'V2REF' in colnames:
-        v2ref = ftab[1].data.field('V2REF')[row]
-        v3ref = ftab[1].data.field('V3REF')[row]
-    else:
-        # Read V2REF/V3REF from offset table (OFFTAB)
-        if offtab:
-            v2ref, v3ref, theta = readOfftab(offtab, date, chip=detchip)
+        columns = self.columns
+        colnames = self.colnames
+        # Read in V2REF and V3REF: this can either come from current table,
+        # or from an OFFTAB if time-dependent (i.e., for WFPC2)
+        theta = None
+        if 'V2REF' in colnames:
+            v2ref = columns['V2REF'][row]
+            v3ref = columns['V3REF'][row]
         else:
-            v2ref = 0.0
-            v3ref = 0.0
+            # Read V2REF/V3REF from offset table (OFFTAB)
+            if offtab:
+                v2ref, v3ref, theta = readOfftab(offtab, date, chip=detchip)
+            else:
+                v2ref = 0.0
+                v3ref = 0.0
 
-    if theta is None:
-        if 'THETA' in colnames:
-            theta = ftab[1].data.field('THETA')[row]
+        if theta is None:
+            if 'THETA' in colnames:
+                theta = columns['THETA'][row]
+            else:
+                theta = 0.0
+
+        refpix = {}
+        refpix['XREF'] = columns['XREF'][row]
+        refpix['YREF'] = columns['YREF'][row]
+        refpix['XSIZE'] = columns['XSIZE'][row]
+        refpix['YSIZE'] = columns['YSIZE'][row]
+        refpix['PSCALE'] = round(columns['SCALE'][row], 8)
+        refpix['V2REF'] = v2ref
+        refpix['V3REF'] = v3ref
+        refpix['THETA'] = theta
+        refpix['XDELTA'] = 0.0
+        refpix['YDELTA'] = 0.0
+        refpix['DEFAULT_SCALE'] = True
+        refpix['centered'] = False
+        refpix['skew_coeffs'] = skew_coeffs
+        # Now that we know which row to look at, read coefficients into the
+        #   numeric arrays we have set up...
+        # Setup which column name convention the IDCTAB follows
+        # either: A,B or CX,CY
+        if 'CX10' in colnames:
+            cxstr = 'CX'
+            cystr = 'CY'
         else:
-            theta = 0.0
-
-    refpix = {}
-    refpix['XREF'] = ftab[1].data.field('XREF')[row]
-    refpix['YREF'] = ftab[1].data.field('YREF')[row]
-    refpix['XSIZE'] = ftab[1].data.field('XSIZE')[row]
-    refpix['YSIZE'] = ftab[1].data.field('YSIZE')[row]
-    refpix['PSCALE'] = round(ftab[1].data.field('SCALE')[row], 8)
-    refpix['V2REF'] = v2ref
-    refpix['V3REF'] = v3ref
-    refpix['THETA'] = theta
-    refpix['XDELTA'] = 0.0
-    refpix['YDELTA'] = 0.0
-    refpix['DEFAULT_SCALE'] = True
-    refpix['centered'] = False
-    refpix['skew_coeffs'] = skew_coeffs
-    # Now that we know which row to look at, read coefficients into the
-    #   numeric arrays we have set up...
-    # Setup which column name convention the IDCTAB follows
-    # either: A,B or CX,CY
-    if 'CX10' in ftab[1].data.names:
-        cxstr = 'CX'
-        cystr = 'CY'
-    else:
-        cxstr = 'A'
-        cystr = 'B'
+            cxstr = 'A'
+            cystr = 'B'
 
-    for i in range(norder + 1):
-        if i > 0:
-            for j in range(i + 1):
-                xcname = cxstr + str(i) + str(j)
-                ycname = cystr + str(i) + str(j)
-                fx[i, j] = ftab[1].data.field(xcname)[row]
-                fy[i, j] = ftab[1].data.field(ycname)[row]
+        for i in range(norder + 1):
+            if i > 0:
+                for j in range(i + 1):
+                    xcname = cxstr + str(i) + str(j)
+                    ycname = cystr + str(i) + str(j)
+                    fx[i, j] = columns[xcname][row]
+                    fy[i, j] = columns[ycname][row]
 
-    ftab.close()
-    del ftab
+        # If CX11 is 1.0 and not equal to the PSCALE, then the
+        # coeffs need to be scaled
 
-    # If CX11 is 1.0 and not equal to the PSCALE, then the
-    # coeffs need to be scaled
+        if fx[1, 1] == 1.0 and abs(fx[1, 1]) != refpix['PSCALE']:
+            fx *= refpix['PSCALE']
+            fy *= refpix['PSCALE']
 
-    if fx[1, 1] == 1.0 and abs(fx[1, 1]) != refpix['PSCALE']:
-        fx *= refpix['PSCALE']
-        fy *= refpix['PSCALE']
-
-    # Return arrays and polynomial order read in from table.
-    # NOTE: XREF and YREF are stored in Fx,Fy arrays respectively.
-    return fx, fy, refpix, order
+        # Return arrays and polynomial order read in from table.
+        # NOTE: XREF and YREF are stored in Fx,Fy arrays respectively.
+        return fx, fy, refpix, order
 
 
 def read_tdd_coeffs(phdr, chip=1):
@@ -342,6 +527,7 @@ def readOfftab(offtab, date, chip=None):
         ftab = fileutil.openImage(offtab)
     except:
         raise IOError("Offset table '%s' not valid as specified!" % offtab)
+    instrumentation.ref_file_opened(ftab.filename(), 'OFFTAB')
 
     # Determine row from which to get the coefficients.
     # How many rows do we have in the table...
@@ -640,6 +826,26 @@ def readCubicTable(idcfile):
     return fx, fy, refpix, order
 
 
+def horner2d(u, v, coeffs):
+    """
+    Evaluate the polynomial ``sum(coeffs[p, q] * u**p * v**q)`` with
+    Horner's scheme using in-place operations.
+    """
+    result = np.zeros_like(u)
+    row = np.empty_like(u)
+    for p in range(coeffs.shape[0] - 1, -1, -1):
+        nonzero = np.nonzero(coeffs[p])[0]
+        result *= u
+        if nonzero.size == 0:
+            continue
+        row.fill(coeffs[p, nonzero[-1]])
+        for q in range(nonzero[-1] - 1, -1, -1):
+            row *= v
+            row += coeffs[p, q]
+        result += row
+    return result
+
+
 def factorial(n):
     """ Compute a factorial for integer n. """
     m = 1
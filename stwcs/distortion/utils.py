@@ -36,18 +36,18 @@ def output_wcs(list_of_wcsobj, ref_wcs=None, owcs=None, undistort=True):
     crval = np.array([crval1, crval2], dtype=np.float64)  # this value is now zero-based
     if owcs is None:
         if ref_wcs is None:
-            ref_wcs = list_of_wcsobj[0].deepcopy()
+            ref_wcs = copy_wcs(list_of_wcsobj[0])
         if undistort:
             # outwcs = undistortWCS(ref_wcs)
             outwcs = make_orthogonal_cd(ref_wcs)
         else:
-            outwcs = ref_wcs.deepcopy()
+            outwcs = copy_wcs(ref_wcs)
         outwcs.wcs.crval = crval
         outwcs.wcs.set()
         outwcs.pscale = sqrt(outwcs.wcs.cd[0, 0] ** 2 + outwcs.wcs.cd[1, 0] ** 2) * 3600.
         outwcs.orientat = arctan2(outwcs.wcs.cd[0, 1], outwcs.wcs.cd[1, 1]) * 180. / np.pi
     else:
-        outwcs = owcs.deepcopy()
+        outwcs = copy_wcs(owcs)
         outwcs.pscale = sqrt(outwcs.wcs.cd[0, 0] ** 2 + outwcs.wcs.cd[1, 0] ** 2) * 3600.
         outwcs.orientat = arctan2(outwcs.wcs.cd[0, 1], outwcs.wcs.cd[1, 1]) * 180. / np.pi
 
@@ -72,6 +72,19 @@ def output_wcs(list_of_wcsobj, ref_wcs=None, owcs=None, undistort=True):
     return outwcs
 
 
+def copy_wcs(wcsobj):
+    """
+    Copy a WCS whose linear part will be modified.
+
+    `~stwcs.wcsutil.HSTWCS` objects share the distortion model with the
+    copy, see `~stwcs.wcsutil.HSTWCS.linear_copy`; other WCS objects
+    are deep copied.
+    """
+    if hasattr(wcsobj, 'linear_copy'):
+        return wcsobj.linear_copy()
+    return wcsobj.deepcopy()
+
+
 def computeFootprintCenter(edges):
     """ Geographic midpoint in spherical coords for points defined by footprints.
         Algorithm derived from: http://www.geomidpoint.com/calculation.html
@@ -0,0 +1,211 @@
+"""
+Timing and counters for the updatewcs pipeline.
+
+Instrumented code emits events (dictionaries) to the registered callbacks.
+When no callback is registered emitting an event does nothing.
+Events have the keys 'event' (the event type), 'pid' and 'time' and
+event specific keys:
+
+- 'stage' : a timed step, e.g. a correction applied to an extension;
+  'stage', 'file', 'extname', 'extver', 'wall' and 'cpu' (seconds).
+- 'ref_open' : a reference file was opened;
+  'kind' (IDCTAB, OFFTAB, NPOLFILE, D2IMFILE, DGEOFILE), 'file', 'bytes'.
+- 'write' : a science file was saved (see `stwcs.wcsutil.fitsupdate`);
+  'file', 'status' ('patched' or 'rewritten'), 'bytes_written', 'bytes_read'.
+- 'file' : ``updatewcs`` finished a file; 'file', 'corrections', 'write',
+  'error' and 'wall'.
+
+Examples
+--------
+>>> from stwcs import instrumentation, updatewcs
+>>> with instrumentation.Recorder() as rec:
+...     updatewcs.updatewcs('j94f05bgq_flt.fits')
+>>> rec.summary()['stages']['TDDCorr']
+{'count': 2, 'wall': 0.0009, 'cpu': 0.0009}
+>>> rec.write_jsonl('updatewcs_events.jsonl')
+
+A callback can be any callable accepting an event:
+
+>>> instrumentation.add_callback(print)
+>>> instrumentation.remove_callback(print)
+
+Events emitted by the worker processes of ``updatewcs(..., workers=n)``
+are sent back to the main process and passed to the callbacks there.
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+
+__all__ = ['add_callback', 'remove_callback', 'enabled', 'emit', 'replay',
+           'stage', 'ref_file_opened', 'Recorder']
+
+_callbacks = []
+_lock = threading.Lock()
+
+
+def add_callback(func):
+    """ Register a callable which is called with each event. """
+    with _lock:
+        _callbacks.append(func)
+
+
+def remove_callback(func):
+    """ Unregister a callback added with `add_callback`. """
+    with _lock:
+        if func in _callbacks:
+            _callbacks.remove(func)
+
+
+def enabled():
+    """ Return True if at least one callback is registered. """
+    return bool(_callbacks)
+
+
+def emit(event, **data):
+    """
+    Send an event to the registered callbacks.
+
+    Parameters
+    ----------
+    event : str
+        event type
+    data : dict
+        event specific values; they must be serializable to JSON.
+    """
+    if not _callbacks:
+        return
+    record = {'event': event, 'pid': os.getpid(), 'time': time.time()}
+    record.update(data)
+    _dispatch(record)
+
+
+def replay(records):
+    """ Send events recorded elsewhere (e.g. in another process) to the callbacks. """
+    for record in records:
+        _dispatch(record)
+
+
+def _dispatch(record):
+    with _lock:
+        callbacks = list(_callbacks)
+    for func in callbacks:
+        func(record)
+
+
+@contextlib.contextmanager
+def stage(name, filename=None, extname=None, extver=None):
+    """
+    Context manager which emits a 'stage' event with the wall and CPU time
+    spent in its block.
+    """
+    if not _callbacks:
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        emit('stage', stage=name, file=filename, extname=extname, extver=extver,
+             wall=time.perf_counter() - wall, cpu=time.process_time() - cpu)
+
+
+def ref_file_opened(filename, kind):
+    """ Emit a 'ref_open' event; the size of the file is recorded as 'bytes'. """
+    if not _callbacks:
+        return
+    try:
+        nbytes = os.path.getsize(filename)
+    except (OSError, TypeError):
+        nbytes = None
+    emit('ref_open', kind=kind, file=filename, bytes=nbytes)
+
+
+class Recorder(object):
+    """
+    Callback which keeps events in memory.
+
+    Used as a context manager it is registered on entry and
+    unregistered on exit.
+
+    Attributes
+    ----------
+    events : list
+        recorded events in the order they were received
+    """
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.events.append(record)
+
+    def __enter__(self):
+        add_callback(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_callback(self)
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+
+    def summary(self):
+        """
+        Aggregate the recorded events.
+
+        Returns
+        -------
+        summary : dict
+            'stages' : {stage: {'count', 'wall', 'cpu'}},
+            'ref_opens' : {kind: count},
+            'bytes_read', 'bytes_written' : totals of reference files
+            opened and science files saved,
+            'writes' : {'patched': count, 'rewritten': count}
+        """
+        stages = {}
+        ref_opens = {}
+        writes = {'patched': 0, 'rewritten': 0}
+        bytes_read = 0
+        bytes_written = 0
+        for record in self.events:
+            event = record['event']
+            if event == 'stage':
+                totals = stages.setdefault(record['stage'],
+                                           {'count': 0, 'wall': 0., 'cpu': 0.})
+                totals['count'] += 1
+                totals['wall'] += record['wall']
+                totals['cpu'] += record['cpu']
+            elif event == 'ref_open':
+                ref_opens[record['kind']] = ref_opens.get(record['kind'], 0) + 1
+                bytes_read += record['bytes'] or 0
+            elif event == 'write':
+                writes[record['status']] = writes.get(record['status'], 0) + 1
+                bytes_read += record['bytes_read']
+                bytes_written += record['bytes_written']
+        return {'stages': stages, 'ref_opens': ref_opens, 'writes': writes,
+                'bytes_read': bytes_read, 'bytes_written': bytes_written}
+
+    def write_jsonl(self, output, mode='a'):
+        """
+        Write the events as JSON lines, one event per line.
+
+        Parameters
+        ----------
+        output : str or file-like object
+            file name or a text file opened for writing
+        mode : str
+            mode used to open ``output`` if it is a file name; the default
+            appends to an existing file so that runs can be accumulated.
+        """
+        if isinstance(output, str):
+            with open(output, mode) as fout:
+                self.write_jsonl(fout)
+            return
+        for record in self.events:
+            output.write(json.dumps(record, sort_keys=True))
+            output.write('\n')
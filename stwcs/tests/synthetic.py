@@ -0,0 +1,387 @@
+"""
+Synthetic HST science files for tests which do not depend on large
+observations being available in the data directory.
+
+The files use the reference files in the ``data`` directory
+(``postsm4_idc.fits``, ``qbu16424j_npl.fits``, ``new_wfc_d2i.fits``).
+"""
+import os
+import numpy as np
+from astropy.io import fits
+
+from . import data
+data_path = os.path.split(os.path.abspath(data.__file__))[0]
+
+
+def get_filepath(filename, directory=data_path):
+    return os.path.join(directory, filename)
+
+
+def make_acs_wfc(fname, shape=(80, 80), rootname='j00000001', crval=(5.65, -72.07)):
+    """
+    Write a minimal ACS/WFC FLT-like file with two SCI extensions.
+
+    Parameters
+    ----------
+    fname : str
+        Name of the output file.
+    shape : tuple
+        Shape of the SCI arrays. It must be larger than the NPOLFILE
+        lookup tables (65x33) for the NPOL correction to be applied.
+    rootname : str
+        Value of the ROOTNAME keyword.
+    crval : tuple
+        CRVAL of the first chip.
+    """
+    phdr = fits.Header()
+    phdr['ROOTNAME'] = rootname
+    phdr['INSTRUME'] = 'ACS'
+    phdr['DETECTOR'] = 'WFC'
+    phdr['FILTER1'] = 'F606W'
+    phdr['FILTER2'] = 'CLEAR2L'
+    phdr['DATE-OBS'] = '2012-05-01'
+    phdr['TIME-OBS'] = '10:00:00'
+    phdr['EXPSTART'] = 56048.4
+    phdr['EXPTIME'] = 100.0
+    phdr['PA_V3'] = 120.0
+    phdr['RA_TARG'] = crval[0]
+    phdr['DEC_TARG'] = crval[1]
+    phdr['IDCTAB'] = get_filepath('postsm4_idc.fits')
+    phdr['NPOLFILE'] = get_filepath('qbu16424j_npl.fits')
+    phdr['D2IMFILE'] = get_filepath('new_wfc_d2i.fits')
+    phdr['NEXTEND'] = 2
+    phdr.add_history('Synthetic ACS/WFC exposure')
+
+    hdus = [fits.PrimaryHDU(header=phdr)]
+    for extver, chip in [(1, 2), (2, 1)]:
+        hdr = fits.Header()
+        hdr['EXTNAME'] = 'SCI'
+        hdr['EXTVER'] = extver
+        hdr['CCDCHIP'] = chip
+        hdr['CTYPE1'] = 'RA---TAN'
+        hdr['CTYPE2'] = 'DEC--TAN'
+        hdr['CRPIX1'] = 2048.0
+        hdr['CRPIX2'] = 1024.0
+        hdr['CRVAL1'] = crval[0]
+        hdr['CRVAL2'] = crval[1] + 0.02 * (extver - 1)
+        hdr['CD1_1'] = 1.29e-05
+        hdr['CD1_2'] = 5.4e-06
+        hdr['CD2_1'] = 5.4e-06
+        hdr['CD2_2'] = -1.29e-05
+        hdr['LTV1'] = 0.0
+        hdr['LTV2'] = 0.0
+        hdr['LTM1_1'] = 1.0
+        hdr['LTM2_2'] = 1.0
+        hdr['VAFACTOR'] = 1.0
+        hdr['ORIENTAT'] = 22.0
+        hdr['BINAXIS1'] = 1
+        hdr['BINAXIS2'] = 1
+        hdr['NGOODPIX'] = shape[0] * shape[1]
+        hdus.append(fits.ImageHDU(data=np.zeros(shape, dtype=np.float32),
+                                  header=hdr))
+    fits.HDUList(hdus).writeto(fname, overwrite=True)
+    return fname
+
+
+# Geometry of the detectors supported by `make_observation`.
+# 'chips' lists the chip of each SCI extension (EXTVER 1, 2, ...) and
+# 'chipkw' the extension keyword which holds it.
+DETECTORS = {
+    'ACS/WFC': {'instrument': 'ACS', 'detector': 'WFC', 'chips': [2, 1],
+                'shape': (2048, 4096), 'scale': 0.05, 'chipkw': 'CCDCHIP',
+                'filters': {'FILTER1': 'F606W', 'FILTER2': 'CLEAR2L'},
+                'date': '2012-05-01'},
+    'WFC3/UVIS': {'instrument': 'WFC3', 'detector': 'UVIS', 'chips': [2, 1],
+                  'shape': (2051, 4096), 'scale': 0.04, 'chipkw': 'CCDCHIP',
+                  'filters': {'FILTER': 'F606W'}, 'date': '2012-05-01'},
+    'WFC3/IR': {'instrument': 'WFC3', 'detector': 'IR', 'chips': [1],
+                'shape': (1014, 1014), 'scale': 0.13, 'chipkw': 'CCDCHIP',
+                'filters': {'FILTER': 'F160W'}, 'date': '2012-05-01'},
+    'WFPC2': {'instrument': 'WFPC2', 'detector': None, 'chips': [1, 2, 3, 4],
+              'shape': (800, 800), 'scale': 0.1, 'chipkw': 'DETECTOR',
+              'filters': {'FILTNAM1': 'F555W', 'FILTNAM2': ''},
+              'date': '2005-05-01'},
+}
+
+
+def _instrument_keywords(hdr, spec):
+    hdr['INSTRUME'] = spec['instrument']
+    if spec['detector'] is not None:
+        hdr['DETECTOR'] = spec['detector']
+
+
+def _chip_keywords(hdr, spec, chip):
+    """ Chip keywords of reference file extensions. """
+    # The lookup tables are selected by CCDCHIP and the chip keyword
+    # of the instrument.
+    hdr['CCDCHIP'] = chip
+    hdr[spec['chipkw']] = chip
+
+
+def _v2v3ref(spec, index):
+    """ V2REF, V3REF of the n-th chip; chips are placed next to each other. """
+    ny, nx = spec['shape']
+    return 250.0 + 0.1 * index, 200.0 + index * ny * spec['scale']
+
+
+def make_idctab(fname, detector, norder=4, offtab=False, seed=1):
+    """
+    Write an IDCTAB with a 'forward' distortion model for each chip.
+
+    Parameters
+    ----------
+    fname : str
+        Name of the output file.
+    detector : str
+        A key of `DETECTORS`.
+    norder : int
+        Order of the polynomial model.
+    offtab : bool
+        If True, the table has no V2REF and V3REF columns; they are read
+        from an OFFTAB (as for WFPC2).
+    seed : int
+        Seed of the random generator used for the higher order coefficients.
+    """
+    spec = DETECTORS[detector]
+    ny, nx = spec['shape']
+    scale = spec['scale']
+    rng = np.random.RandomState(seed)
+    nchips = len(spec['chips'])
+    chips = sorted(spec['chips'])
+    cols = [fits.Column(name='DETCHIP', format='I', array=chips),
+            fits.Column(name='DIRECTION', format='8A', array=['FORWARD'] * nchips)]
+    if 'FILTER' in spec['filters']:
+        cols.append(fits.Column(name='FILTER', format='8A',
+                                array=[spec['filters']['FILTER']] * nchips))
+    else:
+        filters = list(spec['filters'].values())
+        cols.append(fits.Column(name='FILTER1', format='8A',
+                                array=[filters[0] or 'CLEAR1'] * nchips))
+        cols.append(fits.Column(name='FILTER2', format='8A',
+                                array=[filters[1] or 'CLEAR2'] * nchips))
+    cols.extend([fits.Column(name='XSIZE', format='J', array=[nx] * nchips),
+                 fits.Column(name='YSIZE', format='J', array=[ny] * nchips),
+                 fits.Column(name='XREF', format='E', array=[nx / 2.] * nchips),
+                 fits.Column(name='YREF', format='E', array=[ny / 2.] * nchips)])
+    if not offtab:
+        v2v3 = [_v2v3ref(spec, i) for i in range(nchips)]
+        cols.append(fits.Column(name='V2REF', format='E', array=[v[0] for v in v2v3]))
+        cols.append(fits.Column(name='V3REF', format='E', array=[v[1] for v in v2v3]))
+    cols.append(fits.Column(name='SCALE', format='E', array=[scale] * nchips))
+    # linear terms close to a rotated pixel scale, small higher order terms
+    half = max(nx, ny) / 2.
+    for cname in ['CX', 'CY']:
+        for i in range(1, norder + 1):
+            for j in range(i + 1):
+                if i == 1:
+                    if (cname, j) in [('CX', 1), ('CY', 0)]:
+                        values = scale * (0.985 + 0.01 * rng.uniform(size=nchips))
+                    else:
+                        values = scale * 0.04 * rng.uniform(size=nchips)
+                else:
+                    values = scale * 0.01 * rng.uniform(-1, 1, size=nchips) * half ** (1 - i)
+                cols.append(fits.Column(name='{0}{1}{2}'.format(cname, i, j),
+                                        format='E', array=values))
+    phdr = fits.Header()
+    _instrument_keywords(phdr, spec)
+    phdr['NORDER'] = norder
+    phdr['FILETYPE'] = 'DISTORTION COEFFICIENTS'
+    if detector == 'ACS/WFC':
+        phdr['TDD_A0'] = 0.095
+        phdr['TDD_A1'] = 0.036
+        phdr['TDD_B0'] = -0.029
+        phdr['TDD_B1'] = -0.012
+        phdr['TDD_D0'] = 0.
+        phdr['TDD_DATE'] = 2006.798432109
+        phdr['TDDORDER'] = 1
+    fits.HDUList([fits.PrimaryHDU(header=phdr),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(fname, overwrite=True)
+    return fname
+
+
+def make_offtab(fname, detector, dates=('1994-01-01', '2009-01-01')):
+    """
+    Write an OFFTAB with time dependent V2REF, V3REF and THETA for each chip.
+    """
+    spec = DETECTORS[detector]
+    chips = []
+    obsdates = []
+    v2ref = []
+    v3ref = []
+    theta = []
+    for i, chip in enumerate(sorted(spec['chips'])):
+        v2, v3 = _v2v3ref(spec, i)
+        for k, date in enumerate(dates):
+            chips.append(chip)
+            obsdates.append(date)
+            v2ref.append(v2 + 0.01 * k)
+            v3ref.append(v3 - 0.01 * k)
+            theta.append(0.001 * k)
+    cols = [fits.Column(name='DETCHIP', format='I', array=chips),
+            fits.Column(name='OBSDATE', format='10A', array=obsdates),
+            fits.Column(name='V2REF', format='E', array=v2ref),
+            fits.Column(name='V3REF', format='E', array=v3ref),
+            fits.Column(name='THETA', format='E', array=theta)]
+    phdr = fits.Header()
+    _instrument_keywords(phdr, spec)
+    phdr['FILETYPE'] = 'OFFSET TABLE'
+    fits.HDUList([fits.PrimaryHDU(header=phdr),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(fname, overwrite=True)
+    return fname
+
+
+def make_npolfile(fname, detector, cdelt=64):
+    """
+    Write an NPOLFILE with DX and DY lookup tables (one node every
+    ``cdelt`` pixels) for each chip.
+    """
+    spec = DETECTORS[detector]
+    ny, nx = spec['shape']
+    shape = (ny // cdelt + 1, nx // cdelt + 1)
+    y, x = np.indices(shape, dtype=np.float32)
+    phdr = fits.Header()
+    _instrument_keywords(phdr, spec)
+    phdr['FILETYPE'] = 'DXY GRID'
+    hdus = [fits.PrimaryHDU(header=phdr)]
+    for extver, chip in enumerate(sorted(spec['chips']), start=1):
+        for extname, data in [('DX', 0.05 * np.sin(x / 5. + chip) * np.cos(y / 7.)),
+                              ('DY', 0.05 * np.cos(x / 6.) * np.sin(y / 4. + chip))]:
+            hdr = fits.Header()
+            hdr['EXTNAME'] = extname
+            hdr['EXTVER'] = extver
+            _chip_keywords(hdr, spec, chip)
+            hdr['ONAXIS1'] = nx
+            hdr['ONAXIS2'] = ny
+            hdr['CDELT1'] = cdelt
+            hdr['CDELT2'] = cdelt
+            hdr['LTV1'] = 0
+            hdr['LTV2'] = 0
+            hdus.append(fits.ImageHDU(data=data.astype(np.float32), header=hdr))
+    fits.HDUList(hdus).writeto(fname, overwrite=True)
+    return fname
+
+
+def make_d2imfile(fname, detector):
+    """
+    Write a D2IMFILE with a column width correction (DX) for each chip.
+    """
+    spec = DETECTORS[detector]
+    nx = spec['shape'][1]
+    phdr = fits.Header()
+    _instrument_keywords(phdr, spec)
+    phdr['FILETYPE'] = 'D2I FILE'
+    hdus = [fits.PrimaryHDU(header=phdr)]
+    for extver, chip in enumerate(sorted(spec['chips']), start=1):
+        hdr = fits.Header()
+        hdr['EXTNAME'] = 'DX'
+        hdr['EXTVER'] = extver
+        _chip_keywords(hdr, spec, chip)
+        hdr['CDELT1'] = 1.
+        hdr['CRPIX1'] = 0.
+        hdr['CRVAL1'] = 0.
+        data = 0.01 * np.sin(np.arange(nx, dtype=np.float32) / 3. + chip)
+        hdus.append(fits.ImageHDU(data=data.reshape(1, nx).astype(np.float32),
+                                  header=hdr))
+    fits.HDUList(hdus).writeto(fname, overwrite=True)
+    return fname
+
+
+def make_reference_files(directory, detector):
+    """
+    Write the reference files used by `make_observation` for a detector.
+
+    Returns
+    -------
+    refs : dict
+        File names keyed by primary header keyword ('IDCTAB', 'NPOLFILE',
+        'D2IMFILE' and, for WFPC2, 'OFFTAB'). WFC3/IR has no NPOLFILE
+        and D2IMFILE.
+    """
+    prefix = os.path.join(directory, detector.replace('/', '_').lower())
+    refs = {}
+    if detector == 'WFPC2':
+        refs['IDCTAB'] = make_idctab(prefix + '_idc.fits', detector, offtab=True)
+        refs['OFFTAB'] = make_offtab(prefix + '_off.fits', detector)
+    else:
+        refs['IDCTAB'] = make_idctab(prefix + '_idc.fits', detector)
+    if detector != 'WFC3/IR':
+        if detector != 'WFPC2':
+            refs['NPOLFILE'] = make_npolfile(prefix + '_npl.fits', detector)
+        refs['D2IMFILE'] = make_d2imfile(prefix + '_d2i.fits', detector)
+    return refs
+
+
+def make_observation(fname, detector, refs, shape=None, rootname='x00000001',
+                     crval=(5.65, -72.07)):
+    """
+    Write a FLT-like file for one of `DETECTORS` with one SCI extension per chip.
+
+    Parameters
+    ----------
+    fname : str
+        Name of the output file.
+    detector : str
+        A key of `DETECTORS`.
+    refs : dict
+        Reference files returned by `make_reference_files`.
+    shape : tuple or None
+        Shape of the SCI arrays; by default the full detector size.
+    rootname : str
+        Value of the ROOTNAME keyword.
+    crval : tuple
+        CRVAL of the first chip.
+    """
+    spec = DETECTORS[detector]
+    if shape is None:
+        shape = spec['shape']
+    scale = spec['scale'] / 3600.
+    phdr = fits.Header()
+    phdr['ROOTNAME'] = rootname
+    _instrument_keywords(phdr, spec)
+    for kw, value in spec['filters'].items():
+        phdr[kw] = value
+    if detector == 'WFPC2':
+        phdr['MODE'] = 'FULL'
+    phdr['DATE-OBS'] = spec['date']
+    phdr['TIME-OBS'] = '10:00:00'
+    phdr['EXPSTART'] = 56048.4
+    phdr['EXPTIME'] = 100.0
+    phdr['PA_V3'] = 120.0
+    phdr['RA_TARG'] = crval[0]
+    phdr['DEC_TARG'] = crval[1]
+    for kw in ['IDCTAB', 'OFFTAB', 'NPOLFILE', 'D2IMFILE']:
+        if kw in refs:
+            phdr[kw] = refs[kw]
+        elif kw != 'OFFTAB':
+            phdr[kw] = 'N/A'
+    phdr['NEXTEND'] = len(spec['chips'])
+    phdr.add_history('Synthetic {0} exposure'.format(detector))
+
+    hdus = [fits.PrimaryHDU(header=phdr)]
+    for extver, chip in enumerate(spec['chips'], start=1):
+        hdr = fits.Header()
+        hdr['EXTNAME'] = 'SCI'
+        hdr['EXTVER'] = extver
+        hdr[spec['chipkw']] = chip
+        hdr['CTYPE1'] = 'RA---TAN'
+        hdr['CTYPE2'] = 'DEC--TAN'
+        hdr['CRPIX1'] = shape[1] / 2.
+        hdr['CRPIX2'] = shape[0] / 2.
+        hdr['CRVAL1'] = crval[0]
+        hdr['CRVAL2'] = crval[1] + shape[0] * scale * (extver - 1)
+        hdr['CD1_1'] = -scale * 0.4
+        hdr['CD1_2'] = scale * 0.9
+        hdr['CD2_1'] = scale * 0.9
+        hdr['CD2_2'] = scale * 0.4
+        hdr['LTV1'] = 0.0
+        hdr['LTV2'] = 0.0
+        hdr['LTM1_1'] = 1.0
+        hdr['LTM2_2'] = 1.0
+        hdr['VAFACTOR'] = 1.0
+        hdr['ORIENTAT'] = 22.0
+        hdr['BINAXIS1'] = 1
+        hdr['BINAXIS2'] = 1
+        hdus.append(fits.ImageHDU(data=np.zeros(shape, dtype=np.float32),
+                                  header=hdr))
+    fits.HDUList(hdus).writeto(fname, overwrite=True)
+    return fname
@@ -0,0 +1,122 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from ..distortion import mutil, models
+
+from . import data
+data_path = os.path.split(os.path.abspath(data.__file__))[0]
+
+
+def get_filepath(filename, directory=data_path):
+    return os.path.join(directory, filename)
+
+
+def test_idctab_cache():
+    idctab = get_filepath('postsm4_idc.fits')
+    mutil.idctab_cache.clear()
+    fx, fy, refpix, order = mutil.readIDCtab(idctab, chip=1, filter1='F606W',
+                                             filter2='CLEAR2L')
+    assert mutil.idctab_cache.info()['misses'] == 1
+    fx[1, 1] = 0.
+    refpix['XREF'] = 0.
+    fx2, fy2, refpix2, order2 = mutil.readIDCtab(idctab, chip=1, filter1='F606W',
+                                                 filter2='CLEAR2L')
+    info = mutil.idctab_cache.info()
+    assert info['hits'] == 1
+    assert info['size'] == 1
+    # cached models can not be modified through the returned copies
+    assert fx2[1, 1] != 0.
+    assert refpix2['XREF'] != 0.
+    fx3, fy3, refpix3, order3 = mutil.readIDCtab(idctab, chip=1, filter1='F606W',
+                                                 filter2='CLEAR2L', use_cache=False)
+    np.testing.assert_equal(fx2, fx3)
+    np.testing.assert_equal(fy2, fy3)
+    assert refpix2['V2REF'] == refpix3['V2REF']
+    assert order2 == order3
+
+    mutil.readIDCtab(idctab, chip=2, filter1='F606W', filter2='CLEAR2L')
+    assert mutil.idctab_cache.info()['size'] == 2
+    mutil.idctab_cache.clear()
+    assert mutil.idctab_cache.info() == {'hits': 0, 'misses': 0, 'size': 0,
+                                         'maxsize': mutil.idctab_cache.maxsize}
+
+
+def test_idctab_cache_mtime(tmpdir):
+    idctab = str(tmpdir.join('idc.fits'))
+    shutil.copyfile(get_filepath('postsm4_idc.fits'), idctab)
+    mutil.idctab_cache.clear()
+    mutil.readIDCtab(idctab, chip=1, filter1='F606W', filter2='CLEAR2L')
+    stat = os.stat(idctab)
+    os.utime(idctab, (stat.st_atime, stat.st_mtime + 10))
+    mutil.readIDCtab(idctab, chip=1, filter1='F606W', filter2='CLEAR2L')
+    assert mutil.idctab_cache.info()['misses'] == 2
+
+
+def test_idctab_cache_bound():
+    cache = mutil.IDCTabCache(maxsize=2)
+    model = (np.zeros((2, 2)), np.zeros((2, 2)), {}, 3)
+    for key in range(3):
+        cache.put(key, model)
+    assert len(cache) == 2
+    assert cache.get(0) is None
+    assert cache.get(2) is not None
+    with pytest.raises(ValueError):
+        cache._models[2][0][0, 0] = 1.
+
+
+def test_idctable():
+    idctab = get_filepath('postsm4_idc.fits')
+    table = mutil.IDCTable(idctab)
+    row = table.find_row(chip=2, filter1='F606W', filter2='CLEAR', direction='forward')
+    assert table.columns['DETCHIP'][row] == 2
+    assert table.columns['FILTER1'][row] == 'F606W'
+    assert table.columns['FILTER2'][row].startswith('CLEAR')
+    assert table.find_row(chip=3, filter1='F606W', filter2='CLEAR') == -1
+    with pytest.raises(LookupError):
+        table.get_model(chip=3, filter1='F606W')
+
+    fx, fy, refpix, order = mutil.readIDCtab(idctab, chip=2, filter1='F606W',
+                                             filter2='CLEAR2L', use_cache=False)
+    model = models.IDCModel(table, chip=2, filter1='F606W', filter2='CLEAR2L')
+    assert model.name == idctab
+    np.testing.assert_equal(model.cx, fx)
+    np.testing.assert_equal(model.cy, fy)
+    assert model.refpix['XREF'] == refpix['XREF']
+
+
+def test_geometry_model_apply():
+    idctab = get_filepath('postsm4_idc.fits')
+    chips = [models.IDCModel(idctab, chip=chip, filter1='F606W', filter2='CLEAR2L')
+             for chip in [1, 2]]
+    rng = np.random.RandomState(3)
+    pixpos = rng.uniform(1, 4096, size=(1000, 2))
+    index = rng.randint(2, size=1000)
+
+    for model in chips:
+        for order in [None, 2]:
+            xc, yc = model.apply(pixpos, scale=0.9, order=order)
+            # direct evaluation of the IDC polynomials
+            cx = model.cx / (model.pscale * 0.9)
+            cy = model.cy / (model.pscale * 0.9)
+            dx = pixpos[:, 0] - model.refpix['XREF']
+            dy = pixpos[:, 1] - model.refpix['YREF']
+            x = np.zeros(len(pixpos))
+            y = np.zeros(len(pixpos))
+            for i in range(1, (order or model.norder) + 1):
+                for j in range(i + 1):
+                    x += cx[i, j] * dx ** j * dy ** (i - j)
+                    y += cy[i, j] * dx ** j * dy ** (i - j)
+            np.testing.assert_allclose(xc, x, rtol=1e-12, atol=1e-9)
+            np.testing.assert_allclose(yc, y, rtol=1e-12, atol=1e-9)
+
+    xc, yc = models.apply_models(chips, pixpos, index)
+    for i, model in enumerate(chips):
+        x, y = model.apply(pixpos[index == i])
+        np.testing.assert_array_equal(xc[index == i], x)
+        np.testing.assert_array_equal(yc[index == i], y)
+
+    xc, yc = chips[0].apply([(100., 200.), (300., 400.)])
+    assert isinstance(xc, list) and len(xc) == 2
@@ -0,0 +1,188 @@
+import shutil
+import warnings
+
+import numpy as np
+from astropy.io import fits
+import pytest
+
+from .. import instrumentation
+from ..wcsutil import altwcs, fitsupdate
+
+
+def make_file(fname):
+    hdus = [fits.PrimaryHDU()]
+    for extver in [1, 2]:
+        hdu = fits.ImageHDU(data=np.arange(200 * 300, dtype=np.float32).reshape(200, 300) * extver,
+                            name='SCI', ver=extver)
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(fname, overwrite=True)
+
+
+def reference_update(fname, func):
+    """ Apply ``func`` and save with astropy. """
+    with fits.open(fname, mode='update') as f:
+        func(f)
+
+
+def stwcs_update(fname, func):
+    f = fits.open(fname, mode='update')
+    func(f)
+    return fitsupdate.write_update(f)
+
+
+def add_keywords(n):
+    def func(f):
+        for i in range(n):
+            f[1].header['KW{0}'.format(i)] = i
+    return func
+
+
+def append_hdu(f):
+    f.append(fits.ImageHDU(data=np.ones((3, 4), dtype=np.float32), name='WCSDVARR'))
+    f[0].header['NEXTEND'] = len(f) - 1
+
+
+def delete_hdu(f):
+    del f[1]
+
+
+@pytest.mark.parametrize('func,status', [(add_keywords(1), 'patched'),
+                                         (add_keywords(100), 'rewritten'),
+                                         (append_hdu, 'patched'),
+                                         (delete_hdu, 'rewritten')])
+def test_write_update(tmpdir, func, status):
+    ref = str(tmpdir.join('ref.fits'))
+    new = str(tmpdir.join('new.fits'))
+    make_file(ref)
+    shutil.copyfile(ref, new)
+    reference_update(ref, func)
+    assert stwcs_update(new, func) == status
+    with open(ref, 'rb') as fref, open(new, 'rb') as fnew:
+        assert fref.read() == fnew.read()
+
+
+def test_write_update_data_not_loaded(tmpdir):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    f = fits.open(fname, mode='update')
+    add_keywords(100)(f)
+    append_hdu(f)
+    assert fitsupdate.write_update(f, chunk_size=2880) == 'rewritten'
+    assert not any(hdu._data_loaded for hdu in f[:3])
+    with fits.open(fname) as f:
+        assert f[1].header['KW99'] == 99
+        np.testing.assert_equal(f[2].data[1], np.arange(300, 600) * 2)
+        assert f['WCSDVARR'].data.shape == (3, 4)
+
+
+def test_write_update_moved_data(tmpdir):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    with fits.open(fname, mode='append') as f:
+        f.append(fits.BinTableHDU.from_columns([fits.Column('A', 'D', array=np.arange(10.))],
+                                               name='WCSCORR'))
+    f = fits.open(fname, mode='update')
+    data = f['WCSCORR'].data
+    data['A'][0] = -1.
+    del data
+    del f[2]
+    assert fitsupdate.write_update(f) == 'patched'
+    np.testing.assert_equal(f['WCSCORR'].data['A'], [-1.] + list(range(1, 10)))
+    with fits.open(fname) as f:
+        assert len(f) == 3
+        np.testing.assert_equal(f['WCSCORR'].data['A'], [-1.] + list(range(1, 10)))
+
+
+@pytest.mark.parametrize('nkeys', [1, 20])
+def test_write_update_compressed_hdu(tmpdir, nkeys):
+    fname = str(tmpdir.join('comp.fits'))
+    data = np.arange(200 * 300, dtype=np.float32).reshape(200, 300)
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.CompImageHDU(data=data, name='SCI')]).writeto(fname)
+    f = fits.open(fname, mode='update')
+    add_keywords(nkeys)(f)
+    assert fitsupdate.write_update(f) == 'rewritten'
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with fits.open(fname) as f:
+            assert isinstance(f[1], fits.CompImageHDU)
+            assert f[1]._header['XTENSION'] == 'BINTABLE'
+            assert f[1].header['KW{0}'.format(nkeys - 1)] == nkeys - 1
+            np.testing.assert_equal(f[1].data, data)
+
+
+def test_write_update_padding(tmpdir):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    f = fits.open(fname, mode='update')
+    add_keywords(100)(f)
+    assert fitsupdate.write_update(f, padding=2) == 'rewritten'
+    with fits.open(fname) as f:
+        # 109 cards, 72 blank cards and END
+        assert len(f[1].header.tostring()) == 6 * 2880
+        np.testing.assert_equal(f[2].data[1], np.arange(300, 600) * 2)
+    # keywords added later use the reserved blank cards
+    f = fits.open(fname, mode='update')
+    for i in range(60):
+        f[1].header['NEW{0}'.format(i)] = i
+    assert fitsupdate.write_update(f, padding=2) == 'patched'
+    # a shorter header is filled with blank cards
+    f = fits.open(fname, mode='update')
+    for i in range(100):
+        del f[1].header['KW{0}'.format(i)]
+    assert fitsupdate.write_update(f, padding=2) == 'patched'
+    with fits.open(fname) as f:
+        assert 'KW0' not in f[1].header
+        assert f[1].header['NEW59'] == 59
+        assert len(f[1].header.tostring()) == 6 * 2880
+        np.testing.assert_equal(f[2].data[1], np.arange(300, 600) * 2)
+
+
+def test_close(tmpdir):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    f = fits.open(fname)
+    assert fitsupdate.close(f) is None
+    f = fits.open(fname, mode='update')
+    add_keywords(1)(f)
+    assert fitsupdate.close(f) is None
+    assert fits.getval(fname, 'KW0', ext=1) == 0
+    f = fits.open(fname, mode='update')
+    add_keywords(2)(f)
+    assert fitsupdate.close(f, padding=1) == 'patched'
+    assert fits.getval(fname, 'KW1', ext=1) == 1
+
+
+@pytest.mark.parametrize('padding', [None, 1])
+def test_altwcs_padding(tmpdir, padding):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    with fits.open(fname, mode='update') as f:
+        for hdu in f[1:]:
+            hdu.header.update(CTYPE1='RA---TAN', CTYPE2='DEC--TAN', CRPIX1=150., CRPIX2=100.,
+                              CRVAL1=5.6, CRVAL2=-72.1, CD1_1=-1e-5, CD2_2=1e-5,
+                              WCSNAME='TEST')
+    with instrumentation.Recorder() as rec:
+        altwcs.archiveWCS(fname, [('SCI', 1), ('SCI', 2)], wcskey='B', wcsname='ARCHIVED',
+                          padding=padding)
+    writes = [event['status'] for event in rec.events if event['event'] == 'write']
+    if padding is None:
+        # saved by astropy
+        assert writes == []
+    else:
+        assert writes == ['rewritten']
+        # the reserved cards hold the next alternate WCS
+        rec = instrumentation.Recorder()
+        with rec:
+            altwcs.archiveWCS(fname, [('SCI', 1), ('SCI', 2)], wcskey='C', padding=padding)
+        assert [event['status'] for event in rec.events] == ['patched']
+    assert fits.getval(fname, 'WCSNAMEB', ext=('SCI', 2)) == 'ARCHIVED'
+
+
+def test_discard_update(tmpdir):
+    fname = str(tmpdir.join('new.fits'))
+    make_file(fname)
+    f = fits.open(fname, mode='update')
+    add_keywords(100)(f)
+    fitsupdate.discard_update(f)
+    assert 'KW0' not in fits.getheader(fname, 1)
@@ -10,6 +10,7 @@ from numpy.testing import utils
 import pytest
 
 from . import data
+from . import synthetic
 data_path = os.path.split(os.path.abspath(data.__file__))[0]
 
 
@@ -299,3 +300,199 @@ class TestLegacyFiles:
                                         [('SCI', 1), ('SCI', 2)],
                                         [("SCI", 1), ("SCI", 2)],
                                         verbose=True)[0])
+
+
+def test_headerlet_index(tmpdir):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('acs_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(64, 128))
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    for i in range(1, 4):
+        headerlet.archive_as_headerlet(fname, 'HLET%d' % i, wcskey='PRIMARY')
+
+    with fits.open(fname) as fobj:
+        index = headerlet.headerlet_index(fobj)
+        assert headerlet.headerlet_index(fobj) is index
+        first = index.positions[0]
+        assert index.positions == [first, first + 1, first + 2]
+        assert index.count() == 3
+        assert headerlet.get_headerlet_kw_names(fobj) == ['HLET1', 'HLET2', 'HLET3']
+        assert headerlet.get_headerlet_kw_names(fobj, 'wcsname') == \
+            [fobj[first].header['WCSNAME']] * 3
+        assert headerlet.find_headerlet_HDUs(fobj, hdrname='HLET2') == [first + 1]
+        assert headerlet.find_headerlet_HDUs(fobj, hdrext=('HDRLET', 3)) == [first + 2]
+        assert headerlet.find_headerlet_HDUs(fobj, hdrext=first) == [first]
+        distname = fobj[first].header['DISTNAME']
+        assert headerlet.find_headerlet_HDUs(fobj, distname=distname) == index.positions
+        assert not headerlet.verify_hdrname_is_unique(fobj, 'HLET1')
+
+        del fobj[first]
+        assert headerlet.headerlet_index(fobj) is not index
+        assert headerlet.get_headerlet_kw_names(fobj) == ['HLET2', 'HLET3']
+        assert headerlet.find_headerlet_HDUs(fobj, hdrname='HLET3') == [first + 1]
+
+        fobj.append(headerlet.HeaderletHDU.fromheaderlet(
+            headerlet.create_headerlet(fobj, hdrname='HLET4')))
+        assert headerlet.get_headerlet_kw_names(fobj) == ['HLET2', 'HLET3', 'HLET4']
+        assert headerlet.find_headerlet_HDUs(fobj, hdrname='HLET4') == [len(fobj) - 1]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_headerlet_hdu_lazy(tmpdir, compress):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('acs_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(64, 128))
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    hlet = headerlet.create_headerlet(fname, hdrname='LAZY')
+    with fits.open(fname, mode='append') as fobj:
+        fobj.append(headerlet.HeaderletHDU.fromheaderlet(hlet, compress=compress))
+
+    with fits.open(fname) as fobj:
+        hdu = fobj[-1]
+        assert hdu.primary_header['HDRNAME'] == 'LAZY'
+        assert 'headerlet' not in hdu.__dict__ and 'hdulist' not in hdu.__dict__
+        assert hdu.primary_header == hlet[0].header
+        ncols, summary = hlet.summary()
+        assert headerlet.header_summary(hdu.primary_header, ncols) == summary
+
+        lazy = hdu.headerlet
+        assert isinstance(lazy, headerlet.Headerlet)
+        assert lazy[0].header['HDRNAME'] == 'LAZY'
+        assert len(lazy) == len(hlet)
+        for ext in ['WCSDVARR', 'D2IMARR']:
+            for ver in [1, 2]:
+                np.testing.assert_array_equal(lazy[(ext, ver)].data, hlet[(ext, ver)].data)
+        assert lazy[('SIPWCS', 1)].header == hlet[('SIPWCS', 1)].header
+        assert [h.name for h in hdu.hdulist] == [h.name for h in hlet]
+
+
+def test_shared_lookup_tables(tmpdir):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('acs_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(64, 128))
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    orig = headerlet.create_headerlet(fname, hdrname='ORIG')
+    ntables = sum(hdu.name in headerlet.LOOKUP_TABLE_EXTNAMES for hdu in orig)
+    assert ntables > 0
+
+    # headerlets attached before the tables were shared
+    headerlet.archive_as_headerlet(fname, 'HLET1', wcskey='PRIMARY')
+    headerlet.archive_as_headerlet(fname, 'HLET2', wcskey='PRIMARY')
+    size = os.path.getsize(fname)
+    assert headerlet.share_headerlet_tables(fname) == 2
+    assert headerlet.share_headerlet_tables(fname) == 0
+    assert os.path.getsize(fname) < size
+    headerlet.archive_as_headerlet(fname, 'HLET3', wcskey='PRIMARY', share_tables=True)
+
+    with fits.open(fname) as fobj:
+        tables = headerlet.shared_lookup_tables(fobj)
+        assert len(tables) == ntables
+        for name in ['HLET1', 'HLET2', 'HLET3']:
+            hdu = fobj[headerlet.find_headerlet_HDUs(fobj, hdrname=name)[0]]
+            assert sorted(hdu.header['TABREF*'].values()) == sorted(tables)
+            hlet = hdu.headerlet
+            assert all(h.data is None for h in hlet
+                       if h.name in headerlet.LOOKUP_TABLE_EXTNAMES)
+            hlet.resolve_lookup_tables(fobj)
+            for h in orig:
+                if h.name in headerlet.LOOKUP_TABLE_EXTNAMES:
+                    np.testing.assert_array_equal(hlet[(h.name, h.ver)].data, h.data)
+                    assert 'TABHASH' not in hlet[(h.name, h.ver)].header
+
+    output = str(tmpdir.join('hlet2_hlet.fits'))
+    extnum = headerlet.find_headerlet_HDUs(fname, hdrname='HLET2')[0]
+    headerlet.extract_headerlet(fname, output, extnum=extnum, hdrname='HLET2')
+    with fits.open(output) as hlet:
+        for h in orig:
+            if h.name in headerlet.LOOKUP_TABLE_EXTNAMES:
+                np.testing.assert_array_equal(hlet[(h.name, h.ver)].data, h.data)
+
+    with fits.open(fname, mode='update') as fobj:
+        hdu = fobj[headerlet.find_headerlet_HDUs(fobj, hdrname='HLET3')[0]]
+        hlet = hdu.headerlet
+        hlet.init_attrs()
+        hlet.apply_as_alternate(fobj, attach=False, wcskey='B')
+    with fits.open(fname) as fobj:
+        assert fobj[('SCI', 1)].header['WCSNAMEB'] == orig[0].header['WCSNAME']
+
+    headerlet.delete_headerlet(fname, hdrname='HLET1')
+    headerlet.delete_headerlet(fname, hdrname='HLET2')
+    with fits.open(fname) as fobj:
+        assert len(headerlet.shared_lookup_tables(fobj)) == ntables
+    headerlet.delete_headerlet(fname, hdrname='HLET3')
+    with fits.open(fname) as fobj:
+        assert headerlet.shared_lookup_tables(fobj) == {}
+
+
+def test_apply_over_inverse_sip(tmpdir):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('acs_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(64, 128))
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    hlet = headerlet.create_headerlet(fname, hdrname='NOINV')
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False, invsip=True)
+    with fits.open(fname) as fobj:
+        assert 'APBP_MAX' in fobj[('SCI', 1)].header
+
+    hlet.apply_as_primary(fname, attach=False, archive=False)
+    with fits.open(fname) as fobj:
+        for ext in [('SCI', 1), ('SCI', 2)]:
+            hdr = fobj[ext].header
+            for kw in ['AP_ORDER', 'BP_ORDER', 'AP_0_2', 'APBP_MAX', 'APBP_RMS']:
+                assert kw not in hdr
+            assert HSTWCS(fobj, ext=ext).apbp_max is None
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_apply_headerlets(tmpdir, workers):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    files = []
+    hdrlets = {}
+    for i in range(3):
+        fname = synthetic.make_observation(str(tmpdir.join('acs%d_flt.fits' % i)),
+                                           'ACS/WFC', refs, shape=(64, 128))
+        updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+        hlet = headerlet.create_headerlet(fname, hdrname='NEW%d' % i)
+        files.append(fname)
+        if i == 0:
+            hdrlets[fname] = hlet
+        elif i == 1:
+            buf = io.BytesIO()
+            hlet.writeto(buf)
+            hdrlets[fname] = buf.getvalue()
+        else:
+            hdrlets[fname] = str(tmpdir.join('new%d_hlet.fits' % i))
+            hlet.tofile(hdrlets[fname])
+    # headerlet of another observation
+    bad = str(tmpdir.join('bad_flt.fits'))
+    shutil.copyfile(files[0], bad)
+    fits.setval(bad, 'ROOTNAME', value='other')
+    hdrlets[bad] = hdrlets[files[1]]
+    files.append(bad)
+
+    if workers is None:
+        with pytest.raises(ValueError):
+            headerlet.apply_headerlets({bad: hdrlets.pop(bad)}, as_primary=False)
+        files.remove(bad)
+    else:
+        # with workers > 1 a failure is recorded even for a single file
+        results = headerlet.apply_headerlets({bad: hdrlets[bad]}, as_primary=False,
+                                             workers=workers)
+        assert results[0]['file'] == bad
+        assert results[0]['error'] is not None and results[0]['write'] is None
+    results = headerlet.apply_headerlets(hdrlets, as_primary=False, wcskey='B',
+                                         wcsname='NEW', workers=workers)
+    assert [res['file'] for res in results] == files
+    for i, fname in enumerate(files[:3]):
+        assert results[i]['error'] is None
+        assert results[i]['hdrname'] == 'NEW%d' % i
+        assert results[i]['write'] in ['patched', 'rewritten']
+        with fits.open(fname) as fobj:
+            assert fobj[('SCI', 1)].header['WCSNAMEB'] == 'NEW'
+            assert headerlet.get_headerlet_kw_names(fobj) == ['NEW%d' % i]
+    summary = headerlet.apply_summary(results)
+    assert summary['files'] == len(files)
+    assert summary['patched'] + summary['rewritten'] == 3
+    if workers:
+        assert results[3]['error'] is not None and results[3]['write'] is None
+        assert summary['failed'] == 1
@@ -0,0 +1,105 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import updatewcs
+from ..wcsutil import headerlet
+from ..wcsutil.hletstore import HeaderletStore
+
+from . import synthetic
+
+
+@pytest.fixture(scope='module')
+def observations(tmpdir_factory):
+    tmpdir = tmpdir_factory.mktemp('hletstore')
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    files = []
+    for i in range(2):
+        fname = synthetic.make_observation(str(tmpdir.join('acs%d_flt.fits' % i)),
+                                           'ACS/WFC', refs, shape=(64, 128))
+        fits.setval(fname, 'ROOTNAME', value='acs%d' % i)
+        updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+        headerlet.archive_as_headerlet(fname, 'HLET1', wcskey='PRIMARY')
+        headerlet.archive_as_headerlet(fname, 'HLET2', wcskey='PRIMARY', catalog='GAIA',
+                                       nmatch=10 * (i + 1), share_tables=True)
+        files.append(fname)
+    return files
+
+
+def test_insert_query_fetch(tmpdir, observations):
+    hlet = headerlet.create_headerlet(observations[0], hdrname='NEW', catalog='GAIA',
+                                      nmatch=5)
+    buf = io.BytesIO()
+    hlet.writeto(buf)
+    with HeaderletStore(str(tmpdir.join('store'))) as store:
+        key = store.insert(hlet)
+        assert store.insert(buf.getvalue()) == key
+        assert len(store) == 1
+        with pytest.raises(ValueError):
+            store.insert(headerlet.create_headerlet(observations[0], hdrname='NEW',
+                                                    descrip='other'))
+        rows = store.query(destim='acs0')
+        assert len(rows) == 1
+        assert rows[0]['key'] == key
+        assert rows[0]['hdrname'] == 'NEW'
+        assert rows[0]['catalog'] == 'GAIA'
+        assert rows[0]['nmatch'] == 5
+        assert rows[0]['distname'] == hlet[0].header['DISTNAME']
+        assert store.query(destim='acs1') == []
+        assert len(store.query(where='nmatch > ?', params=(4,))) == 1
+        with pytest.raises(ValueError):
+            store.query(unknown=1)
+
+        fetched = store.fetch(destim='acs0', hdrname='NEW')
+        assert fetched.hdrname == 'NEW'
+        for hdu in hlet[1:]:
+            assert fetched[(hdu.name, hdu.ver)].header == hdu.header
+            if hdu.data is not None:
+                np.testing.assert_array_equal(fetched[(hdu.name, hdu.ver)].data, hdu.data)
+
+        store.remove(key)
+        assert len(store) == 0
+        assert not os.path.exists(store.filename(key))
+        with pytest.raises(KeyError):
+            store.fetch(key)
+
+
+def test_import_files(tmpdir, observations):
+    path = str(tmpdir.join('store'))
+    with HeaderletStore(path) as store:
+        keys = store.import_files(observations)
+        assert len(keys) == 4
+        assert store.import_files(observations) == []
+
+    # the index is kept on disk
+    with HeaderletStore(path) as store:
+        assert len(store) == 4
+        rows = store.query(hdrname='HLET2', order_by='destim')
+        assert [row['destim'] for row in rows] == ['acs0', 'acs1']
+        assert [row['nmatch'] for row in rows] == [10, 20]
+        assert len(store.query(destim=['acs0', 'acs1'], catalog='GAIA')) == 2
+        # shared lookup tables are restored in the stored headerlets
+        hlet = store.fetch(rows[0]['key'])
+        with fits.open(observations[0]) as fobj:
+            for ext in ['WCSDVARR', 'D2IMARR']:
+                np.testing.assert_array_equal(hlet[(ext, 1)].data, fobj[(ext, 1)].data)
+
+
+def test_replace_rollback(tmpdir, observations):
+    hlet = headerlet.create_headerlet(observations[0], hdrname='HLET1', descrip='other')
+    with HeaderletStore(str(tmpdir.join('store'))) as store:
+        key = store.insert(hlet)
+        # the transaction fails after the headerlet was replaced
+        with pytest.raises(IOError):
+            store.import_files([observations[0], str(tmpdir.join('missing_flt.fits'))],
+                               replace=True)
+        assert [row['key'] for row in store.query(destim='acs0', hdrname='HLET1')] == [key]
+        assert store.fetch(key).hdrname == 'HLET1'
+
+        keys = store.import_files(observations[:1], replace=True)
+        assert key not in keys
+        assert not os.path.exists(store.filename(key))
+        assert store.fetch(destim='acs0', hdrname='HLET1')[0].header.get('DESCRIP') != 'other'
@@ -1,6 +1,13 @@
+import pickle
+
+import numpy as np
+import pytest
 from astropy.io import fits
+from .. import updatewcs
 from ..wcsutil import hstwcs
 
+from . import synthetic
+
 
 def test_radesys():
     phdr = fits.PrimaryHDU().header
@@ -12,3 +19,266 @@ def test_radesys():
     assert hstwcs.determine_refframe(phdr) is None
     phdr['refframe'] = ' '
     assert hstwcs.determine_refframe(phdr) is None
+
+
+@pytest.fixture(scope='module')
+def acs_wcs(tmpdir_factory):
+    tmpdir = tmpdir_factory.mktemp('hstwcs')
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('acs_flt.fits')), 'ACS/WFC', refs)
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    return hstwcs.HSTWCS(fname, ext=('SCI', 1))
+
+
+def test_sip_jacobian(acs_wcs):
+    x = np.array([1., 1000., 4096.])
+    y = np.array([1., 1500., 2048.])
+    jac = acs_wcs._sip_jacobian(x, y, 1)
+    step = 1e-3
+    fx1, fy1 = acs_wcs.sip_pix2foc(x + step, y, 1)
+    fx2, fy2 = acs_wcs.sip_pix2foc(x - step, y, 1)
+    fx3, fy3 = acs_wcs.sip_pix2foc(x, y + step, 1)
+    fx4, fy4 = acs_wcs.sip_pix2foc(x, y - step, 1)
+    # sip_pix2foc returns the corrected coordinates relative to CRPIX
+    expected = [(fx1 - fx2) / (2 * step) - 1, (fx3 - fx4) / (2 * step),
+                (fy1 - fy2) / (2 * step), (fy3 - fy4) / (2 * step) - 1]
+    np.testing.assert_allclose(jac, expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_all_world2pix_newton(acs_wcs, adaptive):
+    rng = np.random.RandomState(0)
+    x = rng.uniform(1, 4096, 1000)
+    y = rng.uniform(1, 2048, 1000)
+    ra, dec = acs_wcs.all_pix2world(x, y, 1)
+    xn, yn = acs_wcs.all_world2pix(ra, dec, 1, accuracy=1e-8, method='newton',
+                                   adaptive=adaptive)
+    np.testing.assert_allclose(xn, x, atol=1e-6)
+    np.testing.assert_allclose(yn, y, atol=1e-6)
+    # newton needs fewer iterations than the method of consecutive approximations
+    with pytest.raises(hstwcs.NoConvergence):
+        acs_wcs.all_world2pix(ra, dec, 1, accuracy=1e-6, maxiter=3)
+    acs_wcs.all_world2pix(ra, dec, 1, accuracy=1e-6, maxiter=3, method='newton')
+
+    with pytest.raises(ValueError):
+        acs_wcs.all_world2pix(ra, dec, 1, method='bisection')
+
+
+def test_all_world2pix_newton_divergent(acs_wcs):
+    radec = acs_wcs.all_pix2world([[1., 1.], [10000., 50000.], [3., 1.]], 1)
+    with pytest.raises(hstwcs.NoConvergence) as exc:
+        acs_wcs.all_world2pix(radec, 1, method='newton')
+    np.testing.assert_equal(exc.value.divergent, [1])
+    assert exc.value.failed2converge is None
+    np.testing.assert_allclose(exc.value.best_solution[[0, 2]], [[1., 1.], [3., 1.]],
+                               atol=1e-4)
+
+
+def test_all_world2pix_chunks(acs_wcs, tmpdir):
+    radec = acs_wcs.all_pix2world([[1., 1.], [10000., 50000.], [3., 1.],
+                                   [100., 200.], [20000., -40000.]], 1)
+    with pytest.raises(hstwcs.NoConvergence) as ref:
+        acs_wcs.all_world2pix(radec, 1)
+    # diagnostics of all the chunks are reported with global indices
+    with pytest.raises(hstwcs.NoConvergence) as exc:
+        acs_wcs.all_world2pix(radec, 1, chunk_size=2)
+    np.testing.assert_equal(exc.value.divergent, ref.value.divergent)
+    np.testing.assert_allclose(exc.value.best_solution[[0, 2, 3]],
+                               ref.value.best_solution[[0, 2, 3]], atol=1e-4)
+
+    rng = np.random.RandomState(0)
+    x = rng.uniform(1, 4096, 1000)
+    y = rng.uniform(1, 2048, 1000)
+    ra, dec = acs_wcs.all_pix2world(x, y, 1, chunk_size=300)
+    np.testing.assert_equal([ra, dec], acs_wcs.all_pix2world(x, y, 1))
+    # grids keep their shape
+    xg, yg = np.meshgrid(np.linspace(1, 4096, 50), np.linspace(1, 2048, 40))
+    rag, decg = acs_wcs.all_pix2world(xg, yg, 1, chunk_size=10)
+    assert rag.shape == decg.shape == (40, 50)
+    np.testing.assert_equal([rag, decg], acs_wcs.all_pix2world(xg, yg, 1))
+    # iterations stop when all the points of a chunk converged
+    xy = acs_wcs.all_world2pix(ra, dec, 1)
+    np.testing.assert_allclose(acs_wcs.all_world2pix(ra, dec, 1, chunk_size=300), xy,
+                               atol=1e-4)
+
+    # memory mapped catalog converted block by block
+    catalog = str(tmpdir.join('catalog.npy'))
+    np.save(catalog, np.column_stack([ra, dec]))
+    radec = np.load(catalog, mmap_mode='r')
+    blocks = list(acs_wcs.iter_world2pix(hstwcs.iter_chunks(radec, chunk_size=300), 1))
+    assert [len(b) for b in blocks] == [300, 300, 300, 100]
+    np.testing.assert_allclose(np.concatenate(blocks), np.column_stack(xy), atol=1e-4)
+    blocks = list(acs_wcs.iter_pix2world(hstwcs.iter_chunks(x, y, chunk_size=600), 1))
+    np.testing.assert_equal(np.concatenate(blocks, axis=1), [ra, dec])
+
+
+def test_parallel_hstwcs(acs_wcs):
+    rng = np.random.RandomState(0)
+    x = rng.uniform(1, 4096, 1000)
+    y = rng.uniform(1, 2048, 1000)
+    with hstwcs.ParallelHSTWCS(acs_wcs, nthreads=3, min_chunk_size=100) as pw:
+        assert len(pw._blocks(1000)) == 3
+        ra, dec = pw.all_pix2world(x, y, 1)
+        np.testing.assert_equal([ra, dec], acs_wcs.all_pix2world(x, y, 1))
+        np.testing.assert_equal(pw.pix2foc(np.column_stack([x, y]), 1),
+                                acs_wcs.pix2foc(np.column_stack([x, y]), 1))
+        xy = pw.all_world2pix(ra, dec, 1, accuracy=1e-6)
+        np.testing.assert_allclose(xy, [x, y], atol=1e-5)
+        assert pw.all_pix2world([], [], 1)[0].shape == (0,)
+
+        radec = np.column_stack([ra, dec])
+        radec[500] = acs_wcs.all_pix2world([[10000., 50000.]], 1)
+        with pytest.raises(hstwcs.NoConvergence) as exc:
+            pw.all_world2pix(radec, 1)
+        np.testing.assert_equal(exc.value.divergent, [500])
+        assert exc.value.best_solution.shape == (1000, 2)
+
+
+@pytest.mark.parametrize('order', [1, 3])
+def test_distortion_grid(acs_wcs, order):
+    grid = acs_wcs.distortion_grid(step=32, order=order)
+    assert grid.max_error < 0.1
+    rng = np.random.RandomState(0)
+    # includes points outside the grid which use the exact model
+    x = rng.uniform(-200, 4300, 100000)
+    y = rng.uniform(-200, 2250, 100000)
+    for origin in [0, 1]:
+        fx, fy = acs_wcs.pix2foc(x, y, origin)
+        gx, gy = grid.pix2foc(x, y, origin)
+        assert np.hypot(gx - fx, gy - fy).max() <= 1.1 * grid.max_error + 1e-5
+    outside = (x < -100) | (y < -100)
+    np.testing.assert_allclose(gx[outside], fx[outside], atol=1e-5)
+
+    xs = np.arange(0, 4096, 7.)
+    ys = np.arange(0, 2048, 5.)
+    ra, dec = grid.all_pix2world_grid(xs, ys, 0)
+    assert ra.shape == (len(ys), len(xs))
+    xx, yy = np.meshgrid(xs, ys)
+    gx, gy = grid.pix2foc(xx, yy, 0)
+    fx, fy = grid.pix2foc_grid(xs, ys, 0)
+    np.testing.assert_allclose(fx, gx, atol=1e-8)
+    np.testing.assert_allclose(fy, gy, atol=1e-8)
+    x, y = acs_wcs.all_world2pix(ra.ravel(), dec.ravel(), 0, accuracy=1e-6)
+    assert np.hypot(x - xx.ravel(), y - yy.ravel()).max() <= 1.1 * grid.max_error + 1e-5
+
+    with pytest.raises(ValueError):
+        acs_wcs.distortion_grid(order=2)
+
+
+def test_lazy_distortion(acs_wcs):
+    fname = acs_wcs.filename
+    with fits.open(fname) as f:
+        w = hstwcs.HSTWCS(f, ext=('SCI', 2), lazy_distortion=True)
+        assert w._lazy_distortion is not None
+        ref = hstwcs.HSTWCS(f, ext=('SCI', 2))
+        assert w.wcs2header() == ref.wcs2header()
+        assert w.pscale == ref.pscale and w.orientat == ref.orientat
+        assert w._lazy_distortion is not None
+        x = np.array([1., 100., 4000.])
+        y = np.array([1., 2000., 30.])
+        np.testing.assert_equal(w.pix2foc(x, y, 1), ref.pix2foc(x, y, 1))
+        assert w._lazy_distortion is None
+        assert w.cpdis1 is not None and w.det2im1 is not None
+
+    # tables are read from the file the first time they are needed
+    w = hstwcs.HSTWCS(fname, ext=('SCI', 1), lazy_distortion=True)
+    np.testing.assert_equal(w.all_pix2world(x, y, 1), acs_wcs.all_pix2world(x, y, 1))
+    assert w._lazy_distortion is None
+    np.testing.assert_equal(w.cpdis2.data, acs_wcs.cpdis2.data)
+
+    # accessing the tables reads them
+    w = hstwcs.HSTWCS(fname, ext=('SCI', 1), lazy_distortion=True)
+    assert w.cpdis1 is not None
+    assert w._lazy_distortion is None
+    np.testing.assert_equal(w.det2im1.data, acs_wcs.det2im1.data)
+    w = hstwcs.HSTWCS(fname, ext=('SCI', 1), lazy_distortion=True)
+    w.sip = None
+    assert w.has_distortion
+
+
+@pytest.mark.parametrize('method', ['deepcopy', 'copy', 'sub', 'celestial'])
+def test_lazy_distortion_copies(acs_wcs, method):
+    w = hstwcs.HSTWCS(acs_wcs.filename, ext=('SCI', 1), lazy_distortion=True)
+    if method == 'celestial':
+        w2 = w.celestial
+    else:
+        w2 = getattr(w, method)()
+    for name in ['cpdis1', 'cpdis2', 'det2im1', 'det2im2']:
+        table = getattr(acs_wcs, name)
+        if table is None:
+            assert getattr(w2, name) is None
+        else:
+            np.testing.assert_equal(getattr(w2, name).data, table.data)
+
+
+def test_linear_copy(acs_wcs):
+    acs_wcs.readModel()
+    w = acs_wcs.linear_copy()
+    assert isinstance(w, hstwcs.HSTWCS)
+    assert w.cpdis1 is acs_wcs.cpdis1 and w.sip is acs_wcs.sip
+    x = np.array([1., 100., 4000.])
+    y = np.array([1., 2000., 30.])
+    np.testing.assert_equal(w.all_pix2world(x, y, 1), acs_wcs.all_pix2world(x, y, 1))
+
+    crval = acs_wcs.wcs.crval.copy()
+    cx11 = acs_wcs.idcmodel.cx[1, 1]
+    w.wcs.crval = crval + 1
+    w.idcmodel.cx[1, 1] += 1
+    w.idcmodel.refpix['XREF'] += 1
+    w.pscale = 1.
+    np.testing.assert_equal(acs_wcs.wcs.crval, crval)
+    assert acs_wcs.idcmodel.cx[1, 1] == cx11
+    assert acs_wcs.idcmodel.refpix['XREF'] == w.idcmodel.refpix['XREF'] - 1
+    assert acs_wcs.pscale != 1.
+
+
+def test_to_bytes(acs_wcs):
+    acs_wcs.readModel()
+    x = np.array([1., 100., 4000.])
+    y = np.array([1., 2000., 30.])
+    data = acs_wcs.to_bytes()
+    w = hstwcs.HSTWCS.from_bytes(data)
+    assert w.wcs2header(sip2hdr=True) == acs_wcs.wcs2header(sip2hdr=True)
+    np.testing.assert_equal(w.all_pix2world(x, y, 1), acs_wcs.all_pix2world(x, y, 1))
+    np.testing.assert_equal(w.det2im1.data, acs_wcs.det2im1.data)
+    assert w.extname == ('SCI', 1)
+    assert (w.instrument, w.chip, w.idcscale, w.pscale, w.naxis1) == \
+        (acs_wcs.instrument, acs_wcs.chip, acs_wcs.idcscale, acs_wcs.pscale, acs_wcs.naxis1)
+    # objects other than arrays and simple values are not serialized
+    assert not hasattr(w, 'idcmodel')
+
+    w = hstwcs.HSTWCS.from_bytes(acs_wcs.to_bytes(lookup_tables=False))
+    assert w.cpdis1 is None and w.det2im1 is None
+    np.testing.assert_equal(w.sip_pix2foc(x, y, 1), acs_wcs.sip_pix2foc(x, y, 1))
+
+    w = pickle.loads(pickle.dumps(acs_wcs))
+    np.testing.assert_equal(w.all_pix2world(x, y, 1), acs_wcs.all_pix2world(x, y, 1))
+    np.testing.assert_equal(w.idcmodel.cx, acs_wcs.idcmodel.cx)
+
+    with pytest.raises(ValueError):
+        hstwcs.HSTWCS.from_bytes(b'SIMPLE' + data[6:])
+
+
+def test_fit_inverse_sip(acs_wcs):
+    w = acs_wcs.linear_copy()
+    max_residual, rms_residual = w.fit_inverse_sip(max_error=1e-3)
+    assert rms_residual < max_residual < 1e-3
+    assert w.apbp_max == max_residual and acs_wcs.sip.ap is None
+    x = np.array([1., 1000., 4096.])
+    y = np.array([1., 1500., 2048.])
+    fx, fy = w.sip_pix2foc(x, y, 1)
+    xp, yp = w._sip_foc2pix(fx + w.sip.crpix[0], fy + w.sip.crpix[1], 1)
+    np.testing.assert_allclose(xp, x, atol=1e-3)
+    np.testing.assert_allclose(yp, y, atol=1e-3)
+
+    ra, dec = w.all_pix2world(x, y, 1)
+    # the lookup tables are not included in the inverse polynomials
+    assert w._world2pix(ra, dec, 1, accuracy=1e-3)[4] > 0
+    w.cpdis1 = w.cpdis2 = w.det2im1 = w.det2im2 = None
+    ra, dec = w.all_pix2world(x, y, 1)
+    xp, yp, dx, dy, niter = w._world2pix(ra, dec, 1, accuracy=2e-3)[:5]
+    assert niter == 0
+    np.testing.assert_allclose(xp, x, atol=1e-3)
+    # outside of the image the solution is iterated
+    ra, dec = w.all_pix2world([-100.], [1.], 1)
+    assert w._world2pix(ra, dec, 1, accuracy=1e-3)[4] > 0
@@ -0,0 +1,50 @@
+import json
+
+from .. import instrumentation
+from ..updatewcs import updatewcs
+from .synthetic import make_acs_wfc
+
+
+def test_recorder():
+    with instrumentation.Recorder() as rec:
+        with instrumentation.stage('test', filename='a.fits', extname='SCI', extver=1):
+            pass
+        instrumentation.ref_file_opened('missing.fits', 'IDCTAB')
+    assert not instrumentation.enabled()
+    # events are not recorded after the context manager exits
+    instrumentation.emit('stage', stage='test', wall=0., cpu=0.)
+    assert [ev['event'] for ev in rec.events] == ['stage', 'ref_open']
+    assert rec.events[0]['extver'] == 1
+    assert rec.events[1]['bytes'] is None
+    summary = rec.summary()
+    assert summary['stages']['test']['count'] == 1
+    assert summary['ref_opens'] == {'IDCTAB': 1}
+
+
+def test_updatewcs_events(tmpdir):
+    acs_file = make_acs_wfc(str(tmpdir.join('events_flt.fits')))
+    with instrumentation.Recorder() as rec:
+        updatewcs(acs_file, checkfiles=False, use_db=False)
+    summary = rec.summary()
+    # one event per SCI extension
+    assert summary['stages']['TDDCorr']['count'] == 2
+    assert summary['stages']['NPOLCorr']['count'] == 1
+    assert summary['ref_opens']['NPOLFILE'] >= 1
+    assert summary['ref_opens']['D2IMFILE'] >= 1
+    assert summary['writes'] == {'patched': 0, 'rewritten': 1}
+    assert summary['bytes_written'] > 0
+    assert rec.events[-1]['event'] == 'file'
+
+    output = str(tmpdir.join('events.jsonl'))
+    rec.write_jsonl(output)
+    with open(output) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == rec.events
+
+
+def test_updatewcs_events_workers(tmpdir):
+    files = [make_acs_wfc(str(tmpdir.join('w{0}_flt.fits'.format(i)))) for i in range(2)]
+    with instrumentation.Recorder() as rec:
+        updatewcs(files, checkfiles=False, use_db=False, workers=2)
+    assert sorted(ev['file'] for ev in rec.events if ev['event'] == 'file') == sorted(files)
+    assert rec.summary()['stages']['TDDCorr']['count'] == 4
@@ -11,6 +11,9 @@ import numpy as np
 from numpy.testing import utils
 import pytest
 
+from . import synthetic
+from .synthetic import make_acs_wfc
+
 
 from . import data
 data_path = os.path.split(os.path.abspath(data.__file__))[0]
@@ -360,3 +363,296 @@ def test_apply_d2im():
     # No D2IMFILE keyword in primary header
     fits.delval(fname, ext=0, keyword='D2IMFILE')
     assert not appc.apply_d2im_correction(fname, d2imcorr=True)
+
+
+def test_updatewcs_workers(tmpdir):
+    """ Parallel updatewcs gives the same result as the serial one and
+    isolates failures to the offending file."""
+    serial = [make_acs_wfc(str(tmpdir.join('serial{0}_flt.fits'.format(i))),
+                           crval=(5.65 + i, -72.07)) for i in range(3)]
+    parallel = [make_acs_wfc(str(tmpdir.join('parallel{0}_flt.fits'.format(i))),
+                             crval=(5.65 + i, -72.07)) for i in range(3)]
+    bad = str(tmpdir.join('bad.fits'))
+    shutil.copyfile(get_filepath('simple.fits'), bad)
+
+    updatewcs.updatewcs(serial, checkfiles=False, use_db=False)
+    report = updatewcs.updatewcs(parallel[:2] + [bad] + parallel[2:],
+                                 checkfiles=False, use_db=False,
+                                 workers=2, report=True)
+
+    assert [r['file'] for r in report] == parallel[:2] + [bad] + parallel[2:]
+    assert report[2]['error'] is not None
+    for r in report[:2] + report[3:]:
+        assert r['error'] is None
+        assert 'MakeWCS' in r['corrections']
+        assert r['elapsed'] > 0
+
+    for fs, fp in zip(serial, parallel):
+        with fits.open(fs) as hs, fits.open(fp) as hp:
+            assert len(hs) == len(hp)
+            for exs, exp in zip(hs, hp):
+                assert exs.header == exp.header
+
+    # with workers > 1 a failure is recorded even for a single file
+    report = updatewcs.updatewcs([bad], checkfiles=False, use_db=False,
+                                 workers=2, report=True)
+    assert report[0]['file'] == bad
+    assert report[0]['error'] is not None
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_updatewcs_astrometry_db_per_call(tmpdir, monkeypatch, workers):
+    """ The settings of the astrometry database are read by each call."""
+    files = [make_acs_wfc(str(tmpdir.join('db{0}_flt.fits'.format(i)))) for i in range(2)]
+    monkeypatch.setenv('ASTROMETRY_STEP_CONTROL', 'off')
+    report = updatewcs.updatewcs(files, checkfiles=False, use_db=True,
+                                 workers=workers, report=True)
+    assert [r['error'] for r in report] == [None, None]
+
+    monkeypatch.setenv('ASTROMETRY_STEP_CONTROL', 'invalid')
+    if workers is None:
+        with pytest.raises(ValueError):
+            updatewcs.updatewcs(files, checkfiles=False, use_db=True)
+    else:
+        report = updatewcs.updatewcs(files, checkfiles=False, use_db=True,
+                                     workers=workers, report=True)
+        for r in report:
+            assert r['error'].startswith('ValueError')
+
+
+def test_updatewcs_opens_file_once(tmpdir, monkeypatch):
+    acs_file = make_acs_wfc(str(tmpdir.join('session_flt.fits')))
+    opened = []
+    fromfile = fits.HDUList.fromfile
+
+    def counting_fromfile(cls, fileobj, *args, **kwargs):
+        if isinstance(fileobj, str) and os.path.abspath(fileobj) == acs_file:
+            opened.append(fileobj)
+        return fromfile(fileobj, *args, **kwargs)
+
+    monkeypatch.setattr(fits.HDUList, 'fromfile', classmethod(counting_fromfile))
+    updatewcs.updatewcs(acs_file, checkfiles=False, use_db=False)
+    monkeypatch.undo()
+    assert len(opened) == 1
+    assert fits.getval(acs_file, 'NPOLEXT', ext=1).endswith('qbu16424j_npl.fits')
+
+
+def test_updatewcs_header_padding(tmpdir):
+    acs_file = make_acs_wfc(str(tmpdir.join('padding_flt.fits')))
+    res = updatewcs.updatewcs(acs_file, checkfiles=False, use_db=False,
+                              report=True, header_padding=1)
+    assert res[0]['write'] == 'rewritten'
+    with fits.open(acs_file) as f:
+        datloc = [hdu.fileinfo()['datLoc'] for hdu in f]
+    # running again uses the reserved space and does not move the data
+    res = updatewcs.updatewcs(acs_file, checkfiles=False, use_db=False,
+                              report=True, header_padding=1)
+    assert res[0]['write'] == 'patched'
+    with fits.open(acs_file) as f:
+        assert [hdu.fileinfo()['datLoc'] for hdu in f] == datloc
+
+
+@pytest.mark.parametrize('detector', sorted(synthetic.DETECTORS))
+def test_updatewcs_synthetic_detectors(tmpdir, detector):
+    refs = synthetic.make_reference_files(str(tmpdir), detector)
+    fname = synthetic.make_observation(str(tmpdir.join('synth_flt.fits')), detector,
+                                       refs, shape=(128, 256))
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True)
+    corrections = res[0]['corrections']
+    assert 'MakeWCS' in corrections and 'CompSIP' in corrections
+    assert ('NPOLCorr' in corrections) == ('NPOLFILE' in refs)
+    assert ('DET2IMCorr' in corrections) == ('D2IMFILE' in refs)
+    with fits.open(fname) as f:
+        w = HSTWCS(f, ext=('SCI', 1))
+        assert w.sip is not None
+        assert (w.cpdis1 is not None) == ('NPOLFILE' in refs)
+        assert (w.det2im1 is not None) == ('D2IMFILE' in refs)
+        # round trip through the full distortion model
+        x, y = np.array([10., 100., 200.]), np.array([10., 50., 120.])
+        ra, dec = w.all_pix2world(x, y, 1)
+        xp, yp = w.all_world2pix(ra, dec, 1, accuracy=1e-6)
+        np.testing.assert_allclose(xp, x, atol=1e-4)
+        np.testing.assert_allclose(yp, y, atol=1e-4)
+
+
+def test_lookup_table_cache(tmpdir):
+    from .. import instrumentation
+    from ..updatewcs import npol, refcache
+    refs = synthetic.make_reference_files(str(tmpdir), 'WFC3/UVIS')
+    files = [synthetic.make_observation(str(tmpdir.join('lut{0}_flt.fits'.format(i))),
+                                        'WFC3/UVIS', refs, shape=(128, 256))
+             for i in range(2)]
+    refcache.lookup_table_cache.clear()
+    with instrumentation.Recorder() as rec:
+        updatewcs.updatewcs(files, checkfiles=False, use_db=False)
+    # each reference file is read once for the whole batch
+    ref_opens = rec.summary()['ref_opens']
+    assert ref_opens['NPOLFILE'] == 1
+    assert ref_opens['D2IMFILE'] == 1
+
+    with fits.open(files[0]) as f:
+        coeffs = npol.NPOLCorr.getIDCCoeffs(f[1].header)
+    ccdchip = 2
+    dx, dy = npol.NPOLCorr.getTransformedData(refs['NPOLFILE'], ccdchip, coeffs)
+    with fits.open(refs['NPOLFILE']) as npl:
+        expected = npol.NPOLCorr.transformData(npl['DX', 2].data, npl['DY', 2].data, coeffs)
+    np.testing.assert_equal(dx, expected[0])
+    np.testing.assert_equal(dy, expected[1])
+    # returned arrays are copies of the cached arrays
+    dx[0, 0] = 1e6
+    dx2, dy2 = npol.NPOLCorr.getTransformedData(refs['NPOLFILE'], ccdchip, coeffs)
+    assert dx2[0, 0] != 1e6
+
+    # a modified reference file is read again
+    stat = os.stat(refs['NPOLFILE'])
+    os.utime(refs['NPOLFILE'], (stat.st_atime, stat.st_mtime + 10))
+    misses = refcache.lookup_table_cache.info()['misses']
+    npol.NPOLCorr.getTransformedData(refs['NPOLFILE'], ccdchip, coeffs)
+    assert refcache.lookup_table_cache.info()['misses'] == misses + 2
+
+
+@pytest.mark.parametrize('maxsize', [0, 1])
+def test_lookup_table_cache_closes_files(tmpdir, maxsize):
+    from ..updatewcs import refcache
+    refs = synthetic.make_reference_files(str(tmpdir), 'WFC3/UVIS')
+    cache = refcache.LookupTableCache(maxsize=maxsize)
+    npl = cache.open(refs['NPOLFILE'])
+    assert cache.open(refs['NPOLFILE']) is npl
+    d2im = cache.open(refs['D2IMFILE'])
+    # evicted files are closed
+    assert npl._file.closed
+    assert not d2im._file.closed
+    assert len(cache) == 1
+    cache.clear()
+    assert d2im._file.closed
+    assert len(cache) == 0
+
+
+def test_updatewcs_skip_unchanged(tmpdir):
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('skip_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(128, 256))
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert not res[0]['skipped']
+    fingerprint = fits.getval(fname, 'UPWCSFP')
+    with open(fname, 'rb') as f:
+        content = f.read()
+
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert res[0]['skipped']
+    assert res[0]['write'] is None
+    with open(fname, 'rb') as f:
+        assert f.read() == content
+
+    # different switches or a modified reference file change the fingerprint
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              npolcorr=False, skip_unchanged=True)
+    assert not res[0]['skipped']
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert not res[0]['skipped']
+    fingerprint = fits.getval(fname, 'UPWCSFP')
+    with fits.open(refs['NPOLFILE'], mode='update') as npl:
+        npl['DX', 1].data[0, 0] += 0.01
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert not res[0]['skipped']
+    assert fits.getval(fname, 'UPWCSFP') != fingerprint
+
+
+@pytest.mark.parametrize(('keyword', 'delta'), [('CRVAL1', 1e-4), ('A_2_0', 1e-9)])
+def test_updatewcs_skip_unchanged_primary_wcs(tmpdir, keyword, delta):
+    """ A primary WCS or SIP keyword modified after updatewcs (for example by
+    applying a headerlet) changes the fingerprint."""
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('skipwcs_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(128, 256))
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False, skip_unchanged=True)
+    with fits.open(fname, mode='update') as f:
+        f[('SCI', 2)].header[keyword] += delta
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert not res[0]['skipped']
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              skip_unchanged=True)
+    assert res[0]['skipped']
+
+
+def test_updatewcs_skip_unchanged_use_db(tmpdir, monkeypatch):
+    """ Files are not skipped when new solutions may be in the astrometry database."""
+    monkeypatch.setenv('ASTROMETRY_STEP_CONTROL', 'off')
+    refs = synthetic.make_reference_files(str(tmpdir), 'ACS/WFC')
+    fname = synthetic.make_observation(str(tmpdir.join('skipdb_flt.fits')), 'ACS/WFC',
+                                       refs, shape=(128, 256))
+    for i in range(2):
+        res = updatewcs.updatewcs(fname, checkfiles=False, use_db=True, report=True,
+                                  skip_unchanged=True)
+        assert not res[0]['skipped']
+        assert res[0]['write'] is not None
+
+
+def test_tdd_coeffs():
+    from types import SimpleNamespace
+    from ..distortion import models
+    from ..updatewcs.corrections import TDDCorr, decimal_year
+
+    assert decimal_year('2012-05-01') == 122 / 365.25 + 2012
+    assert decimal_year(2012.5) == 2012.5
+    dates = ['2003-01-01', '2009-06-15', '2012-05-01', '2016-12-31']
+    np.testing.assert_array_equal(decimal_year(dates), [decimal_year(d) for d in dates])
+
+    idctab = os.path.join(data_path, 'postsm4_idc.fits')
+    model = models.IDCModel(idctab, chip=1, filter1='F606W', filter2='CLEAR2L')
+    skew_2014 = dict(model.refpix['skew_coeffs'], TDD_A=None, TDD_B=None, TDDORDER=0,
+                     TDD_DATE=2012.0, TDD_CY_BETA=1e-7,
+                     TDD_CY_ALPHA=1e-3, TDD_CX_BETA=2e-7, TDD_CX_ALPHA=2e-3)
+    skew_2015 = dict(model.refpix['skew_coeffs'], TDD_A=None, TDD_B=None, TDDORDER=0,
+                     TDD_DATE=2012.0, TDD_CTB=1e-7,
+                     TDD_CXB=2e-7, TDD_CYB=None)
+    for skew_coeffs in [model.refpix['skew_coeffs'], skew_2014, skew_2015, None]:
+        model.refpix['skew_coeffs'] = skew_coeffs
+        cx, cy = TDDCorr.tdd_coeffs(model, dates)
+        assert cx.shape == (len(dates),) + model.cx.shape
+        for i, date in enumerate(dates):
+            hwcs = SimpleNamespace(date_obs=date, idcmodel=model.copy())
+            hwcs.idcmodel.refpix['skew_coeffs'] = skew_coeffs
+            if skew_coeffs is None or skew_coeffs['TDD_A'] is not None:
+                TDDCorr.apply_tdd2idc(hwcs, *TDDCorr.compute_alpha_beta(hwcs))
+            elif skew_coeffs['TDD_CTB'] is not None:
+                TDDCorr.apply_tdd2idc2015(hwcs)
+            else:
+                TDDCorr.apply_tdd2idc2(hwcs)
+            np.testing.assert_allclose(cx[i], hwcs.idcmodel.cx, rtol=1e-14, atol=1e-20)
+            np.testing.assert_allclose(cy[i], hwcs.idcmodel.cy, rtol=1e-14, atol=1e-20)
+
+
+@pytest.mark.parametrize('detector', ['WFC3/IR', 'ACS/WFC'])
+def test_updatewcs_invsip(tmpdir, detector):
+    refs = synthetic.make_reference_files(str(tmpdir), detector)
+    fname = synthetic.make_observation(str(tmpdir.join('invsip_flt.fits')), detector, refs)
+    res = updatewcs.updatewcs(fname, checkfiles=False, use_db=False, report=True,
+                              invsip=True)
+    assert 'CompInvSIP' in res[0]['corrections']
+    with fits.open(fname) as f:
+        hdr = f[('SCI', 1)].header
+        assert hdr['AP_ORDER'] == hdr['BP_ORDER']
+        assert 0 < hdr['APBP_RMS'] <= hdr['APBP_MAX'] < 1e-3
+        w = HSTWCS(f, ext=('SCI', 1))
+        assert w.sip.ap is not None and w.apbp_max == hdr['APBP_MAX']
+        x = np.array([1., 100., w.naxis1 / 2., w.naxis1])
+        y = np.array([1., 900., w.naxis2 / 3., w.naxis2])
+        ra, dec = w.all_pix2world(x, y, 1)
+        # the inverse polynomials are the solution only without lookup tables
+        for accuracy in [1e-2, 1e-6]:
+            xp, yp = w.all_world2pix(ra, dec, 1, accuracy=accuracy)
+            np.testing.assert_allclose(xp, x, atol=accuracy)
+            np.testing.assert_allclose(yp, y, atol=accuracy)
+
+    # a new SIP model without inverse removes the old AP and BP coefficients
+    updatewcs.updatewcs(fname, checkfiles=False, use_db=False)
+    with fits.open(fname) as f:
+        hdr = f[('SCI', 1)].header
+        assert 'AP_ORDER' not in hdr and 'APBP_MAX' not in hdr
+        assert HSTWCS(f, ext=('SCI', 1)).sip.ap is None
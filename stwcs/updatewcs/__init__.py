@@ -3,6 +3,8 @@ import warnings
 
 from astropy.io import fits
 from .. import wcsutil
+from .. import instrumentation
+from ..wcsutil import fitsupdate
 #from ..wcsutil.hwstwcs import HSTWCS
 
 from .. import __version__
@@ -20,6 +22,7 @@ from . import astrometry_utils
 
 import time
 import logging
+from concurrent import futures
 logger = logging.getLogger('stwcs.updatewcs')
 
 atexit.register(logging.shutdown)
@@ -29,7 +32,8 @@ atexit.register(logging.shutdown)
 warnings.filterwarnings("ignore", message="^Some non-standard WCS keywords were excluded:", module="astropy.wcs")
 
 def updatewcs(input, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True,
-              checkfiles=True, verbose=False, use_db=True):
+              checkfiles=True, verbose=False, use_db=True, workers=None,
+              report=False, header_padding=0, skip_unchanged=False, invsip=False):
     """
 
     Updates HST science files with the best available calibration information.
@@ -66,14 +70,56 @@ def updatewcs(input, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True,
               If True, a Lookup table distortion will be applied
     d2imcorr: boolean
               If True, detector to image correction will be applied
+    invsip: boolean
+              If True, inverse SIP polynomials (AP_*, BP_*) are fit to the
+              SIP coefficients and the largest and RMS residuals (in pixels)
+              are written to the APBP_MAX and APBP_RMS keywords; see
+              `~stwcs.updatewcs.corrections.CompInvSIP`.
+              Default value is False.
     checkfiles: boolean
               If True, the format of the input files will be checked,
               geis and waiver fits files will be converted to MEF format.
               Default value is True for standalone mode.
     use_db: boolean
               If True, attempt to add astrometric solutions from the
-              MAST astrometry database.
+              MAST astrometry database. The connection is established
+              once per call (once per worker process if ``workers`` > 1).
               Default value is True.
+    workers: int or None
+              Number of processes used to update the input files.
+              If None or 1, files are processed serially in the current
+              process and any exception is raised immediately.
+              If larger than 1, files are distributed to a process pool;
+              a failure in one file is recorded in the report and does not
+              stop the processing of the remaining files.
+    report: boolean
+              If True, return a list of per-file result dictionaries (in
+              input order) with keys 'file', 'corrections', 'elapsed',
+              'write', 'skipped' and 'error' instead of the list of file names.
+              'write' is 'patched' if the headers were updated in place
+              and 'rewritten' if the file had to be rewritten.
+    header_padding: int
+              Number of FITS header blocks (36 cards each) reserved as blank
+              cards at the end of each header whenever a file is rewritten.
+              Later updates which fit in the reserved space (for example
+              running updatewcs again or adding alternate WCSs) change the
+              headers in place instead of rewriting the file.
+              Default value is 0 (no reserved space).
+
+    skip_unchanged: boolean
+              The fingerprint of the inputs which determine the WCS (names and
+              checksums of the reference files, relevant header keywords,
+              the correction switches and the versions of stwcs and astropy)
+              is recorded in the UPWCSFP keyword of the primary header.
+              If True, files whose fingerprint matches the current inputs
+              are not modified and are reported with 'skipped' set to True.
+              Files are never skipped if ``use_db`` is True because new
+              solutions in the astrometry database are not part of the
+              fingerprint.
+              Default value is False.
+
+    Timing of each correction and counts of reference files opened and
+    bytes written can be collected with `stwcs.instrumentation`.
     """
     if not verbose:
         logger.setLevel(100)
@@ -86,9 +132,9 @@ def updatewcs(input, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True,
         fh.setFormatter(formatter)
         logger.addHandler(fh)
         logger.setLevel(verbose)
-    args = "vacorr=%s, tddcorr=%s, npolcorr=%s, d2imcorr=%s, checkfiles=%s, \
+    args = "vacorr=%s, tddcorr=%s, npolcorr=%s, d2imcorr=%s, invsip=%s, checkfiles=%s, \
     " % (str(vacorr), str(tddcorr), str(npolcorr),
-         str(d2imcorr), str(checkfiles))
+         str(d2imcorr), str(invsip), str(checkfiles))
     logger.info('\n\tStarting UPDATEWCS: %s', time.asctime())
 
     files = parseinput.parseinput(input)[0]
@@ -100,41 +146,208 @@ def updatewcs(input, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True,
             print('No valid input, quitting ...\n')
             return
 
+    corr_pars = {'vacorr': vacorr, 'tddcorr': tddcorr,
+                 'npolcorr': npolcorr, 'd2imcorr': d2imcorr, 'invsip': invsip}
+    # failures are recorded in the report when workers > 1
+    isolate = workers is not None and workers > 1
+    if not isolate or len(files) < 2:
+        # serial mode, also used for a single file with workers > 1
+        astrometry = None
+        if use_db and not isolate:
+            # Establish any available connection to
+            #  an accessible astrometry web-service
+            astrometry = astrometry_utils.AstrometryDB()
+        results = []
+        for f in files:
+            results.append(_update_file(f, corr_pars, use_db, isolate=isolate,
+                                        header_padding=header_padding,
+                                        skip_unchanged=skip_unchanged,
+                                        astrometry=astrometry))
+    else:
+        logger.info("\n\tUpdating %d files using %d processes" % (len(files), workers))
+        with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(use_db,)) as executor:
+            # Executor.map preserves the order of the input list
+            results = list(executor.map(_update_file, files,
+                                        [corr_pars] * len(files),
+                                        [use_db] * len(files),
+                                        [True] * len(files),
+                                        [header_padding] * len(files),
+                                        [instrumentation.enabled()] * len(files),
+                                        [skip_unchanged] * len(files)))
+        for res in results:
+            instrumentation.replay(res.pop('events', []))
+    for res in results:
+        if res['error'] is not None:
+            logger.warning("\n\tFailed to update %s: %s" % (res['file'], res['error']))
+
+    if report:
+        return results
+    return files
+
+
+# AstrometryDB of a worker process of `updatewcs` (or the exception raised
+# when creating it), set by `_init_worker`.
+_worker_astrometry = None
+
+
+def _init_worker(use_db):
+    """
+    Initializer of the worker processes of `updatewcs`.
+
+    The connection to the astrometry database is established once per
+    worker. An error is raised by `_update_file` for each file so that it
+    is recorded in the report instead of breaking the pool.
+    """
+    global _worker_astrometry
+    _worker_astrometry = None
     if use_db:
-        # Establish any available connection to
-        #  an accessible astrometry web-service
-        astrometry = astrometry_utils.AstrometryDB()
+        try:
+            _worker_astrometry = astrometry_utils.AstrometryDB()
+        except Exception as e:
+            _worker_astrometry = e
 
-    for f in files:
-        acorr = apply_corrections.setCorrections(f, vacorr=vacorr, tddcorr=tddcorr,
-                                                 npolcorr=npolcorr, d2imcorr=d2imcorr)
-        if 'MakeWCS' in acorr and newIDCTAB(f):
-            logger.warning("\n\tNew IDCTAB file detected. All current WCSs will be deleted")
-            cleanWCS(f)
 
-        makecorr(f, acorr)
+def _update_file(fname, corr_pars, use_db, isolate=True, header_padding=0,
+                 collect_events=False, skip_unchanged=False, astrometry=None):
+    """
+    Update the WCS of a single file.
 
-        if use_db:
-            # Add any new astrometry solutions available from
-            #  an accessible astrometry web-service
-            astrometry.updateObs(f)
+    This is the unit of work of `updatewcs`, in serial mode as well as in
+    a worker process.
 
-    return files
+    Parameters
+    ----------
+    fname : str
+        file name
+    corr_pars : dict
+        values of the 'vacorr', 'tddcorr', 'npolcorr', 'd2imcorr' and 'invsip'
+        switches
+    use_db : bool
+        If True, add astrometric solutions from the astrometry database.
+    isolate : bool
+        If True, an exception is not raised but recorded in the result.
+    header_padding : int
+        Number of header blocks reserved when the file is rewritten.
+    collect_events : bool
+        If True, events of `stwcs.instrumentation` are recorded and returned
+        in the result as 'events' (used to send them from a worker process
+        to the main process).
+    skip_unchanged : bool
+        If True, the file is not updated if its fingerprint (UPWCSFP)
+        matches the current inputs and ``use_db`` is False.
+    astrometry : `~stwcs.updatewcs.astrometry_utils.AstrometryDB` or None
+        Connection to the astrometry database used if ``use_db`` is True.
+        If None, the connection of the worker process (see `_init_worker`)
+        is used, or a new one is established.
+
+    Returns
+    -------
+    result : dict
+        Dictionary with keys 'file', 'corrections' (list of corrections
+        applied), 'elapsed' (wall time in seconds), 'write' ('patched',
+        'rewritten' or None if the file was not saved), 'skipped' (True if
+        the file was unchanged) and 'error' (None or a string describing
+        the failure).
+    """
+    if collect_events:
+        with instrumentation.Recorder() as recorder:
+            result = _update_file(fname, corr_pars, use_db, isolate=isolate,
+                                  header_padding=header_padding,
+                                  skip_unchanged=skip_unchanged,
+                                  astrometry=astrometry)
+        result['events'] = recorder.events
+        return result
+
+    result = {'file': fname, 'corrections': [], 'elapsed': 0.0, 'write': None,
+              'skipped': False, 'error': None}
+    start = time.time()
+    try:
+        if use_db and astrometry is None:
+            astrometry = _worker_astrometry
+            if astrometry is None:
+                astrometry = astrometry_utils.AstrometryDB()
+            elif isinstance(astrometry, Exception):
+                raise astrometry
+        # The file is opened once and the same HDUList is used
+        # to select, apply and record all corrections. Only headers are
+        # read; pixel data is never loaded (see fitsupdate.write_update).
+        fobj = fits.open(fname, mode='update', memmap=True)
+        try:
+            fingerprint_pars = dict(corr_pars, use_db=use_db)
+            if skip_unchanged and not use_db:
+                fingerprint = utils.compute_fingerprint(fobj, fingerprint_pars)
+                result['skipped'] = fobj[0].header.get('UPWCSFP') == fingerprint
+            if not result['skipped']:
+                _apply_corrections(fobj, fname, corr_pars, astrometry, result)
+                fingerprint = utils.compute_fingerprint(fobj, fingerprint_pars)
+                after = 'UPWCSVER' if 'UPWCSVER' in fobj[0].header else None
+                fobj[0].header.set('UPWCSFP', fingerprint,
+                                   "Fingerprint of the inputs of updatewcs",
+                                   after=after)
+        except Exception:
+            fitsupdate.discard_update(fobj)
+            raise
+        if result['skipped']:
+            logger.info("\n\t%s is unchanged since the last update, skipped" % fname)
+            fitsupdate.discard_update(fobj)
+        else:
+            result['write'] = fitsupdate.write_update(fobj, padding=header_padding)
+    except Exception as e:
+        if not isolate:
+            raise
+        result['error'] = "{0}: {1}".format(e.__class__.__name__, e)
+    result['elapsed'] = time.time() - start
+    instrumentation.emit('file', file=fname, corrections=result['corrections'],
+                         write=result['write'], skipped=result['skipped'],
+                         error=result['error'], wall=result['elapsed'])
+    return result
+
+
+def _apply_corrections(fobj, fname, corr_pars, astrometry, result):
+    """
+    Select and apply the corrections to an HDUList opened by `_update_file`.
+    New astrometric solutions are added if ``astrometry`` (an AstrometryDB)
+    is not None.
+    """
+    with instrumentation.stage('setCorrections', filename=fname):
+        acorr = apply_corrections.setCorrections(fobj, **corr_pars)
+    if 'MakeWCS' in acorr and newIDCTAB(fobj):
+        logger.warning("\n\tNew IDCTAB file detected. All current WCSs will be deleted")
+        cleanWCS(fobj)
 
-def makecorr(fname, allowed_corr):
+    makecorr(fobj, acorr)
+    result['corrections'] = list(acorr)
+
+    if astrometry is not None:
+        # Add any new astrometry solutions available from
+        #  an accessible astrometry web-service
+        with instrumentation.stage('astrometry', filename=fname):
+            astrometry.updateObs(fname, fileobj=fobj)
+
+
+def makecorr(fname, allowed_corr, header_padding=0):
     """
     Purpose
     =======
     Applies corrections to the WCS of a single file
 
     :Parameters:
-    `fname`: string
-             file name
+    `fname`: string or `astropy.io.fits.HDUList`
+             file name or a file opened in 'update' mode;
+             an HDUList is not closed
     `acorr`: list
              list of corrections to be applied
+    `header_padding`: int
+             number of header blocks reserved if the file is rewritten;
+             used only when `fname` is a file name
     """
     logger.info("Allowed corrections: {0}".format(allowed_corr))
-    f = fits.open(fname, mode='update')
+    if isinstance(fname, fits.HDUList):
+        f = fname
+    else:
+        f = fits.open(fname, mode='update', memmap=True)
+    # Read all headers; pixel data is not loaded.
     f.readall()
     # Determine the reference chip and create the reference HSTWCS object
     nrefchip, nrefext = getNrefchip(f)
@@ -145,8 +358,10 @@ def makecorr(fname, allowed_corr):
     rwcs = wcsutil.HSTWCS(fobj=f, ext=nrefext)
     rwcs.readModel(update=True, header=f[nrefext].header)
 
+    filename = f.filename()
     if 'DET2IMCorr' in allowed_corr:
-        kw2update = det2im.DET2IMCorr.updateWCS(f)
+        with instrumentation.stage('DET2IMCorr', filename=filename):
+            kw2update = det2im.DET2IMCorr.updateWCS(f)
         for kw in kw2update:
             f[1].header[kw] = kw2update[kw]
 
@@ -160,7 +375,7 @@ def makecorr(fname, allowed_corr):
                 wcsutil.restoreWCS(f, ext=i, wcskey='O')
                 log.setLevel(default_log_level)
                 sciextver = extn.header['extver']
-                ref_wcs = rwcs.deepcopy()
+                ref_wcs = rwcs.linear_copy()
                 hdr = extn.header
                 ext_wcs = wcsutil.HSTWCS(fobj=f, ext=i)
                 # check if it exists first!!!
@@ -168,10 +383,19 @@ def makecorr(fname, allowed_corr):
                 wcsutil.archiveWCS(f, ext=i, wcskey="O", wcsname="OPUS", reusekey=True)
 
                 ext_wcs.readModel(update=True, header=hdr)
+                if 'CompSIP' in allowed_corr:
+                    # inverse SIP coefficients of a previous run are invalid
+                    for kw in corrections.CompInvSIP.keywords:
+                        try:
+                            del hdr[kw]
+                        except KeyError:
+                            pass
                 for c in allowed_corr:
                     if c != 'NPOLCorr' and c != 'DET2IMCorr':
                         corr_klass = corrections.__getattribute__(c)
-                        kw2update = corr_klass.updateWCS(ext_wcs, ref_wcs)
+                        with instrumentation.stage(c, filename=filename, extname='SCI',
+                                                   extver=sciextver):
+                            kw2update = corr_klass.updateWCS(ext_wcs, ref_wcs)
                         for kw in kw2update:
                             hdr[kw] = kw2update[kw]
                 # give the primary WCS a WCSNAME value
@@ -193,7 +417,8 @@ def makecorr(fname, allowed_corr):
                 continue
 
     if 'NPOLCorr' in allowed_corr:
-        kw2update = npol.NPOLCorr.updateWCS(f)
+        with instrumentation.stage('NPOLCorr', filename=filename):
+            kw2update = npol.NPOLCorr.updateWCS(f)
         for kw in kw2update:
             f[1].header[kw] = kw2update[kw]
     # Finally record the version of the software which updated the WCS
@@ -228,7 +453,8 @@ def makecorr(fname, allowed_corr):
     f[0].header['SIPNAME'] = distdict['SIPNAME']
     # Make sure NEXTEND keyword remains accurate
     f[0].header['NEXTEND'] = len(f) - 1
-    f.close()
+    if f is not fname:
+        fitsupdate.write_update(f, padding=header_padding)
 
 
 def copyWCS(w, ehdr):
@@ -370,13 +596,20 @@ def checkFiles(input):
 
 def newIDCTAB(fname):
     # When this is called we know there's a kw IDCTAB in the header
-    hdul = fits.open(fname)
-    idctab = fileutil.osfn(hdul[0].header['IDCTAB'])
+    # fname may be a file name or an open HDUList
+    if isinstance(fname, fits.HDUList):
+        hdul = fname
+    else:
+        hdul = fits.open(fname)
     try:
+        idctab = fileutil.osfn(hdul[0].header['IDCTAB'])
         # check for the presence of IDCTAB in the first extension
         oldidctab = fileutil.osfn(hdul[1].header['IDCTAB'])
     except KeyError:
         return False
+    finally:
+        if hdul is not fname:
+            hdul.close()
     if idctab == oldidctab:
         return False
     else:
@@ -386,7 +619,11 @@ def newIDCTAB(fname):
 def cleanWCS(fname):
     # A new IDCTAB means all previously computed WCS's are invalid
     # We are deleting all of them except the original OPUS WCS.
-    f = fits.open(fname, mode='update')
+    # fname may be a file name or an HDUList opened in 'update' mode
+    if isinstance(fname, fits.HDUList):
+        f = fname
+    else:
+        f = fits.open(fname, mode='update')
     keys = wcsutil.wcskeys(f[1].header)
     # Remove the primary WCS from the list
     try:
@@ -396,10 +633,12 @@ def cleanWCS(fname):
     fext = list(range(1, len(f)))
     for key in keys:
         try:
-            wcsutil.deleteWCS(fname, ext=fext, wcskey=key)
+            wcsutil.deleteWCS(f, ext=fext, wcskey=key)
         except KeyError:
             # Some extensions don't have the alternate (or any) WCS keywords
             continue
+    if f is not fname:
+        f.close()
 
 
 def getCorrections(instrument):
@@ -3,6 +3,7 @@ from astropy.io import fits
 from stsci.tools import fileutil
 from . import utils
 from . import wfpc2_dgeo
+from . import refcache
 
 import logging
 logger = logging.getLogger("stwcs.updatewcs.apply_corrections")
@@ -13,29 +14,56 @@ logger = logging.getLogger("stwcs.updatewcs.apply_corrections")
 # A dictionary which lists the allowed corrections for each instrument.
 # These are the default corrections applied also in the pipeline.
 
-allowed_corrections = {'WFPC2': ['DET2IMCorr', 'MakeWCS', 'CompSIP', 'VACorr'],
-                       'ACS': ['DET2IMCorr', 'TDDCorr', 'MakeWCS', 'CompSIP', 'VACorr', 'NPOLCorr'],
-                       'STIS': ['MakeWCS', 'CompSIP', 'VACorr'],
-                       'NICMOS': ['MakeWCS', 'CompSIP', 'VACorr'],
-                       'WFC3': ['DET2IMCorr', 'MakeWCS', 'CompSIP', 'VACorr', 'NPOLCorr'],
+allowed_corrections = {'WFPC2': ['DET2IMCorr', 'MakeWCS', 'CompSIP', 'CompInvSIP', 'VACorr'],
+                       'ACS': ['DET2IMCorr', 'TDDCorr', 'MakeWCS', 'CompSIP', 'CompInvSIP', 'VACorr', 'NPOLCorr'],
+                       'STIS': ['MakeWCS', 'CompSIP', 'CompInvSIP', 'VACorr'],
+                       'NICMOS': ['MakeWCS', 'CompSIP', 'CompInvSIP', 'VACorr'],
+                       'WFC3': ['DET2IMCorr', 'MakeWCS', 'CompSIP', 'CompInvSIP', 'VACorr', 'NPOLCorr'],
                        }
 
 cnames = {'DET2IMCorr': 'Detector to Image Correction',
           'TDDCorr': 'Time Dependent Distortion Correction',
           'MakeWCS': 'Recalculate basic WCS keywords based on the distortion model',
           'CompSIP': 'Given IDCTAB distortion model calculate the SIP coefficients',
+          'CompInvSIP': 'Fit inverse SIP coefficients to the SIP coefficients',
           'VACorr': 'Velocity Aberration Correction',
           'NPOLCorr': 'Lookup Table Distortion'
           }
 
 
-def setCorrections(fname, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True):
+def _getheader(fname, ext=0):
+    """
+    Return a header of a science file given as a file name
+    or as an already open `~astropy.io.fits.HDUList`.
+    """
+    if isinstance(fname, fits.HDUList):
+        return fname[ext].header
+    return fits.getheader(fname, ext=ext)
+
+
+def _getval(fname, keyword, ext=0):
+    return _getheader(fname, ext=ext)[keyword]
+
+
+def _filename(fname):
+    if isinstance(fname, fits.HDUList):
+        return fname.filename()
+    return fname
+
+
+def setCorrections(fname, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=True,
+                   invsip=False):
     """
     Creates a list of corrections to be applied to a file
     based on user input paramters and allowed corrections
     for the instrument.
+
+    ``fname`` is a file name or an `~astropy.io.fits.HDUList` opened in
+    'update' mode. When an HDUList is passed, headers are read from it and
+    distortion extensions which are no longer valid are removed from it,
+    so the file is not opened again.
     """
-    instrument = fits.getval(fname, 'INSTRUME')
+    instrument = _getval(fname, 'INSTRUME')
     # make a copy of this list
     acorr = allowed_corrections[instrument][:]
 
@@ -43,7 +71,10 @@ def setCorrections(fname, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=Tru
     # converted on-the-fly into a proper D2IMFILE here...
     if instrument == 'WFPC2':
         # check for DGEOFILE, and convert it to D2IMFILE if found
-        d2imfile = wfpc2_dgeo.update_wfpc2_d2geofile(fname)
+        if isinstance(fname, fits.HDUList):
+            d2imfile = wfpc2_dgeo.update_wfpc2_d2geofile(fname.filename(), fhdu=fname)
+        else:
+            d2imfile = wfpc2_dgeo.update_wfpc2_d2geofile(fname)
     # Check if idctab is present on disk
     # If kw IDCTAB is present in the header but the file is
     # not found on disk, do not run TDDCorr, MakeCWS and CompSIP
@@ -51,9 +82,12 @@ def setCorrections(fname, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=Tru
         if 'TDDCorr' in acorr: acorr.remove('TDDCorr')
         if 'MakeWCS' in acorr: acorr.remove('MakeWCS')
         if 'CompSIP' in acorr: acorr.remove('CompSIP')
+        if 'CompInvSIP' in acorr: acorr.remove('CompInvSIP')
 
     if 'VACorr' in acorr and not vacorr:
         acorr.remove('VACorr')
+    if 'CompInvSIP' in acorr and not invsip:
+        acorr.remove('CompInvSIP')
     if 'TDDCorr' in acorr:
         tddcorr = applyTDDCorr(fname, tddcorr)
         if not tddcorr:
@@ -67,7 +101,7 @@ def setCorrections(fname, vacorr=True, tddcorr=True, npolcorr=True, d2imcorr=Tru
         d2imcorr = apply_d2im_correction(fname, d2imcorr)
         if not d2imcorr:
             acorr.remove('DET2IMCorr')
-    logger.info("Corrections to be applied to {0} {1}".format(fname, acorr))
+    logger.info("Corrections to be applied to {0} {1}".format(_filename(fname), acorr))
     return acorr
 
 
@@ -87,7 +121,7 @@ def foundIDCTAB(fname):
     """
 
     try:
-        idctab = fits.getval(fname, 'IDCTAB').strip()
+        idctab = _getval(fname, 'IDCTAB').strip()
         if idctab == 'N/A' or idctab == "":
             return False
     except KeyError:
@@ -108,7 +142,7 @@ def applyTDDCorr(fname, utddcorr):
     - the idc table specified in the primary header is available.
     """
 
-    phdr = fits.getheader(fname)
+    phdr = _getheader(fname)
     instrument = phdr['INSTRUME']
     try:
         detector = phdr['DETECTOR']
@@ -149,7 +183,7 @@ def applyNpolCorr(fname, unpolcorr):
     applyNPOLCorr = True
     try:
         # get NPOLFILE kw from primary header
-        fnpol0 = fits.getval(fname, 'NPOLFILE')
+        fnpol0 = _getval(fname, 'NPOLFILE')
         if fnpol0 == 'N/A':
             utils.remove_distortion(fname, "NPOLFILE")
             return False
@@ -161,7 +195,7 @@ def applyNpolCorr(fname, unpolcorr):
             raise IOError("NPOLFILE {0} not found".format(fnpol0))
         try:
             # get NPOLEXT kw from first extension header
-            fnpol1 = fits.getval(fname, 'NPOLEXT', ext=1)
+            fnpol1 = _getval(fname, 'NPOLEXT', ext=1)
             fnpol1 = fileutil.osfn(fnpol1)
             if fnpol1 and fileutil.findFile(fnpol1):
                 if fnpol0 != fnpol1:
@@ -194,8 +228,8 @@ def isOldStyleDGEO(fname, dgname):
     # checks if the file defined in a NPOLFILE kw is a full size
     # (old style) image
 
-    sci_hdr = fits.getheader(fname, ext=1)
-    dgeo_hdr = fits.getheader(dgname, ext=1)
+    sci_hdr = _getheader(fname, ext=1)
+    dgeo_hdr = refcache.lookup_table_cache.open(dgname, 'NPOLFILE')[1].header
     sci_naxis1 = sci_hdr['NAXIS1']
     sci_naxis2 = sci_hdr['NAXIS2']
     dg_naxis1 = dgeo_hdr['NAXIS1']
@@ -215,8 +249,8 @@ def apply_d2im_correction(fname, d2imcorr):
 
     Parameters
     ----------
-    fname : str
-        Science file name.
+    fname : str or `~astropy.io.fits.HDUList`
+        Science file name or science file opened in 'update' mode.
     d2imcorr : bool
         Flag indicating if D2IM is should be enabled if allowed.
 
@@ -238,7 +272,7 @@ def apply_d2im_correction(fname, d2imcorr):
         return False
     # get D2IMFILE kw from primary header
     try:
-        fd2im0 = fits.getval(fname, 'D2IMFILE')
+        fd2im0 = _getval(fname, 'D2IMFILE')
     except KeyError:
         logger.info("D2IMFILE keyword is missing - D2IM correction will not be applied.")
         return False
@@ -252,7 +286,7 @@ def apply_d2im_correction(fname, d2imcorr):
         raise IOError(message)
     try:
         # get D2IMEXT kw from first extension header
-        fd2imext = fits.getval(fname, 'D2IMEXT', ext=1)
+        fd2imext = _getval(fname, 'D2IMEXT', ext=1)
 
     except KeyError:
         # the case of D2IMFILE kw present in primary header but D2IMEXT missing
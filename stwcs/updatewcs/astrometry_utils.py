@@ -139,7 +139,7 @@ class AstrometryDB(object):
         # Initialize attribute to keep track of type of observation
         self.new_observation = False
 
-    def updateObs(self, obsname):
+    def updateObs(self, obsname, fileobj=None):
         """Update observation with any available solutions.
 
         Parameters
@@ -147,6 +147,10 @@ class AstrometryDB(object):
         obsname : str
            Filename for observation to be updated
 
+        fileobj : `astropy.io.fits.HDUList`, optional
+           Observation already opened in 'update' mode.
+           If provided, it is updated in place and not closed.
+
         """
         if not self.perform_step:
             return
@@ -159,7 +163,9 @@ class AstrometryDB(object):
         logger.info("Updating astrometry for {}".format(observationID))
         #
         # apply to file...
-        fileobj = pf.open(obsname, mode='update')
+        close_fileobj = fileobj is None
+        if close_fileobj:
+            fileobj = pf.open(obsname, mode='update')
 
         # take inventory of what hdrlets are already appended to this file
         hdrnames = headerlet.get_headerlet_kw_names(fileobj, 'hdrname')
@@ -211,7 +217,8 @@ class AstrometryDB(object):
                 except ValueError:
                     pass
 
-        fileobj.close()
+        if close_fileobj:
+            fileobj.close()
 
     def findObservation(self, observationID):
         """Find whether there are any entries in the AstrometryDB for
@@ -1,11 +1,11 @@
 import copy
-import datetime
 import logging
 import time
 import numpy as np
 from numpy import linalg
 from stsci.tools import fileutil
 
+from ..distortion import coeff_converter
 from . import npol
 from . import makewcs
 from .utils import diff_angles
@@ -15,6 +15,36 @@ logger = logging.getLogger('stwcs.updatewcs.corrections')
 MakeWCS = makewcs.MakeWCS
 NPOLCorr = npol.NPOLCorr
 
+# Rotation between the frame of the TDD model and the V2/V3 frame
+TDD_THETA_V2V3 = 2.234529
+TDD_MROTP = fileutil.buildRotMatrix(TDD_THETA_V2V3)
+TDD_MROTN = fileutil.buildRotMatrix(-TDD_THETA_V2V3)
+
+
+def decimal_year(date_obs):
+    """
+    Convert observation dates to decimal years as used by the TDD models.
+
+    Parameters
+    ----------
+    date_obs : float, str or array_like
+        Decimal years or 'YYYY-MM-DD' strings.
+
+    Returns
+    -------
+    rday : float or ndarray
+        ``day_of_year / 365.25 + year``
+    """
+    dates = np.asarray(date_obs)
+    if dates.dtype.kind in 'fiu':
+        rday = dates.astype(np.float64)
+    else:
+        days = dates.astype('datetime64[D]')
+        years = days.astype('datetime64[Y]')
+        doy = (days - years).astype(np.int64) + 1
+        rday = doy / 365.25 + (years.astype(np.int64) + 1970)
+    return rday[()] if rday.ndim == 0 else rday
+
 
 class TDDCorr(object):
     """
@@ -120,12 +150,7 @@ class TDDCorr(object):
         """ Applies 2015-calibrated TDD correction to a couple of IDCTAB
             coefficients for ACS/WFC observations.
         """
-        if not isinstance(hwcs.date_obs, float):
-            year, month, day = hwcs.date_obs.split('-')
-            rdate = datetime.datetime(int(year), int(month), int(day))
-            rday = float(rdate.strftime("%j")) / 365.25 + rdate.year
-        else:
-            rday = hwcs.date_obs
+        rday = decimal_year(hwcs.date_obs)
 
         skew_coeffs = hwcs.idcmodel.refpix['skew_coeffs']
         delta_date = rday - skew_coeffs['TDD_DATE']
@@ -143,12 +168,7 @@ class TDDCorr(object):
         """ Applies 2014-calibrated TDD correction to single IDCTAB coefficient
             of an ACS/WFC observation.
         """
-        if not isinstance(hwcs.date_obs, float):
-            year, month, day = hwcs.date_obs.split('-')
-            rdate = datetime.datetime(int(year), int(month), int(day))
-            rday = float(rdate.strftime("%j")) / 365.25 + rdate.year
-        else:
-            rday = hwcs.date_obs
+        rday = decimal_year(hwcs.date_obs)
 
         skew_coeffs = hwcs.idcmodel.refpix['skew_coeffs']
         cy_beta = skew_coeffs['TDD_CY_BETA']
@@ -180,13 +200,7 @@ class TDDCorr(object):
         Applies TDD to the idctab coefficients of a ACS/WFC observation.
         This should be always the first correction.
         """
-        theta_v2v3 = 2.234529
-        mrotp = fileutil.buildRotMatrix(theta_v2v3)
-        mrotn = fileutil.buildRotMatrix(-theta_v2v3)
-        tdd_mat = np.array([[1 + (beta / 2048.), alpha / 2048.],
-                            [alpha / 2048., 1 - (beta / 2048.)]], np.float64)
-        abmat1 = np.dot(tdd_mat, mrotn)
-        abmat2 = np.dot(mrotp, abmat1)
+        abmat2 = cls.tdd_matrix(alpha, beta)
         xshape, yshape = hwcs.idcmodel.cx.shape, hwcs.idcmodel.cy.shape
         icxy = np.dot(abmat2, [hwcs.idcmodel.cx.ravel(), hwcs.idcmodel.cy.ravel()])
         hwcs.idcmodel.cx = icxy[0]
@@ -211,17 +225,31 @@ class TDDCorr(object):
         alpha = 0.095 + 0.090*(rday-dday)/2.5
         beta = -0.029 - 0.030*(rday-dday)/2.5
         """
-        if not isinstance(ext_wcs.date_obs, float):
-            year, month, day = ext_wcs.date_obs.split('-')
-            rdate = datetime.datetime(int(year), int(month), int(day))
-            rday = float(rdate.strftime("%j")) / 365.25 + rdate.year
-        else:
-            rday = ext_wcs.date_obs
+        rday = decimal_year(ext_wcs.date_obs)
 
-        skew_coeffs = ext_wcs.idcmodel.refpix['skew_coeffs']
+        return cls.skew_terms(ext_wcs.idcmodel.refpix['skew_coeffs'], rday)
+    compute_alpha_beta = classmethod(compute_alpha_beta)
+
+    def skew_terms(cls, skew_coeffs, rday):
+        """
+        Compute the TDD skew terms alpha and beta.
+
+        Parameters
+        ----------
+        skew_coeffs : dict or None
+            TDD coefficients read from the IDCTAB (``refpix['skew_coeffs']``
+            of an `~stwcs.distortion.models.IDCModel`). If None, the
+            pre-SM4 coefficients are used.
+        rday : float or ndarray
+            Observation dates as decimal years.
+
+        Returns
+        -------
+        alpha, beta : float or ndarray
+        """
         if skew_coeffs is None:
             # Only print out warning for post-SM4 data where this may matter
-            if rday > 2009.0:
+            if np.any(rday > 2009.0):
                 err_str = "------------------------------------------------------------------------  \n"
                 err_str += "WARNING: the IDCTAB geometric distortion file specified in the image      \n"
                 err_str += "         header did not have the time-dependent distortion coefficients.  \n"
@@ -243,7 +271,75 @@ class TDDCorr(object):
             beta += skew_coeffs['TDD_B'][c] * np.power((rday - skew_coeffs['TDD_DATE']), c)
 
         return alpha, beta
-    compute_alpha_beta = classmethod(compute_alpha_beta)
+    skew_terms = classmethod(skew_terms)
+
+    def tdd_matrix(cls, alpha, beta):
+        """
+        Matrix which applies the TDD skew terms to IDCTAB coefficients
+        in the V2/V3 frame.
+
+        ``alpha`` and ``beta`` may be arrays, in which case the result has
+        shape ``alpha.shape + (2, 2)``.
+        """
+        alpha = np.asarray(alpha, dtype=np.float64)
+        beta = np.asarray(beta, dtype=np.float64)
+        tdd_mat = np.empty(alpha.shape + (2, 2), dtype=np.float64)
+        tdd_mat[..., 0, 0] = 1 + (beta / 2048.)
+        tdd_mat[..., 0, 1] = alpha / 2048.
+        tdd_mat[..., 1, 0] = alpha / 2048.
+        tdd_mat[..., 1, 1] = 1 - (beta / 2048.)
+        return np.matmul(TDD_MROTP, np.matmul(tdd_mat, TDD_MROTN))
+    tdd_matrix = classmethod(tdd_matrix)
+
+    def tdd_coeffs(cls, idcmodel, dates):
+        """
+        Apply the TDD correction to the IDCTAB coefficients of a chip
+        for many observation dates at once.
+
+        Parameters
+        ----------
+        idcmodel : `~stwcs.distortion.models.IDCModel`
+            Distortion model of the chip, without TDD correction.
+        dates : array_like
+            Observation dates as decimal years or 'YYYY-MM-DD' strings.
+
+        Returns
+        -------
+        cx, cy : ndarray
+            Corrected coefficients with shape ``(len(dates),) + idcmodel.cx.shape``.
+        """
+        rday = np.atleast_1d(decimal_year(dates)).ravel()
+        skew_coeffs = idcmodel.refpix['skew_coeffs']
+        cx = np.repeat(np.asarray(idcmodel.cx, dtype=np.float64)[np.newaxis], rday.size, axis=0)
+        cy = np.repeat(np.asarray(idcmodel.cy, dtype=np.float64)[np.newaxis], rday.size, axis=0)
+
+        if skew_coeffs is not None and skew_coeffs['TDD_CTB'] is not None:
+            delta_date = rday - skew_coeffs['TDD_DATE']
+            if skew_coeffs['TDD_CXB'] is not None:
+                cx[:, 1, 1] += skew_coeffs['TDD_CXB'] * delta_date
+            if skew_coeffs['TDD_CTB'] is not None:
+                cy[:, 1, 1] += skew_coeffs['TDD_CTB'] * delta_date
+            if skew_coeffs['TDD_CYB'] is not None:
+                cy[:, 1, 0] += skew_coeffs['TDD_CYB'] * delta_date
+
+        elif skew_coeffs is not None and skew_coeffs['TDD_CY_BETA'] is not None:
+            delta_date = rday - skew_coeffs['TDD_DATE']
+            cy_alpha = skew_coeffs['TDD_CY_ALPHA']
+            if cy_alpha is None:
+                cy[:, 1, 1] += skew_coeffs['TDD_CY_BETA'] * delta_date
+            else:
+                cy[:, 1, 1] = cy_alpha + skew_coeffs['TDD_CY_BETA'] * delta_date
+            cx_alpha = skew_coeffs['TDD_CX_ALPHA']
+            if cx_alpha is not None:
+                cx[:, 1, 1] = cx_alpha + skew_coeffs['TDD_CX_BETA'] * delta_date
+
+        else:
+            alpha, beta = cls.skew_terms(skew_coeffs, rday)
+            abmat = cls.tdd_matrix(alpha, beta)[:, :, :, np.newaxis, np.newaxis]
+            cx, cy = (abmat[:, 0, 0] * cx + abmat[:, 0, 1] * cy,
+                      abmat[:, 1, 0] * cx + abmat[:, 1, 1] * cy)
+        return cx, cy
+    tdd_coeffs = classmethod(tdd_coeffs)
 
 
 class VACorr(object):
@@ -304,6 +400,23 @@ class CompSIP(object):
         kw2update['B_ORDER'] = order
         # pscale = ext_wcs.idcmodel.refpix['PSCALE']
 
+        akeys, bkeys = cls.sip_coeffs(ext_wcs)
+        for n in range(2, order + 1):
+            for m in range(n + 1):
+                kw2update["A_%d_%d" % (m, n - m)] = akeys[m, n - m]
+                kw2update["B_%d_%d" % (m, n - m)] = bkeys[m, n - m]
+        kw2update['CTYPE1'] = 'RA---TAN-SIP'
+        kw2update['CTYPE2'] = 'DEC--TAN-SIP'
+        return kw2update
+
+    updateWCS = classmethod(updateWCS)
+
+    def sip_coeffs(cls, ext_wcs):
+        """
+        Return the SIP coefficients ``a, b`` computed from the IDC model of
+        ``ext_wcs``, including the binning factor.
+        """
+        order = ext_wcs.idcmodel.norder
         cx = ext_wcs.idcmodel.cx
         cy = ext_wcs.idcmodel.cy
 
@@ -316,14 +429,51 @@ class CompSIP(object):
                 if n >= m and n >= 2:
                     idcval = np.array([[cx[n, m]], [cy[n, m]]])
                     sipval = np.dot(imatr, idcval)
-                    akeys1[m, n - m] = sipval[0]
-                    bkeys1[m, n - m] = sipval[1]
-                    Akey = "A_%d_%d" % (m, n - m)
-                    Bkey = "B_%d_%d" % (m, n - m)
-                    kw2update[Akey] = sipval[0, 0] * ext_wcs.binned
-                    kw2update[Bkey] = sipval[1, 0] * ext_wcs.binned
-        kw2update['CTYPE1'] = 'RA---TAN-SIP'
-        kw2update['CTYPE2'] = 'DEC--TAN-SIP'
+                    akeys1[m, n - m] = sipval[0, 0] * ext_wcs.binned
+                    bkeys1[m, n - m] = sipval[1, 0] * ext_wcs.binned
+        return akeys1, bkeys1
+
+    sip_coeffs = classmethod(sip_coeffs)
+
+
+class CompInvSIP(object):
+    """
+    Fit inverse SIP polynomials (AP, BP) to the SIP coefficients computed
+    by `CompSIP`.
+
+    The order of the polynomials is chosen so that the largest residual of
+    the inverse on a grid covering the image is smaller than `max_error`
+    pixels (see `~stwcs.distortion.coeff_converter.fit_inverse_sip`). The
+    largest and RMS residuals are saved in the APBP_MAX and APBP_RMS
+    keywords. `~stwcs.wcsutil.HSTWCS.all_world2pix` uses the inverse
+    polynomials as a starting point, or as the solution when the residual
+    is smaller than the requested accuracy.
+    """
+    max_error = 1e-3
+    max_order = 9
+    keywords = ['AP_*', 'BP_*', 'APBP_MAX', 'APBP_RMS']
+
+    def updateWCS(cls, ext_wcs, ref_wcs):
+        logger.info("Starting CompInvSIP: {0}".format(time.asctime()))
+        kw2update = {}
+        if not ext_wcs.idcmodel:
+            logger.info("IDC model not found, inverse SIP coefficients will not be computed.")
+            return kw2update
+        a, b = CompSIP.sip_coeffs(ext_wcs)
+        ap, bp, max_residual, rms_residual = coeff_converter.fit_inverse_sip(
+            a, b, ext_wcs.wcs.crpix, (ext_wcs.naxis1, ext_wcs.naxis2),
+            max_error=cls.max_error, max_order=cls.max_order)
+        logger.info("Inverse SIP of order {0}: max. residual {1}, rms {2}".format(
+            ap.shape[0] - 1, max_residual, rms_residual))
+        order = ap.shape[0] - 1
+        kw2update['AP_ORDER'] = order
+        kw2update['BP_ORDER'] = order
+        for n in range(order + 1):
+            for m in range(n + 1):
+                kw2update["AP_%d_%d" % (m, n - m)] = ap[m, n - m]
+                kw2update["BP_%d_%d" % (m, n - m)] = bp[m, n - m]
+        kw2update['APBP_MAX'] = max_residual
+        kw2update['APBP_RMS'] = rms_residual
         return kw2update
 
     updateWCS = classmethod(updateWCS)
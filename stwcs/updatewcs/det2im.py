@@ -1,6 +1,8 @@
 from astropy.io import fits
 from stsci.tools import fileutil
 
+from . import refcache
+
 import logging
 import time
 logger = logging.getLogger('stwcs.updatewcs.d2im')
@@ -157,7 +159,7 @@ class DET2IMCorr(object):
         Make sure 'CCDCHIP' in the npolfile matches "CCDCHIP' in the science file.
         """
         xdata, ydata = (None, None)
-        d2im = fits.open(d2imfile)
+        d2im = refcache.lookup_table_cache.open(d2imfile, 'D2IMFILE')
         for ext in d2im:
             d2imextname  = ext.header.get('EXTNAME', "")
             d2imccdchip  = ext.header.get('CCDCHIP', 1)
@@ -169,7 +171,6 @@ class DET2IMCorr(object):
                 continue
             else:
                 continue
-        d2im.close()
         return xdata, ydata
     getData = classmethod(getData)
 
@@ -194,7 +195,7 @@ class DET2IMCorr(object):
         is such that a full size d2im table is created and then shifted or scaled
         if the science image is a subarray or binned image.
         """
-        d2im = fits.open(d2imfile)
+        d2im = refcache.lookup_table_cache.open(d2imfile, 'D2IMFILE')
         d2im_phdr = d2im[0].header
         for ext in d2im:
             try:
@@ -208,7 +209,6 @@ class DET2IMCorr(object):
                 break
             else:
                 continue
-        d2im.close()
 
         naxis = d2im[1].header['NAXIS']
         ccdchip = d2imextname
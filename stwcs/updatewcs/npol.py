@@ -6,6 +6,8 @@ from astropy.io import fits
 
 from stsci.tools import fileutil
 
+from . import refcache
+
 logger = logging.getLogger('stwcs.updatewcs.npol')
 
 
@@ -78,11 +80,8 @@ class NPOLCorr(object):
                 header = ext.header
                 # get the data arrays from the reference file and transform
                 # them for use with SIP
-                dx, dy = cls.getData(nplfile, ccdchip)
                 idccoeffs = cls.getIDCCoeffs(header)
-
-                if idccoeffs is not None:
-                    dx, dy = cls.transformData(dx, dy, idccoeffs)
+                dx, dy = cls.getTransformedData(nplfile, ccdchip, idccoeffs)
 
                 # Determine EXTVER for the WCSDVARR extension from the
                 # NPL file (EXTNAME, EXTVER) kw.
@@ -169,7 +168,7 @@ class NPOLCorr(object):
         Get the data arrays from the reference NPOL files
         Make sure 'CCDCHIP' in the npolfile matches "CCDCHIP' in the science file.
         """
-        npl = fits.open(nplfile)
+        npl = refcache.lookup_table_cache.open(nplfile, 'NPOLFILE')
         for ext in npl:
             nplextname  = ext.header.get('EXTNAME', "")
             nplccdchip  = ext.header.get('CCDCHIP', 1)
@@ -181,10 +180,31 @@ class NPOLCorr(object):
                 continue
             else:
                 continue
-        npl.close()
         return xdata, ydata
     getData = classmethod(getData)
 
+    def getTransformedData(cls, nplfile, ccdchip, coeffs):
+        """
+        Return the NPOL data arrays for a chip transformed with the matrix
+        of IDC coefficients ``coeffs`` (see `getIDCCoeffs`). If ``coeffs``
+        is None the arrays are not transformed.
+
+        The result is cached per NPOLFILE, chip and coefficients in
+        `refcache.lookup_table_cache`.
+        """
+        if coeffs is None:
+            return refcache.lookup_table_cache.memoize(
+                nplfile, ('NPOL', ccdchip, None),
+                lambda: cls.getData(nplfile, ccdchip))
+
+        def transformed():
+            dx, dy = cls.getData(nplfile, ccdchip)
+            return cls.transformData(dx, dy, coeffs)
+        key = ('NPOL', ccdchip, tuple(coeffs.ravel().tolist()))
+        return refcache.lookup_table_cache.memoize(nplfile, key, transformed)
+
+    getTransformedData = classmethod(getTransformedData)
+
     def transformData(cls, dx, dy, coeffs):
         """
         Transform the NPOL data arrays for use with SIP
@@ -240,7 +260,7 @@ class NPOLCorr(object):
         i ssuch that a full size npol table is created and then shifted or scaled
         if the science image is a subarray or binned image.
         """
-        npl = fits.open(npolfile)
+        npl = refcache.lookup_table_cache.open(npolfile, 'NPOLFILE')
         npol_phdr = npl[0].header
         for ext in npl:
             try:
@@ -254,7 +274,6 @@ class NPOLCorr(object):
                 break
             else:
                 continue
-        npl.close()
 
         naxis = npl[1].header['NAXIS']
         ccdchip = nplextname  # npol_header['CCDCHIP']
@@ -0,0 +1,170 @@
+"""
+Cache of the lookup table reference files (NPOLFILE, D2IMFILE).
+
+`NPOLCorr` and `DET2IMCorr` read the reference file several times for each
+science extension (data arrays and the header of each lookup table) and
+the NPOL tables are transformed with the first order IDC coefficients
+of the chip. When a batch of files uses the same reference files, the
+files are read and the tables transformed once per process.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from astropy.io import fits
+from stsci.tools import fileutil
+
+from .. import instrumentation
+
+__all__ = ['LookupTableCache', 'lookup_table_cache']
+
+
+class LookupTableCache(object):
+    """
+    Bounded LRU cache of lookup table reference files and of arrays derived
+    from them.
+
+    Reference files are opened read-only with memory mapping and are kept
+    open while they are in the cache (astropy releases memory mapped data
+    when a file is closed); they are closed when they are evicted or the
+    cache is cleared. Entries are keyed by the resolved path and
+    modification time of the file, so replacing a reference file on disk
+    invalidates them.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of reference files kept in the cache. Up to
+        ``8 * maxsize`` derived products are kept. If ``maxsize <= 0``
+        derived products are not cached and only the last reference file
+        is kept, so that the HDULists returned by `open` are closed.
+    """
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._files = OrderedDict()
+        self._products = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._files)
+
+    def open(self, fname, kind=None):
+        """
+        Return the HDUList of a reference file.
+
+        The HDUList is shared; headers and data can be read but the
+        HDUList must not be modified or closed. It is closed by the cache
+        when it is evicted, so it should not be kept after other reference
+        files are opened.
+
+        Parameters
+        ----------
+        fname : str
+            File name; IRAF-style environment variables are expanded.
+        kind : str
+            Type of the reference file ('NPOLFILE' or 'D2IMFILE') used by
+            `stwcs.instrumentation` when the file is read.
+        """
+        sig = _file_signature(fname)
+        if sig is None:
+            # the file does not exist, let astropy raise the error
+            return self._read(fname, kind)
+        with self._lock:
+            hdulist = self._files.get(sig)
+            if hdulist is not None:
+                self._files.move_to_end(sig)
+                self.hits += 1
+                return hdulist
+            self.misses += 1
+        hdulist = self._read(sig[0], kind)
+        with self._lock:
+            old = self._files.pop(sig, None)
+            self._files[sig] = hdulist
+            evicted = [] if old is None else [old]
+            while len(self._files) > max(self.maxsize, 1):
+                evicted.append(self._files.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return hdulist
+
+    def memoize(self, fname, key, func):
+        """
+        Return ``func()`` computed once for a reference file and ``key``.
+
+        ``func`` returns a tuple of arrays (or None). Cached arrays are
+        read-only and copies are returned.
+        """
+        sig = _file_signature(fname)
+        if sig is None or self.maxsize <= 0:
+            return func()
+        key = (sig,) + tuple(key)
+        with self._lock:
+            if key in self._products:
+                self._products.move_to_end(key)
+                self.hits += 1
+                return _copy(self._products[key])
+            self.misses += 1
+        value = _readonly(func())
+        with self._lock:
+            self._products[key] = value
+            while len(self._products) > 8 * self.maxsize:
+                self._products.popitem(last=False)
+        return _copy(value)
+
+    def clear(self):
+        """ Remove all entries and reset the counters. """
+        with self._lock:
+            files = list(self._files.values())
+            self._files.clear()
+            self._products.clear()
+            self.hits = 0
+            self.misses = 0
+        for hdulist in files:
+            hdulist.close()
+
+    def info(self):
+        """ Return a dictionary with the cache statistics. """
+        return {'hits': self.hits, 'misses': self.misses,
+                'files': len(self._files), 'products': len(self._products),
+                'maxsize': self.maxsize}
+
+    @staticmethod
+    def _read(fname, kind):
+        hdulist = fits.open(fname, memmap=True)
+        if kind is not None:
+            instrumentation.ref_file_opened(fname, kind)
+        hdulist.readall()
+        return hdulist
+
+
+def _file_signature(fname):
+    path = os.path.abspath(fileutil.osfn(fname))
+    try:
+        return path, os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _readonly(value):
+    if value is None:
+        return None
+    arrays = []
+    for arr in value:
+        if arr is not None:
+            arr = np.array(arr)
+            arr.flags.writeable = False
+        arrays.append(arr)
+    return tuple(arrays)
+
+
+def _copy(value):
+    if value is None:
+        return None
+    return tuple(None if arr is None else arr.copy() for arr in value)
+
+
+# Process-wide cache used by NPOLCorr and DET2IMCorr
+lookup_table_cache = LookupTableCache()
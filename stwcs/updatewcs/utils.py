@@ -1,7 +1,14 @@
 import os
+import re
+import hashlib
+import threading
+
+import astropy
 from astropy.io import fits
 from stsci.tools import fileutil
 
+from .. import __version__
+
 import logging
 logger = logging.getLogger("stwcs.updatewcs.utils")
 
@@ -244,7 +251,18 @@ def build_d2imname(fobj, d2imfile=None):
 
 
 def remove_distortion(fname, dist_keyword):
-    logger.info("Removing distortion {0} from file {0}".format(dist_keyword, fname))
+    """
+    Remove a lookup table distortion and its extensions from a science file.
+
+    Parameters
+    ----------
+    fname : str or `~astropy.io.fits.HDUList`
+        Science file name or a science file opened in 'update' mode.
+        An HDUList is modified in place and is not closed.
+    dist_keyword : str
+        'NPOLFILE' or 'D2IMFILE'
+    """
+    logger.info("Removing distortion {0} from file {1}".format(dist_keyword, fname))
     from ..wcsutil import altwcs
     if dist_keyword == "NPOLFILE":
         extname = "WCSDVARR"
@@ -255,16 +273,127 @@ def remove_distortion(fname, dist_keyword):
     else:
         raise AttributeError("Unrecognized distortion keyword "
                              "{0} when attempting to remove distortion".format(dist_keyword))
-    ext_mapping = altwcs.mapFitsExt2HDUListInd(fname, "SCI").values()
-    f = fits.open(fname, mode="update")
+    if isinstance(fname, fits.HDUList):
+        f = fname
+    else:
+        f = fits.open(fname, mode="update")
+    ext_mapping = altwcs.mapFitsExt2HDUListInd(f, "SCI").values()
     for hdu in ext_mapping:
         for kw in keywords:
             try:
                 del f[hdu].header[kw]
             except KeyError:
                 pass
-    ext_mapping = list(altwcs.mapFitsExt2HDUListInd(fname, extname).values())
+    ext_mapping = list(altwcs.mapFitsExt2HDUListInd(f, extname).values())
     ext_mapping.sort()
     for hdu in ext_mapping[::-1]:
         del f[hdu]
-    f.close()
+    if f is not fname:
+        f.close()
+
+
+# Primary header keywords which determine the WCS computed by updatewcs
+FINGERPRINT_PRIMARY_KW = ['INSTRUME', 'DETECTOR', 'FILTER1', 'FILTER2', 'FILTER',
+                          'FILTNAM1', 'FILTNAM2', 'MODE', 'DATE-OBS', 'TIME-OBS',
+                          'EXPSTART', 'PA_V3', 'RA_TARG', 'DEC_TARG', 'TDDCORR',
+                          'IDCTAB', 'OFFTAB', 'NPOLFILE', 'D2IMFILE', 'DGEOFILE',
+                          'ODGEOFIL']
+# Reference files whose content is part of the fingerprint
+FINGERPRINT_REFFILE_KW = ['IDCTAB', 'OFFTAB', 'NPOLFILE', 'D2IMFILE', 'DGEOFILE',
+                          'ODGEOFIL']
+# SCI extension keywords; the 'O' WCS is the input of MakeWCS
+FINGERPRINT_SCI_KW = ['CCDCHIP', 'DETECTOR', 'CAMERA', 'NAXIS1', 'NAXIS2',
+                      'LTV1', 'LTV2', 'LTM1_1', 'LTM2_2', 'BINAXIS1', 'BINAXIS2',
+                      'VAFACTOR', 'WCSNAMEO', 'CTYPE1O', 'CTYPE2O', 'CRPIX1O',
+                      'CRPIX2O', 'CRVAL1O', 'CRVAL2O', 'CD1_1O', 'CD1_2O', 'CD2_1O',
+                      'CD2_2O', 'NPOLEXT', 'D2IMEXT']
+# Primary WCS of the SCI extensions, as written by updatewcs
+FINGERPRINT_WCS_KW = ['WCSNAME', 'CTYPE1', 'CTYPE2', 'CRPIX1', 'CRPIX2', 'CRVAL1',
+                      'CRVAL2', 'CD1_1', 'CD1_2', 'CD2_1', 'CD2_2', 'CPDIS1', 'CPDIS2',
+                      'D2IMDIS1', 'D2IMDIS2']
+# SIP keywords (A_ORDER, A_0_2, AP_ORDER...) of the SCI extensions
+FINGERPRINT_SIP_KW = re.compile(r'^(A|B|AP|BP)_(ORDER|DMAX|\d+_\d+)$')
+
+_checksums = {}
+_checksums_lock = threading.Lock()
+
+
+def file_checksum(fname):
+    """
+    Return the SHA1 checksum of a file or None if it does not exist.
+
+    Checksums are cached per process by path, size and modification time.
+    """
+    path = os.path.abspath(fileutil.osfn(fname))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_size, stat.st_mtime)
+    with _checksums_lock:
+        if key in _checksums:
+            return _checksums[key]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2880 * 1024), b''):
+            sha.update(chunk)
+    checksum = sha.hexdigest()
+    with _checksums_lock:
+        _checksums[key] = checksum
+    return checksum
+
+
+def compute_fingerprint(fobj, corr_pars):
+    """
+    Compute a fingerprint of the inputs which determine the WCS written
+    by updatewcs.
+
+    It includes the names and checksums of the reference files, the
+    primary and SCI header keywords used by the corrections, the
+    'O' WCS and the primary WCS and SIP keywords of each SCI extension,
+    the distortion extensions present in the file, the correction switches
+    and the versions of stwcs and astropy.
+
+    Parameters
+    ----------
+    fobj : `astropy.io.fits.HDUList`
+        science file
+    corr_pars : dict
+        correction switches passed to updatewcs ('vacorr', 'tddcorr',
+        'npolcorr', 'd2imcorr', 'invsip', 'use_db')
+
+    Returns
+    -------
+    fingerprint : str
+        SHA1 hex digest
+    """
+    phdr = fobj[0].header
+    items = [('UPWCSVER', __version__), ('PYWCSVER', astropy.__version__)]
+    items.extend(sorted((k, str(v)) for k, v in corr_pars.items()))
+    for kw in FINGERPRINT_PRIMARY_KW:
+        items.append((kw, str(phdr.get(kw))))
+    for kw in FINGERPRINT_REFFILE_KW:
+        fname = phdr.get(kw)
+        if isinstance(fname, str) and fname.strip() not in ['', 'N/A']:
+            items.append((kw + '_SHA1', file_checksum(fname.strip())))
+    for i, hdu in enumerate(fobj[1:], start=1):
+        extname = hdu.header.get('EXTNAME', '')
+        if extname in ['WCSDVARR', 'D2IMARR']:
+            items.append((i, extname, hdu.header.get('EXTVER')))
+        elif extname == 'SCI':
+            hdr = hdu.header
+            items.append((i, extname, hdr.get('EXTVER')))
+            items.extend((kw, str(hdr.get(kw))) for kw in FINGERPRINT_SCI_KW)
+            # These values are computed by updatewcs; the cards are compared
+            # as written in the file so that the fingerprint computed before
+            # saving the file matches the one computed after reading it.
+            items.extend(_card_image(hdr, kw) for kw in FINGERPRINT_WCS_KW)
+            items.extend(sorted(_card_image(hdr, kw) for kw in hdr
+                                if FINGERPRINT_SIP_KW.match(kw)))
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+def _card_image(hdr, kw):
+    if kw not in hdr:
+        return kw
+    return hdr.cards[kw].image
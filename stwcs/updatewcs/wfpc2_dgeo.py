@@ -10,6 +10,8 @@ import numpy as np
 
 from stsci.tools import fileutil
 
+from .. import instrumentation
+
 import logging
 logger = logging.getLogger("stwcs.updatewcs.apply_corrections")
 
@@ -73,6 +75,7 @@ def convert_dgeo_to_d2im(dgeofile, output, clobber=True):
     """ Routine that converts the WFPC2 DGEOFILE into a D2IMFILE.
     """
     dgeo = fileutil.openImage(dgeofile)
+    instrumentation.ref_file_opened(dgeofile, 'DGEOFILE')
     outname = output + '_d2im.fits'
 
     removeFileSafely(outname)
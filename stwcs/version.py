@@ -0,0 +1,4 @@
+__version__ = '1.4.1.dev'
+__version_commit__ = ''
+__version_date__ = ''
+__all__ = ['__version__', '__version_commit__', '__version_date__']
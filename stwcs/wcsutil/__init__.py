@@ -1,5 +1,6 @@
 from .altwcs import *
-from .hstwcs import HSTWCS
+from .hstwcs import HSTWCS, ParallelHSTWCS
+from .distgrid import DistortionGrid
 
 
 def help():
@@ -5,6 +5,8 @@ from astropy import wcs as pywcs
 from astropy.io import fits
 from stsci.tools import fileutil as fu
 
+from . import fitsupdate
+
 from astropy import log
 default_log_level = log.getEffectiveLevel()
 
@@ -22,7 +24,7 @@ altwcskw_extra = ['LATPOLE', 'LONPOLE', 'RESTWAV', 'RESTFRQ']
 # file operations
 
 
-def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
+def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False, padding=None):
     """
     Copy the primary WCS to the header as an alternate WCS
     with wcskey and name WCSNAME. It loops over all extensions in 'ext'
@@ -42,6 +44,11 @@ def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
         Name of alternate WCS description
     reusekey : boolean
         if True - overwrites a WCS with the same key
+    padding : int or None
+        If the file is opened by this function and padding is not None,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update` which
+        reserves ``padding`` blank header blocks; otherwise it is saved
+        by astropy.
 
     Examples
     --------
@@ -68,7 +75,7 @@ def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
         f = fname
 
     if not _parpasscheck(f, ext, wcskey, wcsname):
-        closefobj(fname, f)
+        closefobj(fname, f, padding)
         raise ValueError("Input parameters problem")
 
     # Interpret input 'ext' value to get list of extensions to process
@@ -84,7 +91,7 @@ def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
             pass
     wcsext = ext[0]
     if wcskey != " " and wcskey in wcskeys(f[wcsext].header) and not reusekey:
-        closefobj(fname, f)
+        closefobj(fname, f, padding)
         raise KeyError("Wcskey %s is aready used. \
         Run archiveWCS() with reusekey=True to overwrite this alternate WCS. \
         Alternatively choose another wcskey with altwcs.available_wcskeys()." % wcskey)
@@ -98,10 +105,10 @@ def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
                 if wkey == ' ':
                     wkey = next_wcskey(f[wcsext].header)
                 elif wkey is None:
-                    closefobj(fname, f)
+                    closefobj(fname, f, padding)
                     raise KeyError("Could not get a valid wcskey from wcsname %s" % wcsname)
             else:
-                closefobj(fname, f)
+                closefobj(fname, f, padding)
                 raise KeyError("Wcsname %s is aready used. \
                 Run archiveWCS() with reusekey=True to overwrite this alternate WCS. \
                 Alternatively choose another wcskey with altwcs.available_wcskeys() or\
@@ -157,10 +164,10 @@ def archiveWCS(fname, ext, wcskey=" ", wcsname=" ", reusekey=False):
             key = k[: 7] + wkey
             f[e].header[key] = hwcs[k]
     log.setLevel(default_log_level)
-    closefobj(fname, f)
+    closefobj(fname, f, padding)
 
 
-def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" "):
+def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" ", padding=None):
     """
     Copy an alternate WCS from one extension as a primary WCS of another extension
 
@@ -183,6 +190,11 @@ def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" "):
              or " " - find a key from WCSNAMe value
     wcsname: string (optional)
              if given and wcskey is " ", will try to restore by WCSNAME value
+    padding: int or None
+             If the file is opened by this function and padding is not None,
+             it is saved with `~stwcs.wcsutil.fitsupdate.write_update` which
+             reserves ``padding`` blank header blocks; otherwise it is saved
+             by astropy.
 
     See Also
     --------
@@ -196,7 +208,7 @@ def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" "):
         fobj = f
 
     if not _parpasscheck(fobj, ext=None, wcskey=wcskey, fromext=fromext, toext=toext):
-        closefobj(f, fobj)
+        closefobj(f, fobj, padding)
         raise ValueError("Input parameters problem")
 
     # Interpret input 'ext' value to get list of extensions to process
@@ -220,12 +232,12 @@ def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" "):
         if wcsname.strip():
             wkey = getKeyFromName(fobj[wcskeyext].header, wcsname)
             if not wkey:
-                closefobj(f, fobj)
+                closefobj(f, fobj, padding)
                 raise KeyError("Could not get a key from wcsname %s ." % wcsname)
     else:
         if wcskey not in wcskeys(fobj, ext=wcskeyext):
             print("Could not find alternate WCS with key %s in this file" % wcskey)
-            closefobj(f, fobj)
+            closefobj(f, fobj, padding)
             return
         wkey = wcskey
 
@@ -239,10 +251,10 @@ def restore_from_to(f, fromext=None, toext=None, wcskey=" ", wcsname=" "):
 
     if fobj.filename() is not None:
         # fobj.writeto(name)
-        closefobj(f, fobj)
+        closefobj(f, fobj, padding)
 
 
-def restoreWCS(f, ext, wcskey=" ", wcsname=" "):
+def restoreWCS(f, ext, wcskey=" ", wcsname=" ", padding=None):
     """
     Copy a WCS with key "WCSKEY" to the primary WCS
 
@@ -264,6 +276,11 @@ def restoreWCS(f, ext, wcskey=" ", wcsname=" "):
         or " " - find a key from WCSNAMe value
     wcsname : str
         (optional) if given and wcskey is " ", will try to restore by WCSNAME value
+    padding : int or None
+        If the file is opened by this function and padding is not None,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update` which
+        reserves ``padding`` blank header blocks; otherwise it is saved
+        by astropy.
 
     See Also
     --------
@@ -277,7 +294,7 @@ def restoreWCS(f, ext, wcskey=" ", wcsname=" "):
         fobj = f
 
     if not _parpasscheck(fobj, ext=ext, wcskey=wcskey):
-        closefobj(f, fobj)
+        closefobj(f, fobj, padding)
         raise ValueError("Input parameters problem")
 
     # Interpret input 'ext' value to get list of extensions to process
@@ -295,7 +312,7 @@ def restoreWCS(f, ext, wcskey=" ", wcsname=" "):
         if wcsname.strip():
             wcskey = getKeyFromName(fobj[wcskeyext].header, wcsname)
             if not wcskey:
-                closefobj(f, fobj)
+                closefobj(f, fobj, padding)
                 raise KeyError("Could not get a key from wcsname %s ." % wcsname)
 
     for e in ext:
@@ -305,10 +322,10 @@ def restoreWCS(f, ext, wcskey=" ", wcsname=" "):
             _restore(fobj, wcskey, fromextnum=e, verbose=False)
 
     if fobj.filename() is not None:
-        closefobj(f, fobj)
+        closefobj(f, fobj, padding)
 
 
-def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
+def deleteWCS(fname, ext, wcskey=" ", wcsname=" ", padding=None):
     """
     Delete an alternate WCS defined with wcskey.
     If wcskey is " " try to get a key from WCSNAME.
@@ -324,6 +341,11 @@ def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
         one of 'A'-'Z' or " "
     wcsname : str
         Name of alternate WCS description
+    padding : int or None
+        If the file is opened by this function and padding is not None,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update` which
+        reserves ``padding`` blank header blocks; otherwise it is saved
+        by astropy.
     """
     if isinstance(fname, str):
         fobj = fits.open(fname, mode='update')
@@ -331,7 +353,7 @@ def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
         fobj = fname
 
     if not _parpasscheck(fobj, ext, wcskey, wcsname):
-        closefobj(fname, fobj)
+        closefobj(fname, fobj, padding)
         raise ValueError("Input parameters problem")
 
     # Interpret input 'ext' value to get list of extensions to process
@@ -339,7 +361,7 @@ def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
     # Do not allow deleting the original WCS.
     if wcskey == 'O':
         print("Wcskey 'O' is reserved for the original WCS and should not be deleted.")
-        closefobj(fname, fobj)
+        closefobj(fname, fobj, padding)
         return
 
     wcskeyext = ext[0]
@@ -351,11 +373,11 @@ def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
         # try getting the key from WCSNAME
         wkey = getKeyFromName(fobj[wcskeyext].header, wcsname)
         if not wkey:
-            closefobj(fname, fobj)
+            closefobj(fname, fobj, padding)
             raise KeyError("Could not get a key: wcsname '%s' not found in header." % wcsname)
     else:
         if wcskey not in wcskeys(fobj[wcskeyext].header):
-            closefobj(fname, fobj)
+            closefobj(fname, fobj, padding)
             raise KeyError("Could not find alternate WCS with key %s in this file" % wcskey)
         wkey = wcskey
 
@@ -375,7 +397,7 @@ def deleteWCS(fname, ext, wcskey=" ", wcsname=" "):
         print('Deleted all instances of WCS with key %s in extensions' % wkey, prexts)
     else:
         print("Did not find WCS with key %s in any of the extensions" % wkey)
-    closefobj(fname, fobj)
+    closefobj(fname, fobj, padding)
 
 
 def _buildExtlist(fobj, ext):
@@ -772,14 +794,16 @@ def _parpasscheck(fobj, ext, wcskey, fromext=None, toext=None, reusekey=False):
     return True
 
 
-def closefobj(fname, f):
+def closefobj(fname, f, padding=None):
     """
     Functions in this module accept as input a file name or a file object.
     If the input was a file name (string) we close the object. If the user
     passed a file object we leave it to the user to close it.
+    Files opened in 'update' mode are saved with `fitsupdate.write_update`
+    if ``padding`` is not None.
     """
     if isinstance(fname, str):
-        f.close()
+        fitsupdate.close(f, padding=padding)
 
 
 def mapFitsExt2HDUListInd(fname, extname):
@@ -0,0 +1,337 @@
+"""
+Fast evaluation of the distortion model of an `~stwcs.wcsutil.HSTWCS`
+by interpolation of offsets precomputed on a coarse grid.
+
+``pix2foc`` applies the detector (D2IM) correction ``t = det2im(p)`` followed
+by the SIP polynomials and the NPOL lookup tables, ``foc = t + sip(t) + npol(t)``.
+The D2IM correction is a table with a value per column (or row) and it is
+cheap to evaluate, so it is applied exactly. The smooth part,
+``sip(t) + npol(t)``, is computed once on a grid of nodes spaced by ``step``
+pixels and interpolated with bicubic (``order=3``, cubic convolution) or
+bilinear (``order=1``) interpolation. The nodes are placed on the nodes of
+the NPOL tables when ``step`` divides their spacing; bilinear interpolation
+of the NPOL tables is then exact.
+
+`DistortionGrid.pix2foc_grid` and `DistortionGrid.all_pix2world_grid`
+evaluate the model on all the pixels of a rectilinear grid, for example a
+full chip. The interpolation is separable and is done one axis at a time;
+this is several times faster than the exact model.
+
+Error bound
+-----------
+The offsets are computed exactly at ``samples x samples`` positions evenly
+spaced in each cell of the grid and compared with the interpolated offsets
+when the grid is built; the largest difference (in pixels) is stored in
+`DistortionGrid.max_error`. The interpolation error of a SIP polynomial is
+a smooth function inside a cell and the NPOL tables are linear between
+their nodes, so with the default ``samples=4`` the largest error at any
+position inside the grid is within a few percent of ``max_error``.
+The offsets are stored as float32 which adds an error of about 1e-5 pixels
+for offsets of 100 pixels. Points outside the grid are computed with the
+exact model.
+"""
+import numpy as np
+
+__all__ = ['DistortionGrid']
+
+# Number of points interpolated at once
+BLOCK_SIZE = 2 ** 20
+
+
+class DistortionGrid(object):
+    """
+    Distortion offsets of an HSTWCS sampled on a regular grid.
+
+    Parameters
+    ----------
+    wcs : `~stwcs.wcsutil.HSTWCS`
+        WCS with the distortion model. The grid covers the image
+        (``wcs.naxis1 x wcs.naxis2``) with a margin of two nodes.
+    step : int
+        Spacing of the grid nodes in pixels.
+    order : int
+        1 (bilinear) or 3 (bicubic) interpolation.
+    samples : int
+        Number of positions per cell and axis where the interpolation
+        error is measured.
+
+    Attributes
+    ----------
+    max_error : float
+        Largest interpolation error in pixels found when the grid was
+        built, see the module documentation.
+    nbytes : int
+        Memory used by the grid.
+
+    Examples
+    --------
+    >>> grid = w.distortion_grid(step=16)
+    >>> ra, dec = grid.all_pix2world(x, y, 1)
+    >>> ra, dec = grid.all_pix2world_grid(np.arange(w.naxis1), np.arange(w.naxis2), 0)
+    >>> grid.max_error
+    0.00023
+    """
+    def __init__(self, wcs, step=16, order=3, samples=4):
+        if order not in [1, 3]:
+            raise ValueError("order must be 1 (bilinear) or 3 (bicubic).")
+        self.wcs = wcs
+        self.step = step
+        self.order = order
+        self._has_det2im = wcs.det2im1 is not None or wcs.det2im2 is not None
+        self._has_npol = wcs.cpdis1 is not None or wcs.cpdis2 is not None
+
+        # nodes in 1-based pixel coordinates
+        margin = 2 * step
+        xstart = self._align(1 - margin, wcs.cpdis1 or wcs.cpdis2, 0)
+        ystart = self._align(1 - margin, wcs.cpdis2 or wcs.cpdis1, 1)
+        nx = int(np.ceil((wcs.naxis1 + margin - xstart) / step)) + 1
+        ny = int(np.ceil((wcs.naxis2 + margin - ystart) / step)) + 1
+        self.origin = (xstart, ystart)
+        self.shape = (ny, nx)
+        y, x = np.mgrid[0:ny, 0:nx].astype(np.float64)
+        dx, dy = self._offsets(x.ravel() * step + xstart, y.ravel() * step + ystart)
+        self._dx = dx.astype(np.float32).reshape(self.shape)
+        self._dy = dy.astype(np.float32).reshape(self.shape)
+        self.max_error = self._measure_error(samples)
+
+    @property
+    def nbytes(self):
+        return self._dx.nbytes + self._dy.nbytes
+
+    @staticmethod
+    def _align(start, table, axis):
+        """ Move the first node to a node of an NPOL table. """
+        if table is None:
+            return float(start)
+        cdelt = table.cdelt[axis]
+        # position of the first node of the table
+        node = table.crval[axis] + (1 - table.crpix[axis]) * cdelt
+        return float(start - ((start - node) % cdelt))
+
+    def _offsets(self, t, u):
+        """ Exact SIP and NPOL offsets at positions t, u (1-based). """
+        if self.wcs.sip is not None:
+            # sip_pix2foc is relative to CRPIX
+            fx, fy = self.wcs.sip_pix2foc(t, u, 1)
+            fx = fx - (t - self.wcs.wcs.crpix[0])
+            fy = fy - (u - self.wcs.wcs.crpix[1])
+        else:
+            fx = np.zeros(t.shape, dtype=np.float64)
+            fy = np.zeros(u.shape, dtype=np.float64)
+        if self._has_npol:
+            px, py = self.wcs.p4_pix2foc(t, u, 1)
+            fx += px - t
+            fy += py - u
+        return fx, fy
+
+    def _measure_error(self, samples):
+        ny, nx = self.shape
+        first, last = self._domain()
+        # lower left corner of each cell inside the interpolation domain
+        y, x = np.mgrid[first:ny - last - 1, first:nx - last - 1].astype(np.float64)
+        x = x.ravel() * self.step + self.origin[0]
+        y = y.ravel() * self.step + self.origin[1]
+        error = 0.
+        fractions = np.arange(samples) / samples
+        for fy in fractions:
+            for fx in fractions:
+                if fx == 0 and fy == 0:
+                    # nodes
+                    continue
+                t = x + fx * self.step
+                u = y + fy * self.step
+                ex, ey = self._offsets(t, u)
+                ix, iy = self._interpolate(t, u)
+                error = max(error, float(np.max(np.hypot(ix - ex, iy - ey))))
+        return error
+
+    def _domain(self):
+        """ Number of nodes used before and after a point on each axis. """
+        return (1, 2) if self.order == 3 else (0, 1)
+
+    def _inside(self, t, u):
+        """ True for positions where interpolation uses only grid nodes. """
+        ny, nx = self.shape
+        first, last = self._domain()
+        ft = (t - self.origin[0]) / self.step
+        fu = (u - self.origin[1]) / self.step
+        return (ft >= first) & (ft < nx - last) & (fu >= first) & (fu < ny - last)
+
+    def _axis_weights(self, t, axis):
+        """ Index of the first node used and interpolation weights on an axis. """
+        f = (t - self.origin[axis]) / self.step
+        i = np.floor(f)
+        weights = _weights(f - i, self.order)
+        return i.astype(np.intp) - self._domain()[0], weights
+
+    def _interpolate(self, t, u):
+        """ Interpolated offsets at positions t, u (1-based) inside the grid. """
+        nx = self.shape[1]
+        ix, wx = self._axis_weights(t, 0)
+        iy, wy = self._axis_weights(u, 1)
+        base = iy * nx + ix
+        gx = self._dx.ravel()
+        gy = self._dy.ravel()
+        dx = np.zeros(t.shape, dtype=np.float64)
+        dy = np.zeros(t.shape, dtype=np.float64)
+        for j, wyj in enumerate(wy):
+            for i, wxi in enumerate(wx):
+                index = base + (j * nx + i)
+                weight = wyj * wxi
+                dx += weight * gx[index]
+                dy += weight * gy[index]
+        return dx, dy
+
+    def pix2foc(self, x, y, origin):
+        """
+        Approximation of `~astropy.wcs.WCS.pix2foc` for arrays of pixel
+        positions.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        shape = x.shape
+        x = x.ravel()
+        y = y.ravel()
+        fx = np.empty(x.shape, dtype=np.float64)
+        fy = np.empty(y.shape, dtype=np.float64)
+        for start in range(0, x.shape[0], BLOCK_SIZE):
+            block = slice(start, start + BLOCK_SIZE)
+            fx[block], fy[block] = self._pix2foc(x[block], y[block], origin)
+        return fx.reshape(shape), fy.reshape(shape)
+
+    def _pix2foc(self, x, y, origin):
+        if self._has_det2im:
+            t, u = self.wcs.det2im(x, y, origin)
+        else:
+            t, u = x, y
+        # 1-based positions
+        t = t + (1 - origin)
+        u = u + (1 - origin)
+        inside = self._inside(t, u)
+        if inside.all():
+            dx, dy = self._interpolate(t, u)
+        else:
+            dx = np.empty(t.shape, dtype=np.float64)
+            dy = np.empty(t.shape, dtype=np.float64)
+            dx[inside], dy[inside] = self._interpolate(t[inside], u[inside])
+            outside = ~inside
+            dx[outside], dy[outside] = self._offsets(t[outside], u[outside])
+        t += dx - (1 - origin)
+        u += dy - (1 - origin)
+        return t, u
+
+    def all_pix2world(self, x, y, origin):
+        """
+        Approximation of `~astropy.wcs.WCS.all_pix2world` for arrays of
+        pixel positions.
+        """
+        fx, fy = self.pix2foc(x, y, origin)
+        return self.wcs.wcs_pix2world(fx, fy, origin)
+
+    def pix2foc_grid(self, x, y, origin):
+        """
+        Approximation of `~astropy.wcs.WCS.pix2foc` for all the pixels of
+        a rectilinear grid.
+
+        Parameters
+        ----------
+        x, y : 1-D arrays
+            Positions of the columns and rows of the grid.
+        origin : int
+            0 or 1
+
+        Returns
+        -------
+        fx, fy : 2-D arrays
+            Focal plane coordinates, with shape ``(len(y), len(x))``.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        shape = (y.shape[0], x.shape[0])
+        if not x.size or not y.size:
+            return np.empty(shape), np.empty(shape)
+        separable = self._separable_det2im()
+        if separable is None:
+            xx, yy = np.meshgrid(x, y)
+            return self.pix2foc(xx, yy, origin)
+        t, u = separable(x, y, origin)
+        t = t + (1 - origin)
+        u = u + (1 - origin)
+        if not (self._inside(t, u[0]).all() and self._inside(t[0], u).all()):
+            xx, yy = np.meshgrid(x, y)
+            return self.pix2foc(xx, yy, origin)
+
+        # interpolate the rows of nodes used by the grid at the columns
+        ix, wx = self._axis_weights(t, 0)
+        iy, wy = self._axis_weights(u, 1)
+        rows = slice(iy.min(), iy.max() + len(wy))
+        iy = iy - rows.start
+        cx = np.zeros((rows.stop - rows.start, shape[1]), dtype=np.float64)
+        cy = np.zeros(cx.shape, dtype=np.float64)
+        for i, wxi in enumerate(wx):
+            cx += wxi * self._dx[rows, ix + i]
+            cy += wxi * self._dy[rows, ix + i]
+
+        fx = np.empty(shape, dtype=np.float64)
+        fy = np.empty(shape, dtype=np.float64)
+        nrows = max(1, BLOCK_SIZE // max(shape[1], 1))
+        for start in range(0, shape[0], nrows):
+            block = slice(start, start + nrows)
+            bx = fx[block]
+            by = fy[block]
+            bx[:] = t - (1 - origin)
+            by[:] = (u[block] - (1 - origin))[:, np.newaxis]
+            for j, wyj in enumerate(wy):
+                w = wyj[block, np.newaxis]
+                index = iy[block] + j
+                bx += w * cx[index]
+                by += w * cy[index]
+        return fx, fy
+
+    def all_pix2world_grid(self, x, y, origin):
+        """
+        Approximation of `~astropy.wcs.WCS.all_pix2world` for all the
+        pixels of a rectilinear grid, see `pix2foc_grid`.
+        """
+        fx, fy = self.pix2foc_grid(x, y, origin)
+        ra = np.empty(fx.shape, dtype=np.float64)
+        dec = np.empty(fx.shape, dtype=np.float64)
+        nrows = max(1, BLOCK_SIZE // max(fx.shape[1], 1))
+        for start in range(0, fx.shape[0], nrows):
+            block = slice(start, start + nrows)
+            ra[block], dec[block] = self.wcs.wcs_pix2world(fx[block], fy[block], origin)
+        return ra, dec
+
+    def _separable_det2im(self):
+        """
+        Return a function which computes the D2IM corrected positions of
+        the columns and rows of a grid, or None if the correction of an
+        axis depends on both coordinates.
+        """
+        d2x, d2y = self.wcs.det2im1, self.wcs.det2im2
+        if (d2x is not None and d2x.data.shape[0] != 1) or \
+                (d2y is not None and d2y.data.shape[1] != 1):
+            return None
+
+        def det2im(x, y, origin):
+            if not self._has_det2im:
+                return x, y
+            t = self.wcs.det2im(x, np.full(x.shape, y[0]), origin)[0]
+            u = self.wcs.det2im(np.full(y.shape, x[0]), y, origin)[1]
+            return t, u
+        return det2im
+
+
+def _weights(t, order):
+    """
+    Interpolation weights of the nodes at offsets (-1, 0, 1, 2) for cubic
+    convolution (Keys, a=-0.5) or (0, 1) for linear interpolation.
+    """
+    if order == 1:
+        return [1. - t, t]
+    t2 = t * t
+    t3 = t2 * t
+    return [-0.5 * t3 + t2 - 0.5 * t,
+            1.5 * t3 - 2.5 * t2 + 1.,
+            -1.5 * t3 + 2. * t2 + 0.5 * t,
+            0.5 * t3 - 0.5 * t2]
@@ -0,0 +1,268 @@
+"""
+Save changes to FITS files opened in 'update' mode without reading
+pixel data into memory and, when possible, without rewriting the file.
+
+`astropy.io.fits` rewrites the whole file when a header outgrows its
+FITS blocks or when extensions are added or removed. In that case the data
+of every extension is read (or memory mapped and touched) to be copied.
+`write_update` instead
+
+- writes headers in place when they fit in the blocks they occupy,
+- writes new extensions after the last unchanged one and truncates the file,
+- otherwise rewrites the file copying data which was not loaded in fixed
+  size chunks.
+
+With ``padding > 0`` blank cards are reserved at the end of the headers
+(``padding`` FITS blocks of 36 cards) when they are written. New keywords
+replace the blank cards (astropy does this by default), so later updates
+keep the headers within their blocks and are done in place.
+A header which became shorter is filled with blank cards for the same reason.
+"""
+import io
+import os
+import tempfile
+
+from astropy.io import fits
+
+from .. import instrumentation
+
+import logging
+logger = logging.getLogger('stwcs.wcsutil.fitsupdate')
+
+__all__ = ['write_update', 'discard_update', 'close']
+
+# Size of the buffer used to copy data between files (2048 FITS blocks)
+CHUNK_SIZE = 2880 * 2048
+
+BLOCK_SIZE = 2880
+CARD_LENGTH = 80
+CARDS_PER_BLOCK = BLOCK_SIZE // CARD_LENGTH
+
+
+def write_update(fobj, padding=0, chunk_size=CHUNK_SIZE):
+    """
+    Save the changes made to an HDUList opened in 'update' mode and close it.
+
+    HDUs read from the file which are still in the same position and whose
+    header fits in the blocks it occupies are updated in place. If all HDUs
+    following them are new or in memory, they are written after them and
+    the file is truncated. Otherwise the file is rewritten to a temporary
+    file in the same directory which replaces the original file.
+    In all cases the data of HDUs which were not loaded is never read
+    into memory. Data of new HDUs and data which was loaded (and possibly
+    modified) is written from memory.
+    Files with HDUs whose header in the file is not ``hdu.header`` (tile
+    compressed images) are saved by astropy and no padding is reserved.
+
+    Parameters
+    ----------
+    fobj : `astropy.io.fits.HDUList`
+        HDUList opened in 'update' mode. It is closed on return.
+    padding : int
+        Number of FITS blocks (36 cards each) kept free at the end
+        of each header which is written. Reserved space is made of blank
+        cards and is used by keywords added later.
+    chunk_size : int
+        Size in bytes of the buffer used to copy data.
+
+    Returns
+    -------
+    status : str
+        'patched' if the file was updated in place,
+        'rewritten' if the file was rewritten.
+    """
+    info = fobj.fileinfo(0)
+    if info is None or info['filemode'] != 'update':
+        raise ValueError("write_update requires an HDUList opened in 'update' mode.")
+    ffile = info['file']
+    fname = info['filename']
+    if getattr(ffile, 'compression', None):
+        # Compressed files are always rewritten by astropy
+        fobj.close()
+        instrumentation.emit('write', file=fname, status='rewritten',
+                             bytes_written=os.path.getsize(fname), bytes_read=0)
+        return 'rewritten'
+
+    if any(_header_on_disk_differs(hdu) and hdu.fileinfo() is not None for hdu in fobj):
+        # The header written by astropy for these HDUs (for example the
+        # BINTABLE header of a CompImageHDU) is not hdu.header.
+        fobj.close()
+        instrumentation.emit('write', file=fname, status='rewritten',
+                             bytes_written=os.path.getsize(fname), bytes_read=0)
+        return 'rewritten'
+
+    ncards = padding * CARDS_PER_BLOCK
+    hdus = []
+    for hdu in fobj:
+        if hasattr(hdu, 'update_header'):
+            hdu.update_header()
+        hinfo = hdu.fileinfo()
+        if hinfo is not None and hinfo['file'] is not ffile:
+            # an HDU from a different file
+            hinfo = None
+        hdus.append((hdu, hinfo))
+
+    # Find the HDUs which are updated in place.
+    offset = 0
+    nfixed = 0
+    for hdu, hinfo in hdus:
+        if hinfo is None or hinfo['hdrLoc'] != offset:
+            break
+        allocated = hinfo['datLoc'] - hinfo['hdrLoc']
+        if ncards and len(hdu.header.tostring()) < allocated:
+            _fill(hdu.header, allocated)
+        if len(hdu.header.tostring()) != allocated:
+            break
+        if hdu._data_loaded and len(_data_bytes(hdu)) != hinfo['datSpan']:
+            break
+        offset = hinfo['datLoc'] + hinfo['datSpan']
+        nfixed += 1
+
+    tail = hdus[nfixed:]
+    in_place = nfixed > 0 and not any(hinfo is not None and not hdu._data_loaded
+                                      for hdu, hinfo in tail)
+    if in_place:
+        for hdu, hinfo in tail:
+            if hinfo is not None and hdu.data is not None:
+                # The data of a moved HDU may be memory mapped from a part
+                # of the file which is overwritten or truncated.
+                hdu.data = hdu.data.copy()
+        nwritten = 0
+        nread = 0
+        with open(fname, 'r+b') as fout:
+            for hdu, hinfo in hdus[:nfixed]:
+                fout.seek(hinfo['hdrLoc'])
+                nwritten += fout.write(hdu.header.tostring().encode('ascii'))
+                if hdu._data_loaded:
+                    nwritten += fout.write(_data_bytes(hdu))
+            fout.seek(offset)
+            for hdu, hinfo in tail:
+                _reserve(hdu.header, ncards)
+                nwritten += fout.write(_hdu_bytes(hdu))
+            fout.truncate()
+        status = 'patched'
+    else:
+        for hdu, hinfo in hdus:
+            _reserve(hdu.header, ncards)
+        nwritten, nread = _rewrite(fname, hdus, chunk_size)
+        status = 'rewritten'
+    discard_update(fobj)
+    logger.info("{0} was {1}".format(fname, status))
+    instrumentation.emit('write', file=fname, status=status,
+                         bytes_written=nwritten, bytes_read=nread)
+    return status
+
+
+def close(fobj, padding=None):
+    """
+    Close an HDUList. If it was opened in 'update' mode and ``padding``
+    is given, its changes are saved with `write_update`.
+
+    Parameters
+    ----------
+    fobj : `astropy.io.fits.HDUList`
+    padding : int or None
+        Number of header blocks to reserve, see `write_update`.
+        If None, the HDUList is closed (and saved) by astropy.
+
+    Returns
+    -------
+    status : str or None
+        'patched' or 'rewritten' if the file was saved with `write_update`,
+        else None.
+    """
+    info = fobj.fileinfo(0)
+    if padding is None or info is None or info['filemode'] != 'update':
+        fobj.close()
+        return None
+    return write_update(fobj, padding=padding)
+
+
+def discard_update(fobj):
+    """
+    Close an HDUList opened in 'update' mode without saving its changes.
+    """
+    info = fobj.fileinfo(0)
+    if info is not None and info['file'] is not None:
+        info['file'].close()
+    fobj.close()
+
+
+def _header_on_disk_differs(hdu):
+    """
+    True if the header of ``hdu`` in the file is not ``hdu.header``, as for
+    tile compressed images.
+    """
+    return isinstance(hdu, fits.CompImageHDU) or hdu.header is not hdu._header
+
+
+def _hdu_bytes(hdu):
+    """
+    Return the FITS representation (header and data) of an HDU.
+    """
+    buf = io.BytesIO()
+    if isinstance(hdu, fits.PrimaryHDU):
+        fits.HDUList([hdu]).writeto(buf)
+        return buf.getvalue()
+    primary = fits.PrimaryHDU()
+    fits.HDUList([primary, hdu]).writeto(buf)
+    return buf.getvalue()[len(primary.header.tostring()):]
+
+
+def _data_bytes(hdu):
+    hdubytes = _hdu_bytes(hdu)
+    return hdubytes[len(hdu.header.tostring()):]
+
+
+def _reserve(header, ncards):
+    """
+    Add blank cards so that at least ncards can be added to the header
+    without increasing its size.
+    """
+    nblank = 0
+    for card in reversed(header.cards):
+        if not card.is_blank:
+            break
+        nblank += 1
+    for i in range(ncards - nblank):
+        header.append(fits.Card(), useblanks=False, end=True)
+
+
+def _fill(header, nbytes):
+    """ Add blank cards until the header is nbytes long. """
+    for i in range(nbytes // CARD_LENGTH - len(header) - 1):
+        header.append(fits.Card(), useblanks=False, end=True)
+
+
+def _rewrite(fname, hdus, chunk_size):
+    """ Rewrite the file; return the number of bytes written and copied. """
+    dirname = os.path.dirname(os.path.abspath(fname))
+    fd, tmpname = tempfile.mkstemp(suffix='.fits', dir=dirname)
+    nread = 0
+    try:
+        with os.fdopen(fd, 'wb') as fout, open(fname, 'rb') as fin:
+            for hdu, hinfo in hdus:
+                if hinfo is None or hdu._data_loaded:
+                    fout.write(_hdu_bytes(hdu))
+                else:
+                    fout.write(hdu.header.tostring().encode('ascii'))
+                    _copy(fin, fout, hinfo['datLoc'], hinfo['datSpan'], chunk_size)
+                    nread += hinfo['datSpan']
+            nwritten = fout.tell()
+        os.chmod(tmpname, os.stat(fname).st_mode)
+        os.replace(tmpname, fname)
+    except Exception:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+    return nwritten, nread
+
+
+def _copy(fin, fout, offset, nbytes, chunk_size):
+    fin.seek(offset)
+    while nbytes > 0:
+        chunk = fin.read(min(chunk_size, nbytes))
+        if not chunk:
+            raise IOError("Unexpected end of file while copying data.")
+        fout.write(chunk)
+        nbytes -= len(chunk)
@@ -10,12 +10,16 @@ when only the WCS information has been updated.
 
 """
 import os
+import io
+import gzip
 import sys
 import functools
 import logging
 import textwrap
 import copy
 import time
+import hashlib
+from concurrent import futures
 
 import numpy as np
 import astropy
@@ -27,8 +31,10 @@ from stsci.tools.fileutil import countExtn
 from stsci.tools import fileutil as fu
 from stsci.tools import parseinput
 
+from stwcs import instrumentation
 from stwcs.updatewcs import utils
 from . import altwcs
+from . import fitsupdate
 from . import wcscorr
 from .hstwcs import HSTWCS
 from .mappings import basic_wcs
@@ -77,6 +83,11 @@ DEFAULT_SUMMARY_COLS = ['HDRNAME', 'WCSNAME', 'DISTNAME', 'AUTHOR', 'DATE',
 COLUMN_DICT = {'vals': [], 'width': []}
 COLUMN_FMT = '{:<{width}}'
 
+# Lookup table extensions of a headerlet which can be stored once per
+# science file, in extensions SHARED_TABLE_EXTNAME
+LOOKUP_TABLE_EXTNAMES = ['WCSDVARR', 'D2IMARR']
+SHARED_TABLE_EXTNAME = 'HLETTAB'
+
 
 def init_logging(funcname=None, level=100, mode='w', **kwargs):
     """
@@ -188,6 +199,125 @@ def parse_filename(fname, mode='readonly'):
     return fobj, fname, close_fobj
 
 
+class HeaderletIndex(object):
+    """
+    Positions and keywords of the HeaderletHDU extensions of an HDUList.
+
+    The index is built in one pass over the HDUs. Use `headerlet_index` to
+    get the index of an HDUList; it is kept with the HDUList and built again
+    when extensions are appended, inserted, replaced or deleted.
+
+    Parameters
+    ----------
+    fobj : `astropy.io.fits.HDUList`
+        science file
+    """
+    keywords = ['EXTNAME', 'EXTVER', 'HDRNAME', 'DISTNAME', 'WCSNAME']
+
+    def __init__(self, fobj):
+        self._hdus = list(fobj)
+        self.positions = []
+        self.values = dict((kw, []) for kw in self.keywords)
+        for i, hdu in enumerate(self._hdus):
+            if isinstance(hdu, fits.hdu.base.NonstandardExtHDU):
+                self.positions.append(i)
+                for kw in self.keywords:
+                    self.values[kw].append(hdu.header.get(kw))
+
+    def is_valid(self, fobj):
+        """ True if the extensions of ``fobj`` have not changed. """
+        return len(fobj) == len(self._hdus) and \
+            all(hdu is old for hdu, old in zip(fobj, self._hdus))
+
+    def kw_values(self, kw):
+        """ Values of keyword ``kw`` of all HeaderletHDU extensions. """
+        kw = kw.upper()
+        if kw in self.values:
+            return list(self.values[kw])
+        return [self._hdus[i].header[kw] for i in self.positions]
+
+    def find(self, hdrext=None, hdrname=None, distname=None):
+        """
+        Positions of the HeaderletHDU extensions with EXTNAME and EXTVER
+        ``hdrext`` (a tuple or the EXTVER of an 'HDRLET' extension), HDRNAME
+        ``hdrname`` or DISTNAME ``distname``.
+        """
+        if hdrext is not None and not isinstance(hdrext, tuple):
+            hdrext = ('HDRLET', hdrext)
+        found = []
+        for n, pos in enumerate(self.positions):
+            if (hdrext is not None and
+                    hdrext == (self.values['EXTNAME'][n], self.values['EXTVER'][n])) or \
+               (hdrname is not None and hdrname == self.values['HDRNAME'][n]) or \
+               (distname is not None and distname == self.values['DISTNAME'][n]):
+                found.append(pos)
+        return found
+
+    def count(self, extname='HDRLET'):
+        """ Number of HeaderletHDU extensions with EXTNAME ``extname``. """
+        return self.values['EXTNAME'].count(extname)
+
+
+def headerlet_index(fobj):
+    """
+    Return the `HeaderletIndex` of an HDUList.
+
+    The index is cached with the HDUList and built again if HDUs have been
+    added, replaced or removed since it was built. Call
+    `invalidate_headerlet_index` after changing keywords of a
+    HeaderletHDU in place.
+    """
+    index = getattr(fobj, '_headerlet_index', None)
+    if index is None or not index.is_valid(fobj):
+        index = HeaderletIndex(fobj)
+        fobj._headerlet_index = index
+    return index
+
+
+def invalidate_headerlet_index(fobj):
+    """ Discard the `HeaderletIndex` cached with an HDUList. """
+    fobj.__dict__.pop('_headerlet_index', None)
+
+
+def lookup_table_hash(data):
+    """
+    Return the SHA1 hex digest of a lookup table array, its dtype and shape.
+    """
+    data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder('>'))
+    digest = hashlib.sha1('{0}{1}'.format(data.dtype.str, data.shape).encode('ascii'))
+    digest.update(data.data)
+    return digest.hexdigest()
+
+
+def shared_lookup_tables(fobj):
+    """
+    Return the lookup tables stored once in a science file, as a
+    dictionary {TABHASH: HDU}.
+    """
+    return dict((hdu.header['TABHASH'], hdu) for hdu in fobj
+                if hdu.name == SHARED_TABLE_EXTNAME and 'TABHASH' in hdu.header)
+
+
+def remove_unused_lookup_tables(fobj):
+    """
+    Delete the shared lookup table extensions of ``fobj`` which are not
+    referenced by any HeaderletHDU.
+
+    Returns
+    -------
+    removed : int
+        Number of deleted extensions
+    """
+    used = set()
+    for i in headerlet_index(fobj).positions:
+        used.update(card.value for card in fobj[i].header['TABREF*'].cards)
+    unused = [i for i, hdu in enumerate(fobj) if hdu.name == SHARED_TABLE_EXTNAME and
+              hdu.header.get('TABHASH') not in used]
+    for i in reversed(unused):
+        del fobj[i]
+    return len(unused)
+
+
 def get_headerlet_kw_names(fobj, kw='HDRNAME'):
     """
     Returns a list of specified keywords from all HeaderletHDU
@@ -202,10 +332,7 @@ def get_headerlet_kw_names(fobj, kw='HDRNAME'):
 
     fobj, fname, open_fobj = parse_filename(fobj)
 
-    hdrnames = []
-    for ext in fobj:
-        if isinstance(ext, fits.hdu.base.NonstandardExtHDU):
-            hdrnames.append(ext.header[kw])
+    hdrnames = headerlet_index(fobj).kw_values(kw)
 
     if open_fobj:
         fobj.close()
@@ -279,28 +406,11 @@ def find_headerlet_HDUs(fobj, hdrext=None, hdrname=None, distname=None,
             if isinstance(fobj[hdrext], fits.hdu.base.NonstandardExtHDU) and \
                     fobj[hdrext].header['EXTNAME'] == 'HDRLET':
                 hdrlets.append(hdrext)
+    elif get_all:
+        hdrlets = list(headerlet_index(fobj).positions)
     else:
-        for ext in fobj:
-            if isinstance(ext, fits.hdu.base.NonstandardExtHDU):
-                if get_all:
-                    hdrlets.append(fobj.index(ext))
-                else:
-                    if hdrext is not None:
-                        if isinstance(hdrext, tuple):
-                            hdrextname = hdrext[0]
-                            hdrextnum = hdrext[1]
-                        else:
-                            hdrextname = 'HDRLET'
-                            hdrextnum = hdrext
-                    hdrext_match = ((hdrext is not None) and
-                                    (hdrextnum == ext.header['EXTVER']) and
-                                    (hdrextname == ext.header['EXTNAME']))
-                    hdrname_match = ((hdrname is not None) and
-                                     (hdrname == ext.header['HDRNAME']))
-                    distname_match = ((distname is not None) and
-                                      (distname == ext.header['DISTNAME']))
-                    if hdrext_match or hdrname_match or distname_match:
-                        hdrlets.append(fobj.index(ext))
+        hdrlets = headerlet_index(fobj).find(hdrext=hdrext, hdrname=hdrname,
+                                             distname=distname)
 
     if open_fobj:
         fobj.close()
@@ -609,6 +719,7 @@ def extract_headerlet(filename, output, extnum=None, hdrname=None,
             raise ValueError
 
         hdrlet = hdrhdu.headerlet
+        hdrlet.resolve_lookup_tables(fobj)
 
         if output is None:
             output = frootname
@@ -630,7 +741,7 @@ def write_headerlet(filename, hdrname, output=None, sciext='SCI',
                     sipname=None, npolfile=None, d2imfile=None,
                     author=None, descrip=None, history=None,
                     nmatch=None, catalog=None,
-                    attach=True, clobber=False, logging=False):
+                    attach=True, clobber=False, padding=None, logging=False):
 
     """
     Save a WCS as a headerlet FITS file.
@@ -711,6 +822,10 @@ def write_headerlet(filename, hdrname, output=None, sciext='SCI',
     clobber: bool
         If output file already exists, this parameter specifies whether or not
         to overwrite that file [Default: False]
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
          enable file logging
     """
@@ -804,7 +919,8 @@ def write_headerlet(filename, hdrname, output=None, sciext='SCI',
                                        extname='SIPWCS', wcs_id=wname)
 
                 utils.updateNEXTENDKw(fobj)
-                fobj.flush()
+                if not close_fobj:
+                    fobj.flush()
             else:
                 message = """
                 Headerlet with hdrname %s already archived for WCS %s.
@@ -814,7 +930,7 @@ def write_headerlet(filename, hdrname, output=None, sciext='SCI',
 
         if close_fobj:
             logger.info('Closing image in write_headerlet()...')
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
 
         frootname = fu.buildNewRootname(fname)
 
@@ -1126,7 +1242,7 @@ def create_headerlet(filename, sciext='SCI', hdrname=None, destim=None,
 
 @with_logging
 def apply_headerlet_as_primary(filename, hdrlet, attach=True, archive=True,
-                               force=False, logging=False, logmode='a'):
+                               force=False, padding=None, logging=False, logmode='a'):
     """
     Apply headerlet 'hdrfile' to a science observation 'destfile' as the primary WCS
 
@@ -1144,6 +1260,10 @@ def apply_headerlet_as_primary(filename, hdrlet, attach=True, archive=True,
     force: boolean
             If True, this will cause the headerlet to replace the current PRIMARY
             WCS even if it has a different distortion model. [Default: False]
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
             enable file logging
     logmode: 'w' or 'a'
@@ -1162,12 +1282,12 @@ def apply_headerlet_as_primary(filename, hdrlet, attach=True, archive=True,
         print("Applying {0} as Primary WCS to {1}".format(h, fname))
         hlet = Headerlet.fromfile(h, logging=logging, logmode=logmode)
         hlet.apply_as_primary(fname, attach=attach, archive=archive,
-                              force=force)
+                              force=force, padding=padding)
 
 
 @with_logging
 def apply_headerlet_as_alternate(filename, hdrlet, attach=True, wcskey=None,
-                                 wcsname=None, logging=False, logmode='w'):
+                                 wcsname=None, padding=None, logging=False, logmode='w'):
     """
     Apply headerlet to a science observation as an alternate WCS
 
@@ -1188,6 +1308,10 @@ def apply_headerlet_as_alternate(filename, hdrlet, attach=True, wcskey=None,
           Name to be assigned to this alternate WCS
           WCSNAME is a required keyword in a Headerlet but this allows the
           user to change it as desired.
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
           enable file logging
     logmode: 'a' or 'w'
@@ -1205,11 +1329,166 @@ def apply_headerlet_as_alternate(filename, hdrlet, attach=True, wcskey=None,
         print('Applying {0} as an alternate WCS to {1}'.format(h, fname))
         hlet = Headerlet.fromfile(h, logging=logging, logmode=logmode)
         hlet.apply_as_alternate(fname, attach=attach,
-                                wcsname=wcsname, wcskey=wcskey)
+                                wcsname=wcsname, wcskey=wcskey, padding=padding)
+
+
+def apply_headerlets(headerlets, as_primary=True, attach=True, archive=True,
+                     force=False, wcskey=None, wcsname=None, workers=None,
+                     header_padding=0):
+    """
+    Apply headerlets to many science files, optionally in a process pool
+
+    Each science file is opened once and saved with
+    `stwcs.wcsutil.fitsupdate.write_update`.
+
+    Parameters
+    ----------
+    headerlets: dict
+             {science file name: headerlet}. A headerlet is given as the name
+             of a headerlet file, the contents of a headerlet file (bytes)
+             or a `Headerlet` object.
+    as_primary: boolean
+             If True (default), apply the headerlets as the primary WCS
+             (see `Headerlet.apply_as_primary`), otherwise as an alternate
+             WCS (see `Headerlet.apply_as_alternate`).
+    attach: boolean
+             True (default): append headerlet to FITS file as a new extension.
+    archive: boolean
+             True (default): before updating the primary WCS, create a
+             headerlet with the WCS old solution.
+    force: boolean
+             If True, replace the primary WCS even if the headerlet has a
+             different distortion model. [Default: False]
+    wcskey: string
+             Key of the alternate WCS; if None the next available key is used.
+    wcsname: string
+             Name of the alternate WCS; if None WCSNAME of the headerlet.
+    workers: int or None
+             Number of processes used to update the files.
+             If None or 1, files are processed serially in the current
+             process and any exception is raised immediately.
+             If larger than 1, files are distributed to a process pool;
+             a failure in one file is recorded in the report and does not
+             stop the processing of the remaining files.
+    header_padding: int
+             Number of header blocks reserved when a file is rewritten.
+
+    Returns
+    -------
+    results: list of dict
+             One dictionary per file (in the order of ``headerlets``) with
+             keys 'file', 'hdrname', 'elapsed', 'write' ('patched',
+             'rewritten' or None if the file was not saved) and 'error'
+             (None or a string describing the failure).
+             See `apply_summary` for a summary.
+    """
+    params = {'as_primary': as_primary, 'attach': attach, 'archive': archive,
+              'force': force, 'wcskey': wcskey, 'wcsname': wcsname}
+    files = list(headerlets)
+    # failures are recorded in the results when workers > 1
+    isolate = workers is not None and workers > 1
+    if not isolate or len(files) < 2:
+        # serial mode, also used for a single file with workers > 1
+        results = [_apply_headerlet_file(fname, headerlets[fname], params,
+                                         header_padding, isolate=isolate)
+                   for fname in files]
+    else:
+        hdrlets = []
+        for fname in files:
+            hdrlet = headerlets[fname]
+            if isinstance(hdrlet, fits.HDUList):
+                # HDULists are sent to the worker processes as FITS files
+                buf = io.BytesIO()
+                hdrlet.writeto(buf)
+                hdrlet = buf.getvalue()
+            hdrlets.append(hdrlet)
+        logger.info("Applying headerlets to %d files using %d processes" %
+                    (len(files), workers))
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # Executor.map preserves the order of the input list
+            results = list(executor.map(_apply_headerlet_file, files, hdrlets,
+                                        [params] * len(files),
+                                        [header_padding] * len(files),
+                                        [True] * len(files),
+                                        [instrumentation.enabled()] * len(files)))
+        for res in results:
+            instrumentation.replay(res.pop('events', []))
+    for res in results:
+        if res['error'] is not None:
+            logger.warning("Failed to apply headerlet to %s: %s" %
+                           (res['file'], res['error']))
+
+    summary = apply_summary(results)
+    logger.info("Applied headerlets to %(files)d files: %(failed)d failed, "
+                "%(patched)d updated in place, %(rewritten)d rewritten" % summary)
+    return results
+
+
+def apply_summary(results):
+    """
+    Summarize the results of `apply_headerlets`.
+
+    Returns
+    -------
+    summary: dict
+             Number of 'files', of files which 'failed' and of files which
+             were 'patched' (updated in place) or 'rewritten'.
+    """
+    writes = [res['write'] for res in results]
+    return {'files': len(results),
+            'failed': sum(res['error'] is not None for res in results),
+            'patched': writes.count('patched'),
+            'rewritten': writes.count('rewritten')}
+
+
+def _apply_headerlet_file(fname, hdrlet, params, header_padding, isolate=True,
+                          collect_events=False):
+    """
+    Apply a headerlet to a single file.
+
+    This is the unit of work of `apply_headerlets`, in serial mode as well
+    as in a worker process. Returns the result dictionary of the file.
+    """
+    if collect_events:
+        with instrumentation.Recorder() as recorder:
+            result = _apply_headerlet_file(fname, hdrlet, params, header_padding,
+                                           isolate=isolate)
+        result['events'] = recorder.events
+        return result
+
+    result = {'file': fname, 'hdrname': None, 'elapsed': 0.0, 'write': None,
+              'error': None}
+    start = time.time()
+    try:
+        if isinstance(hdrlet, bytes):
+            hdrlet = Headerlet.fromfile(io.BytesIO(hdrlet))
+        elif not isinstance(hdrlet, Headerlet):
+            hdrlet = Headerlet.fromfile(hdrlet)
+        result['hdrname'] = hdrlet[0].header['HDRNAME']
+        fobj = fits.open(fname, mode='update', memmap=True)
+        try:
+            if params['as_primary']:
+                hdrlet.apply_as_primary(fobj, attach=params['attach'],
+                                        archive=params['archive'], force=params['force'])
+            else:
+                hdrlet.apply_as_alternate(fobj, attach=params['attach'],
+                                          wcskey=params['wcskey'],
+                                          wcsname=params['wcsname'])
+            utils.updateNEXTENDKw(fobj)
+        except Exception:
+            fitsupdate.discard_update(fobj)
+            raise
+        result['write'] = fitsupdate.write_update(fobj, padding=header_padding)
+    except Exception as e:
+        if not isolate:
+            raise
+        result['error'] = "{0}: {1}".format(e.__class__.__name__, e)
+    result['elapsed'] = time.time() - start
+    return result
 
 
 @with_logging
-def attach_headerlet(filename, hdrlet, logging=False, logmode='a'):
+def attach_headerlet(filename, hdrlet, padding=None, logging=False, logmode='a'):
     """
     Attach Headerlet as an HeaderletHDU to a science file
 
@@ -1219,6 +1498,10 @@ def attach_headerlet(filename, hdrlet, logging=False, logmode='a'):
             science file(s) to which the headerlet should be applied
     hdrlet: string, Headerlet object or list of strings or Headerlet objects
             string representing a headerlet file(s), must match 1-to-1 input filename(s)
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
             enable file logging
     logmode: 'a' or 'w'
@@ -1235,12 +1518,69 @@ def attach_headerlet(filename, hdrlet, logging=False, logmode='a'):
     for fname, h in zip(filename, hdrlet):
         print('Attaching {0} as Headerlet extension to {1}'.format(h, fname))
         hlet = Headerlet.fromfile(h, logging=logging, logmode=logmode)
-        hlet.attach_to_file(fname, archive=True)
+        hlet.attach_to_file(fname, archive=True, padding=padding)
+
+
+@with_logging
+def share_headerlet_tables(filename, padding=None, logging=False, logmode='w'):
+    """
+    Store the lookup tables of all HeaderletHDUs in a science file once
+
+    The WCSDVARR and D2IMARR extensions embedded in each HeaderletHDU are
+    replaced with references to 'HLETTAB' extensions of the science file
+    (see `Headerlet.share_lookup_tables`), so headerlets which use the same
+    lookup tables store them only once. Shared lookup tables which are no
+    longer referenced are removed.
+
+    Parameters
+    ----------
+    filename: string or HDUList
+           Either a filename or PyFITS HDUList object for the input science file
+            An input filename (str) will be expanded as necessary to interpret
+            any environmental variables included in the filename.
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
+    logging: boolean
+            enable file logging
+    logmode: 'a' or 'w'
+
+    Returns
+    -------
+    nconverted: int
+           Number of HeaderletHDUs which were converted
+    """
+    fobj, fname, close_fobj = parse_filename(filename, mode='update')
+
+    nconverted = 0
+    for hdrind in headerlet_index(fobj).positions:
+        hdu = fobj[hdrind]
+        if not isinstance(hdu, HeaderletHDU):
+            continue
+        hlet = hdu.headerlet
+        if not any(ext.name in LOOKUP_TABLE_EXTNAMES and 'TABHASH' not in ext.header
+                   for ext in hlet):
+            continue
+        new_hdu = HeaderletHDU.fromheaderlet(hlet.share_lookup_tables(fobj),
+                                             compress=hdu.header['COMPRESS'])
+        for card in hdu.header.cards:
+            if card.keyword not in new_hdu.header:
+                new_hdu.header.append(card)
+        fobj[hdrind] = new_hdu
+        nconverted += 1
+    remove_unused_lookup_tables(fobj)
+
+    utils.updateNEXTENDKw(fobj)
+    if close_fobj:
+        fitsupdate.close(fobj, padding=padding)
+    logger.info('Converted %d headerlet extension(s) of %s' % (nconverted, fname))
+    return nconverted
 
 
 @with_logging
 def delete_headerlet(filename, hdrname=None, hdrext=None, distname=None,
-                     logging=False, logmode='w'):
+                     padding=None, logging=False, logmode='w'):
     """
     Deletes HeaderletHDU(s) with same HDRNAME from science files
 
@@ -1266,6 +1606,10 @@ def delete_headerlet(filename, hdrname=None, hdrext=None, distname=None,
         tuple has the form ('HDRLET', 1)
     distname: string or None
         distortion model as specified in the DISTNAME keyword
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
              enable file logging
     logmode: 'a' or 'w'
@@ -1276,11 +1620,12 @@ def delete_headerlet(filename, hdrname=None, hdrext=None, distname=None,
     for f in filename:
         print("Deleting Headerlet from ", f)
         _delete_single_headerlet(f, hdrname=hdrname, hdrext=hdrext,
-                                 distname=distname, logging=logging, logmode='a')
+                                 distname=distname, padding=padding,
+                                 logging=logging, logmode='a')
 
 
 def _delete_single_headerlet(filename, hdrname=None, hdrext=None, distname=None,
-                             logging=False, logmode='w'):
+                             padding=None, logging=False, logmode='w'):
     """
     Deletes HeaderletHDU(s) from a SINGLE science file
 
@@ -1305,12 +1650,23 @@ def _delete_single_headerlet(filename, hdrname=None, hdrext=None, distname=None,
         tuple has the form ('HDRLET', 1)
     distname: string or None
         distortion model as specified in the DISTNAME keyword
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
              enable file logging
     logmode: 'a' or 'w'
     """
-    hdrlet_ind = find_headerlet_HDUs(filename, hdrname=hdrname, hdrext=hdrext,
-                                     distname=distname, logging=logging, logmode='a')
+    fobj, fname, close_fobj = parse_filename(filename, mode='update')
+
+    try:
+        hdrlet_ind = find_headerlet_HDUs(fobj, hdrname=hdrname, hdrext=hdrext,
+                                         distname=distname, logging=logging, logmode='a')
+    except ValueError:
+        if close_fobj:
+            fitsupdate.close(fobj, padding=padding)
+        raise
     if len(hdrlet_ind) == 0:
         message = """
         No HDUs deleted... No Headerlet HDUs found with '
@@ -1320,10 +1676,10 @@ def _delete_single_headerlet(filename, hdrname=None, hdrext=None, distname=None,
         Please review input parameters and try again.
         """ % (hdrname, str(hdrext), distname)
         logger.critical(message)
+        if close_fobj:
+            fitsupdate.close(fobj, padding=padding)
         return
 
-    fobj, fname, close_fobj = parse_filename(filename, mode='update')
-
     # delete row(s) from WCSCORR table now...
     #
     #
@@ -1338,16 +1694,40 @@ def _delete_single_headerlet(filename, hdrname=None, hdrext=None, distname=None,
     # delete the headerlet extension now
     for hdrind in hdrlet_ind:
         del fobj[hdrind]
+    remove_unused_lookup_tables(fobj)
 
     utils.updateNEXTENDKw(fobj)
-    # Update file object with changes
-    fobj.flush()
-    # close file, if was opened by this function
+    # Update file object with changes; a file opened by this function
+    # is saved when it is closed
+    if not close_fobj:
+        fobj.flush()
     if close_fobj:
-        fobj.close()
+        fitsupdate.close(fobj, padding=padding)
     logger.critical('Deleted headerlet from extension(s) %s ' % str(hdrlet_ind))
 
 
+def header_summary(header, columns):
+    """
+    Return the summary of the values of keywords ``columns`` in the primary
+    header of a headerlet, in the format used by `headerlet_summary`.
+    """
+    # Initialize summary dict based on requested columns
+    summary = {}
+    for kw in columns:
+        summary[kw] = copy.deepcopy(COLUMN_DICT)
+
+    # Populate the summary with headerlet values
+    for kw in columns:
+        if kw in header:
+            val = header[kw]
+        else:
+            val = 'INDEF'
+        summary[kw]['vals'].append(val)
+        summary[kw]['width'].append(max(len(val), len(kw)))
+
+    return summary
+
+
 def headerlet_summary(filename, columns=None, pad=2, maxwidth=None,
                       output=None, clobber=True, quiet=False):
     """
@@ -1399,11 +1779,11 @@ def headerlet_summary(filename, columns=None, pad=2, maxwidth=None,
 
     fobj, fname, close_fobj = parse_filename(filename)
     # find all HDRLET extensions and combine info into a single summary
-    for extn in fobj:
-        if 'extname' in extn.header and extn.header['extname'] == 'HDRLET':
-            hdrlet_indx = fobj.index_of(('hdrlet', extn.header['extver']))
+    for hdrlet_indx in headerlet_index(fobj).positions:
+        extn = fobj[hdrlet_indx]
+        if extn.header.get('extname') == 'HDRLET':
             try:
-                ext_cols, ext_summary = extn.headerlet.summary(columns=summary_cols)
+                ext_summary = header_summary(extn.primary_header, summary_cols)
                 extnums_col['vals'].append(hdrlet_indx)
                 for kw in summary_cols:
                     for key in COLUMN_DICT:
@@ -1423,7 +1803,7 @@ def headerlet_summary(filename, columns=None, pad=2, maxwidth=None,
 
 @with_logging
 def restore_from_headerlet(filename, hdrname=None, hdrext=None, archive=True,
-                           force=False, logging=False, logmode='w'):
+                           force=False, padding=None, logging=False, logmode='w'):
     """
     Restores a headerlet as a primary WCS
 
@@ -1446,15 +1826,24 @@ def restore_from_headerlet(filename, hdrname=None, hdrext=None, archive=True,
     force: boolean (default:False)
         When the distortion models of the headerlet and the primary do not match, and archive
         is False, this flag forces an update of the primary.
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
            enable file logging
     logmode: 'a' or 'w'
     """
 
-    hdrlet_ind = find_headerlet_HDUs(filename, hdrext=hdrext, hdrname=hdrname)
-
     fobj, fname, close_fobj = parse_filename(filename, mode='update')
 
+    try:
+        hdrlet_ind = find_headerlet_HDUs(fobj, hdrext=hdrext, hdrname=hdrname)
+    except ValueError:
+        if close_fobj:
+            fitsupdate.close(fobj, padding=padding)
+        raise
+
     if len(hdrlet_ind) > 1:
         if hdrext:
             kwerr = 'hdrext'
@@ -1467,7 +1856,7 @@ def restore_from_headerlet(filename, hdrname=None, hdrext=None, archive=True,
         %d Headerlets with "%s" = %s found in %s.
         """ % (len(hdrlet_ind), kwerr, kwval, fname)
         if close_fobj:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
         logger.critical(message)
         raise ValueError
 
@@ -1493,7 +1882,7 @@ def restore_from_headerlet(filename, hdrname=None, hdrext=None, archive=True,
         same_dist = False
         if not archive and not force:
             if close_fobj:
-                fobj.close()
+                fitsupdate.close(fobj, padding=padding)
             message = """
             Headerlet does not have the same distortion as image!
             Set "archive"=True to save old distortion model, or
@@ -1534,14 +1923,15 @@ def restore_from_headerlet(filename, hdrname=None, hdrext=None, archive=True,
     hdrlet.apply_as_primary(fobj, attach=False, archive=archive, force=force)
 
     utils.updateNEXTENDKw(fobj)
-    fobj.flush()
+    if not close_fobj:
+        fobj.flush()
     if close_fobj:
-        fobj.close()
+        fitsupdate.close(fobj, padding=padding)
 
 
 @with_logging
 def restore_all_with_distname(filename, distname, primary, archive=True,
-                              sciext='SCI', logging=False, logmode='w'):
+                              sciext='SCI', padding=None, logging=False, logmode='w'):
     """
     Restores all HeaderletHDUs with a given distortion model as alternate WCSs and a primary
 
@@ -1562,6 +1952,10 @@ def restore_all_with_distname(filename, distname, primary, archive=True,
         flag indicating if HeaderletHDUs should be created from the
         primary and alternate WCSs in fname before restoring all matching
         headerlet extensions
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
          enable file logging
     logmode: 'a' or 'w'
@@ -1581,7 +1975,7 @@ def restore_all_with_distname(filename, distname, primary, archive=True,
         get_headerlet_kw_names(fobj, kw='DISTNAME')
         """ % (distname, fname)
         if close_fobj:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
         logger.critical(message)
         raise ValueError
 
@@ -1591,14 +1985,11 @@ def restore_all_with_distname(filename, distname, primary, archive=True,
     elif isinstance(primary, int):
         primary_ind = primary
     else:
-        primary_ind = None
-        for ind in hdrlet_ind:
-            if fobj[ind].header['hdrname'] == primary:
-                primary_ind = ind
-                break
+        matches = headerlet_index(fobj).find(hdrname=primary)
+        primary_ind = next((ind for ind in hdrlet_ind if ind in matches), None)
         if primary_ind is None:
             if close_fobj:
-                fobj.close()
+                fitsupdate.close(fobj, padding=padding)
             message = """
             No Headerlet extensions found with DISTNAME = %s in %s.
             """ % (primary, fname)
@@ -1615,7 +2006,7 @@ def restore_all_with_distname(filename, distname, primary, archive=True,
     pri_distname = primary_hdrlet[0].header['distname']
     if pri_distname != distname:
         if close_fobj:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
         message = """
         Headerlet extension to be used as PRIMARY WCS
         has "DISTNAME" = %s
@@ -1647,9 +2038,10 @@ def restore_all_with_distname(filename, distname, primary, archive=True,
                                           wcsname=hdrlet[0].header['wcsname'])
 
     utils.updateNEXTENDKw(fobj)
-    fobj.flush()
+    if not close_fobj:
+        fobj.flush()
     if close_fobj:
-        fobj.close()
+        fitsupdate.close(fobj, padding=padding)
 
 
 @with_logging
@@ -1657,8 +2049,8 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
                          wcsname=None, wcskey=None, destim=None,
                          sipname=None, npolfile=None, d2imfile=None,
                          author=None, descrip=None, history=None,
-                         nmatch=None, catalog=None,
-                         logging=False, logmode='w'):
+                         nmatch=None, catalog=None, share_tables=False,
+                         padding=None, logging=False, logmode='w'):
     """
     Save a WCS as a headerlet extension and write it out to a file.
 
@@ -1720,6 +2112,14 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
             to the headerlet PRIMARY header
             If filename is specified, it will format and attach all text from
             that file as the history.
+    share_tables: boolean
+            If True, the lookup tables (WCSDVARR and D2IMARR extensions) of
+            the headerlet are stored once in the science file and referenced
+            by the HeaderletHDU; see `Headerlet.share_lookup_tables`.
+    padding: int or None
+        If not None and the science file is opened by this function,
+        it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+        reserving ``padding`` blank header blocks.
     logging: boolean
             enable file folling
     logmode: 'w' or 'a'
@@ -1735,7 +2135,7 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
         needs to be specified.
         """ % fname
         if close_fobj:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
         logger.critical(message)
         raise ValueError
 
@@ -1744,7 +2144,7 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
         wcskey = ' '
     wcskey = wcskey.upper()
 
-    numhlt = countExtn(fobj, 'HDRLET')
+    numhlt = headerlet_index(fobj).count()
 
     if wcsname is None:
         scihdr = fobj[sciext, 1].header
@@ -1765,15 +2165,19 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
                                      descrip=descrip, history=history,
                                      nmatch=nmatch, catalog=catalog,
                                      logging=False)
+        if share_tables:
+            hdrletobj = hdrletobj.share_lookup_tables(fobj)
         hlt_hdu = HeaderletHDU.fromheaderlet(hdrletobj)
 
         if destim is not None:
             hlt_hdu[0].header['destim'] = destim
 
+        hlt_hdu.header['EXTVER'] = numhlt + 1
         fobj.append(hlt_hdu)
 
         utils.updateNEXTENDKw(fobj)
-        fobj.flush()
+        if not close_fobj:
+            fobj.flush()
     else:
         message = """
         Headerlet with hdrname %s already archived for WCS %s
@@ -1782,7 +2186,7 @@ def archive_as_headerlet(filename, hdrname, sciext='SCI',
         logger.critical(message)
 
     if close_fobj:
-        fobj.close()
+        fitsupdate.close(fobj, padding=padding)
 
 
 # Headerlet Class definitions
@@ -1864,7 +2268,8 @@ class Headerlet(fits.HDUList):
         init_logging('class Headerlet', level=logging, mode=logmode)
         return hlet
 
-    def apply_as_primary(self, fobj, attach=True, archive=True, force=False):
+    def apply_as_primary(self, fobj, attach=True, archive=True, force=False,
+                         share_tables=False, padding=None):
         """
         Copy this headerlet as a primary WCS to fobj
 
@@ -1888,15 +2293,23 @@ class Headerlet(fits.HDUList):
               When the distortion models of the headerlet and the primary do
               not match, and archive is False this flag forces an update
               of the primary
+        share_tables: boolean (default is False)
+              Store the lookup tables of the headerlets attached to fobj
+              once in fobj; see `share_lookup_tables`.
+        padding: int or None
+            If not None and the file is opened by this function,
+            it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+            reserving ``padding`` blank header blocks.
         """
         self.hverify()
         fobj, fname, close_dest = parse_filename(fobj, mode='update')
         if not self.verify_dest(fobj, fname):
             if close_dest:
-                fobj.close()
+                fitsupdate.close(fobj, padding=padding)
             raise ValueError("Destination name does not match headerlet"
                              "Observation {0} cannot be updated with"
                              "headerlet {1}".format((fname, self.hdrname)))
+        self.resolve_lookup_tables(fobj)
 
         # Check to see whether the distortion model in the destination
         # matches the distortion model in the headerlet being applied
@@ -1908,7 +2321,7 @@ class Headerlet(fits.HDUList):
                              " To overwrite the distortion model, set force=True")
 
         orig_hlt_hdu = None
-        numhlt = countExtn(fobj, 'HDRLET')
+        numhlt = headerlet_index(fobj).count()
         hdrlet_extnames = get_headerlet_kw_names(fobj)
 
         # Insure that WCSCORR table has been created with all original
@@ -1942,6 +2355,8 @@ class Headerlet(fits.HDUList):
                                             wcsname=wcsname,
                                             hdrname=hdrname,
                                             logging=self.logging)
+                if share_tables:
+                    orig_hlt = orig_hlt.share_lookup_tables(fobj)
                 orig_hlt_hdu = HeaderletHDU.fromheaderlet(orig_hlt)
                 numhlt += 1
                 orig_hlt_hdu.header['EXTVER'] = numhlt
@@ -1980,6 +2395,8 @@ class Headerlet(fits.HDUList):
                                                     npolfile=None, d2imfile=None,
                                                     author=None, descrip=None, history=None,
                                                     logging=self.logging)
+                        if share_tables:
+                            alt_hlet = alt_hlet.share_lookup_tables(fobj)
                         numhlt += 1
                         alt_hlet_hdu = HeaderletHDU.fromheaderlet(alt_hlet)
                         alt_hlet_hdu.header['EXTVER'] = numhlt
@@ -2082,12 +2499,13 @@ class Headerlet(fits.HDUList):
                 fobj.append(ahdu)
         if attach:
             # Finally, append an HDU for this headerlet
-            self.attach_to_file(fobj)
+            self.attach_to_file(fobj, share_tables=share_tables)
             utils.updateNEXTENDKw(fobj)
         if close_dest:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
 
-    def apply_as_alternate(self, fobj, attach=True, wcskey=None, wcsname=None):
+    def apply_as_alternate(self, fobj, attach=True, wcskey=None, wcsname=None,
+                           padding=None):
         """
         Copy this headerlet as an alternate WCS to fobj
 
@@ -2106,16 +2524,21 @@ class Headerlet(fits.HDUList):
               Name to be assigned to this alternate WCS
               WCSNAME is a required keyword in a Headerlet but this allows the
               user to change it as desired.
+        padding: int or None
+            If not None and the file is opened by this function,
+            it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+            reserving ``padding`` blank header blocks.
 
         """
         self.hverify()
         fobj, fname, close_dest = parse_filename(fobj, mode='update')
         if not self.verify_dest(fobj, fname):
             if close_dest:
-                fobj.close()
+                fitsupdate.close(fobj, padding=padding)
             raise ValueError("Destination name does not match headerlet"
                              "Observation %s cannot  be updated with"
                              "headerlet %s" % (fname, self.hdrname))
+        self.resolve_lookup_tables(fobj)
 
         # Verify whether this headerlet has the same distortion
         # found in the image being updated
@@ -2151,7 +2574,7 @@ class Headerlet(fits.HDUList):
                 mess = "Observation %s already contains alternate WCS with key %s" % (fname, wcskey)
                 logger.critical(mess)
                 if close_dest:
-                    fobj.close()
+                    fitsupdate.close(fobj, padding=padding)
                 raise ValueError(mess)
         numsip = countExtn(self, 'SIPWCS')
 
@@ -2186,9 +2609,9 @@ class Headerlet(fits.HDUList):
             utils.updateNEXTENDKw(fobj)
 
         if close_dest:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
 
-    def attach_to_file(self, fobj, archive=False):
+    def attach_to_file(self, fobj, archive=False, share_tables=False, padding=None):
         """
         Attach Headerlet as an HeaderletHDU to a science file
 
@@ -2198,6 +2621,13 @@ class Headerlet(fits.HDUList):
               science file/HDUList to which the headerlet should be applied
         archive: string
               Specifies whether or not to update WCSCORR table when attaching
+        share_tables: boolean
+              If True, the lookup tables of the headerlet are stored once in
+              the science file; see `share_lookup_tables`.
+        padding: int or None
+            If not None and the file is opened by this function,
+            it is saved with `~stwcs.wcsutil.fitsupdate.write_update`
+            reserving ``padding`` blank header blocks.
 
         Notes
         -----
@@ -2213,8 +2643,11 @@ class Headerlet(fits.HDUList):
         hdrver = self.verify_hdrname(fobj)
         if destver and hdrver:
 
-            numhlt = countExtn(fobj, 'HDRLET')
-            new_hlt = HeaderletHDU.fromheaderlet(self)
+            numhlt = headerlet_index(fobj).count()
+            if share_tables:
+                new_hlt = HeaderletHDU.fromheaderlet(self.share_lookup_tables(fobj))
+            else:
+                new_hlt = HeaderletHDU.fromheaderlet(self.resolve_lookup_tables(fobj))
             new_hlt.header['extver'] = numhlt + 1
             fobj.append(new_hlt)
             utils.updateNEXTENDKw(fobj)
@@ -2229,7 +2662,90 @@ class Headerlet(fits.HDUList):
                 message += "with HDRNAME='%s'\n" % (self.hdrname)
             logger.critical(message)
         if close_dest:
-            fobj.close()
+            fitsupdate.close(fobj, padding=padding)
+
+    def share_lookup_tables(self, fobj):
+        """
+        Return a copy of this headerlet which references lookup tables
+        stored once in a science file.
+
+        The data of each WCSDVARR and D2IMARR extension is appended to fobj
+        as a 'HLETTAB' extension, unless fobj already has one with the same
+        content. The extension in the returned headerlet keeps its header
+        without the data and the keyword TABHASH with the hash of the data
+        (see `lookup_table_hash`). `resolve_lookup_tables` restores the data.
+
+        Parameters
+        ----------
+        fobj: HDUList
+              science file opened in update mode
+
+        Returns
+        -------
+        hlet: `Headerlet`
+        """
+        tables = shared_lookup_tables(fobj)
+        numtab = len(tables)
+        hdus = []
+        for hdu in self:
+            if hdu.name not in LOOKUP_TABLE_EXTNAMES:
+                hdus.append(hdu)
+                continue
+            if 'TABHASH' in hdu.header:
+                tabhash = hdu.header['TABHASH']
+                if tabhash not in tables:
+                    raise ValueError("Lookup table {0} of headerlet {1} not found in "
+                                     "{2}".format(tabhash, self[0].header['HDRNAME'],
+                                                  fobj.filename()))
+                hdus.append(hdu)
+                continue
+            tabhash = lookup_table_hash(hdu.data)
+            if tabhash not in tables:
+                numtab += 1
+                tables[tabhash] = fits.ImageHDU(data=hdu.data, name=SHARED_TABLE_EXTNAME,
+                                                ver=numtab)
+                tables[tabhash].header['TABHASH'] = (tabhash, 'SHA1 of lookup table')
+                fobj.append(tables[tabhash])
+            stub = fits.ImageHDU(header=hdu.header.copy())
+            stub.header['TABHASH'] = (tabhash, 'Lookup table stored in science file')
+            hdus.append(stub)
+
+        hlet = Headerlet(hdus, logging=self.logging, logmode='a')
+        if hasattr(self, 'hdrname'):
+            hlet.init_attrs()
+        return hlet
+
+    def resolve_lookup_tables(self, fobj):
+        """
+        Replace the references to lookup tables stored in a science file
+        (see `share_lookup_tables`) with the tables.
+
+        The headerlet is updated in place.
+
+        Parameters
+        ----------
+        fobj: HDUList
+              science file with the lookup tables
+
+        Returns
+        -------
+        hlet: `Headerlet`
+              this headerlet
+        """
+        refs = [i for i, hdu in enumerate(self)
+                if hdu.name in LOOKUP_TABLE_EXTNAMES and 'TABHASH' in hdu.header]
+        if not refs:
+            return self
+        tables = shared_lookup_tables(fobj)
+        for i in refs:
+            header = self[i].header.copy()
+            tabhash = header.pop('TABHASH')
+            if tabhash not in tables:
+                raise ValueError("Lookup table {0} of headerlet {1} not found in "
+                                 "{2}".format(tabhash, self[0].header['HDRNAME'],
+                                              fobj.filename()))
+            self[i] = fits.ImageHDU(data=tables[tabhash].data, header=header)
+        return self
 
     def info(self, columns=None, pad=2, maxwidth=None,
              output=None, clobber=True, quiet=False):
@@ -2288,21 +2804,7 @@ class Headerlet(fits.HDUList):
         else:
             summary_cols = columns
 
-        # Initialize summary dict based on requested columns
-        summary = {}
-        for kw in summary_cols:
-            summary[kw] = copy.deepcopy(COLUMN_DICT)
-
-        # Populate the summary with headerlet values
-        for kw in summary_cols:
-            if kw in self[0].header:
-                val = self[0].header[kw]
-            else:
-                val = 'INDEF'
-            summary[kw]['vals'].append(val)
-            summary[kw]['width'].append(max(len(val), len(kw)))
-
-        return summary_cols, summary
+        return summary_cols, header_summary(self[0].header, summary_cols)
 
     def hverify(self):
         """
@@ -2509,10 +3011,12 @@ class Headerlet(fits.HDUList):
                         del ext.header[key]
                     except KeyError:
                         pass
-        try:
-            del ext.header['IDCTAB']
-        except KeyError:
-            pass
+        # APBP_MAX and APBP_RMS are the residuals of the AP/BP polynomials
+        for key in ['APBP_MAX', 'APBP_RMS', 'IDCTAB']:
+            try:
+                del ext.header[key]
+            except KeyError:
+                pass
 
     def _remove_lut(self, ext):
         """
@@ -2707,7 +3211,10 @@ class HeaderletHDU(fits.hdu.nonstandard.FitsHDU):
     http://listmgr.cv.nrao.edu/pipermail/fitsbits/2002-April/thread.html
 
     The Headerlet contained in the HDU's data can be accessed by the
-    `headerlet` attribute.
+    `headerlet` attribute. The extensions of the embedded file are read
+    only when they are accessed. Keyword-only queries should use the
+    `primary_header` attribute which reads (and decompresses) only the
+    primary header of the embedded file.
     """
 
     _extension = 'HDRLET'
@@ -2720,7 +3227,49 @@ class HeaderletHDU(fits.hdu.nonstandard.FitsHDU):
         class, though the hdulist property returns a normal HDUList object.
         """
 
-        return Headerlet(self.hdulist)
+        return super(Headerlet, Headerlet).fromfile(self._payload(), mode='readonly',
+                                                    lazy_load_hdus=True)
+
+    @lazyproperty
+    def hdulist(self):
+        """
+        Return the encapsulated headerlet as an HDUList object.
+
+        The SIPWCS, WCSDVARR and D2IMARR extensions are decoded when
+        they are accessed.
+        """
+        return fits.HDUList.fromfile(self._payload(), mode='readonly',
+                                     lazy_load_hdus=True)
+
+    @lazyproperty
+    def primary_header(self):
+        """
+        Primary header of the encapsulated headerlet.
+
+        Only the header blocks of the embedded file are read from the
+        container file and, if COMPRESS is set, decompressed.
+        """
+        return fits.Header.fromfile(self._payload(buffered=False))
+
+    def _payload(self, buffered=True):
+        """
+        File object reading the embedded FITS file.
+
+        Parameters
+        ----------
+        buffered : bool
+            If True, the data of this HDU is copied to memory, otherwise it
+            is read from the container file as needed.
+        """
+        if buffered:
+            self._file.seek(self._data_offset)
+            fileobj = io.BytesIO(self._file.read(self.size))
+        else:
+            fileobj = io.BufferedReader(_PayloadReader(self._file, self._data_offset,
+                                                       self.size))
+        if self._header['COMPRESS']:
+            fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+        return fileobj
 
     @classmethod
     def fromheaderlet(cls, headerlet, compress=False):
@@ -2767,8 +3316,37 @@ class HeaderletHDU(fits.hdu.nonstandard.FitsHDU):
         hlet.header['D2IMFILE'] = (phdu.header['D2IMFILE'],
                                    phdu.header.comments['D2IMFILE'])
         hlet.header['EXTNAME'] = (cls._extension, 'Extension name')
+        tabrefs = [hdu.header['TABHASH'] for hdu in headerlet
+                   if hdu.name in LOOKUP_TABLE_EXTNAMES and 'TABHASH' in hdu.header]
+        for i, tabhash in enumerate(tabrefs):
+            hlet.header['TABREF%d' % (i + 1)] = (tabhash, 'Shared lookup table')
 
         return hlet
 
 
+class _PayloadReader(io.RawIOBase):
+    """
+    Read-only file object for ``size`` bytes of ``fileobj`` starting
+    at ``offset``.
+    """
+    def __init__(self, fileobj, offset, size):
+        self._fileobj = fileobj
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        nbytes = min(len(buf), self._size - self._pos)
+        if nbytes <= 0:
+            return 0
+        self._fileobj.seek(self._offset + self._pos)
+        data = self._fileobj.read(nbytes)
+        buf[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
 fits.register_hdu(HeaderletHDU)
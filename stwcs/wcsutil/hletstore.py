@@ -0,0 +1,329 @@
+"""
+A local repository of headerlets.
+
+Headerlets are stored as FITS files in a directory, named after the SHA1
+of their contents (``<root>/<sha1[:2]>/<sha1>.fits``), and the keywords of
+their primary headers used to select solutions are recorded in an SQLite
+database (``<root>/index.db``). Selecting headerlets by DESTIM, DISTNAME,
+CATALOG etc. is a query of the database; only the headerlets which are
+fetched are read.
+
+Example::
+
+    from stwcs.wcsutil.hletstore import HeaderletStore
+    with HeaderletStore('/data/headerlets') as store:
+        store.import_files('*_flt.fits')
+        for row in store.query(destim='j94f05bgq', catalog='GAIADR2'):
+            hlet = store.fetch(row['key'])
+"""
+import io
+import os
+import hashlib
+import contextlib
+import sqlite3
+import tempfile
+
+from astropy.io import fits
+from stsci.tools import parseinput
+
+from . import headerlet
+
+__all__ = ['HeaderletStore']
+
+INDEX_NAME = 'index.db'
+SCHEMA_VERSION = 1
+
+# Indexed columns and the primary header keywords they are read from
+COLUMNS = [('hdrname', 'HDRNAME', 'TEXT'),
+           ('destim', 'DESTIM', 'TEXT'),
+           ('wcsname', 'WCSNAME', 'TEXT'),
+           ('distname', 'DISTNAME', 'TEXT'),
+           ('sipname', 'SIPNAME', 'TEXT'),
+           ('npolfile', 'NPOLFILE', 'TEXT'),
+           ('d2imfile', 'D2IMFILE', 'TEXT'),
+           ('catalog', 'CATALOG', 'TEXT'),
+           ('nmatch', 'NMATCH', 'INTEGER'),
+           ('rms_ra', 'RMS_RA', 'REAL'),
+           ('rms_dec', 'RMS_DEC', 'REAL'),
+           ('date', 'DATE', 'TEXT')]
+COLUMN_NAMES = [col[0] for col in COLUMNS]
+INDEXED_COLUMNS = ['hdrname', 'destim', 'wcsname', 'distname', 'catalog']
+
+
+class HeaderletStore(object):
+    """
+    Directory of headerlet files with an SQLite index.
+
+    A headerlet is identified by its DESTIM and HDRNAME and by a key, the
+    SHA1 of its FITS file.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store; it is created if it does not exist.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expandvars(os.path.expanduser(path)))
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._db = sqlite3.connect(os.path.join(self.path, INDEX_NAME))
+        self._db.row_factory = sqlite3.Row
+        # keys of the headerlets removed in the current transaction
+        self._removed = []
+        self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM headerlets').fetchone()[0]
+
+    def close(self):
+        """ Close the index database. """
+        self._db.close()
+
+    def _create_schema(self):
+        columns = ', '.join('{0} {1}'.format(name, sqltype) for name, kw, sqltype in COLUMNS)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS headerlets '
+                             '(key TEXT PRIMARY KEY, {0}, UNIQUE (destim, hdrname))'
+                             .format(columns))
+            for name in INDEXED_COLUMNS:
+                self._db.execute('CREATE INDEX IF NOT EXISTS idx_{0} ON headerlets ({0})'
+                                 .format(name))
+            self._db.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Transaction on the index. The files of removed headerlets are deleted
+        once it is committed, so a rollback leaves the store consistent.
+        """
+        self._removed = []
+        with self._db:
+            yield
+        removed, self._removed = self._removed, []
+        for key in removed:
+            # the same headerlet may have been inserted again
+            if self._db.execute('SELECT 1 FROM headerlets WHERE key = ?',
+                                (key,)).fetchone() is not None:
+                continue
+            try:
+                os.remove(self.filename(key))
+            except OSError:
+                pass
+
+    def filename(self, key):
+        """ Name of the file of the headerlet with key ``key``. """
+        return os.path.join(self.path, key[:2], key + '.fits')
+
+    def insert(self, hdrlet, replace=False):
+        """
+        Add a headerlet to the store.
+
+        Parameters
+        ----------
+        hdrlet : str, bytes or `~stwcs.wcsutil.headerlet.Headerlet`
+            Name of a headerlet file, contents of a headerlet file or a
+            Headerlet object.
+        replace : bool
+            If True, a headerlet with the same DESTIM and HDRNAME is
+            replaced, otherwise a ValueError is raised.
+
+        Returns
+        -------
+        key : str
+        """
+        with self._transaction():
+            key = self._insert(_headerlet_bytes(hdrlet), replace)
+        return key
+
+    def _insert(self, data, replace):
+        header = fits.Header.fromfile(io.BytesIO(data))
+        row = _index_values(header)
+        key = hashlib.sha1(data).hexdigest()
+        old = self._db.execute('SELECT key FROM headerlets WHERE destim = ? AND hdrname = ?',
+                               (row['destim'], row['hdrname'])).fetchone()
+        if old is not None:
+            if old['key'] == key:
+                return key
+            if not replace:
+                raise ValueError("Headerlet {0} of {1} is already in the store"
+                                 .format(row['hdrname'], row['destim']))
+            self._remove(old['key'])
+
+        fname = self.filename(key)
+        if not os.path.exists(fname):
+            _write_file(fname, data)
+        row['key'] = key
+        names = ['key'] + COLUMN_NAMES
+        self._db.execute('INSERT INTO headerlets ({0}) VALUES ({1})'
+                         .format(', '.join(names), ', '.join('?' * len(names))),
+                         [row[name] for name in names])
+        return key
+
+    def remove(self, key):
+        """ Remove the headerlet with key ``key`` from the store. """
+        with self._transaction():
+            self._remove(key)
+
+    def _remove(self, key):
+        self._db.execute('DELETE FROM headerlets WHERE key = ?', (key,))
+        self._removed.append(key)
+
+    def query(self, where=None, params=(), order_by=None, **criteria):
+        """
+        Select headerlets in the index.
+
+        Parameters
+        ----------
+        where : str
+            Additional SQL condition on the columns, for example
+            ``'rms_ra < ? AND nmatch > ?'``.
+        params : sequence
+            Values of the parameters of ``where``.
+        order_by : str
+            Column used to sort the result.
+        criteria :
+            Values of columns (``destim``, ``distname``, ``catalog``...)
+            the headerlets must match. A list matches any of its values.
+
+        Returns
+        -------
+        rows : list of dict
+            Indexed values and key of the selected headerlets.
+        """
+        conditions = []
+        values = []
+        for name, value in criteria.items():
+            _check_column(name)
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                conditions.append('{0} IN ({1})'.format(name, ', '.join('?' * len(value))))
+                values.extend(value)
+            else:
+                conditions.append('{0} = ?'.format(name))
+                values.append(value)
+        if where:
+            conditions.append('({0})'.format(where))
+            values.extend(params)
+        sql = 'SELECT * FROM headerlets'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if order_by is not None:
+            _check_column(order_by)
+            sql += ' ORDER BY ' + order_by
+        return [dict(row) for row in self._db.execute(sql, values)]
+
+    def fetch(self, key=None, destim=None, hdrname=None):
+        """
+        Read a headerlet from the store.
+
+        Parameters
+        ----------
+        key : str
+            Key of the headerlet (see `query`), or
+        destim, hdrname : str
+            DESTIM and HDRNAME of the headerlet.
+
+        Returns
+        -------
+        hlet : `~stwcs.wcsutil.headerlet.Headerlet`
+        """
+        if key is None:
+            rows = self.query(destim=destim, hdrname=hdrname)
+            if not rows:
+                raise KeyError("No headerlet {0} of {1} in the store".format(hdrname, destim))
+            key = rows[0]['key']
+        fname = self.filename(key)
+        if not os.path.exists(fname):
+            raise KeyError("No headerlet with key {0} in the store".format(key))
+        with open(fname, 'rb') as f:
+            data = f.read()
+        return headerlet.Headerlet.fromfile(io.BytesIO(data))
+
+    def import_files(self, filenames, replace=False):
+        """
+        Add the headerlet extensions of science files to the store.
+
+        Parameters
+        ----------
+        filenames : str or list of str
+            Science files; wild-cards, '@'-files and comma separated
+            lists are supported.
+        replace : bool
+            If True, headerlets with the same DESTIM and HDRNAME are
+            replaced, otherwise they are skipped.
+
+        Returns
+        -------
+        keys : list of str
+            Keys of the headerlets added to the store.
+        """
+        if isinstance(filenames, str):
+            filenames = parseinput.parseinput(filenames)[0]
+        keys = []
+        with self._transaction():
+            for fname in filenames:
+                with fits.open(fname) as fobj:
+                    for ind in headerlet.headerlet_index(fobj).positions:
+                        hdu = fobj[ind]
+                        if not isinstance(hdu, headerlet.HeaderletHDU):
+                            continue
+                        if not replace:
+                            header = hdu.primary_header
+                            if self.query(destim=header.get('DESTIM'),
+                                          hdrname=header.get('HDRNAME')):
+                                continue
+                        hlet = hdu.headerlet.resolve_lookup_tables(fobj)
+                        keys.append(self._insert(_headerlet_bytes(hlet), replace))
+        return keys
+
+
+def _check_column(name):
+    if name not in COLUMN_NAMES and name != 'key':
+        raise ValueError("Unknown headerlet store column {0}".format(name))
+
+
+def _index_values(header):
+    """ Values of the indexed columns in a headerlet primary header. """
+    for kw in ['HDRNAME', 'DESTIM']:
+        if not str(header.get(kw, '')).strip():
+            raise ValueError("Headerlet has no {0} keyword".format(kw))
+    row = {}
+    for name, kw, sqltype in COLUMNS:
+        value = header.get(kw)
+        if isinstance(value, str):
+            value = value.strip()
+        row[name] = value
+    return row
+
+
+def _headerlet_bytes(hdrlet):
+    """ Contents of a headerlet FITS file. """
+    if isinstance(hdrlet, bytes):
+        return hdrlet
+    if isinstance(hdrlet, fits.HDUList):
+        buf = io.BytesIO()
+        hdrlet.writeto(buf)
+        return buf.getvalue()
+    with open(hdrlet, 'rb') as f:
+        return f.read()
+
+
+def _write_file(fname, data):
+    """ Write a file atomically. """
+    dirname = os.path.dirname(fname)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, fname)
+    except Exception:
+        os.remove(tmpname)
+        raise
@@ -1,23 +1,32 @@
 import os
+import copy
+import queue
 import warnings
-from astropy.wcs import WCS
+from concurrent import futures
+from astropy.wcs import WCS, WCSBase, Sip
 from astropy.io import fits
-from ..distortion import models, coeff_converter
+from ..distortion import models, coeff_converter, mutil
 import numpy as np
 from stsci.tools import fileutil
 
 from . import pc2cd
 from . import getinput
+from . import serialize
 from . import instruments
+from .distgrid import DistortionGrid
 from .mappings import inst_mappings, ins_spec_kw
 
 from astropy import log
 default_log_level = log.getEffectiveLevel()
 
-__all__ = ['HSTWCS']
+__all__ = ['HSTWCS', 'ParallelHSTWCS', 'iter_chunks']
 
 warnings.filterwarnings("ignore", message="^Some non-standard WCS keywords were excluded:", module="astropy.wcs.wcs")
 
+# Keywords of the lookup table distortions (NPOLFILE and D2IMFILE)
+LOOKUP_TABLE_KW = ['CPERR*', 'DP1.*', 'DP2.*', 'CPDIS*',
+                   'D2IMERR*', 'D2IM1.*', 'D2IM2.*', 'D2IMDIS*', 'AXISCORR']
+
 def extract_rootname(kwvalue, suffix=""):
     """ Returns the rootname from a full reference filename
 
@@ -96,9 +105,30 @@ class NoConvergence(Exception):
         self.failed2converge = kwargs.pop('failed2converge', None)
 
 
+def _lookup_table_property(name):
+    """
+    Lookup table attribute of `HSTWCS` which reads the tables of an object
+    created with ``lazy_distortion=True`` when it is accessed.
+    """
+    base = getattr(WCSBase, name)
+
+    def fget(self):
+        self.load_distortion()
+        return base.__get__(self)
+
+    def fset(self, value):
+        base.__set__(self, value)
+
+    def fdel(self):
+        base.__delete__(self)
+
+    return property(fget, fset, fdel, doc=base.__doc__)
+
+
 class HSTWCS(WCS):
 
-    def __init__(self, fobj=None, ext=None, minerr=0.0, wcskey=" "):
+    def __init__(self, fobj=None, ext=None, minerr=0.0, wcskey=" ",
+                 lazy_distortion=False):
         """
         Create a WCS object based on the instrument.
 
@@ -123,11 +153,21 @@ class HSTWCS(WCS):
         wcskey : str
             A one character A-Z or " " used to retrieve and define an
             alternate WCS description.
+        lazy_distortion : bool
+            If True, the WCSDVARR and D2IMARR lookup tables are not read
+            when the object is created. They are read from ``fobj`` the first
+            time they are accessed (``cpdis1``, ``det2im1``...,
+            `has_distortion`, copies and `sub`), a transformation which uses
+            them is called, or when `load_distortion` is called. If ``fobj``
+            is an `astropy.io.fits.HDUList` it must stay open until then.
         """
 
         self.inst_kw = ins_spec_kw
         self.minerr = minerr
         self.wcskey = wcskey
+        self._lazy_distortion = None
+        # largest residual of the inverse SIP polynomials (AP, BP)
+        self.apbp_max = None
 
         if fobj is not None:
             filename, hdr0, ehdr, phdu = getinput.parseSingleInput(f=fobj,
@@ -143,8 +183,14 @@ class HSTWCS(WCS):
             if refframe is not None:
                 ehdr['RADESYS'] = refframe
 
-            WCS.__init__(self, ehdr, fobj=phdu, minerr=self.minerr,
-                         key=self.wcskey)
+            if lazy_distortion and _has_lookup_tables(ehdr):
+                source = fobj if isinstance(fobj, fits.HDUList) else filename
+                self._lazy_distortion = _LazyDistortion(source, ehdr.copy())
+                ehdr = _remove_lookup_tables(ehdr)
+                WCS.__init__(self, ehdr, minerr=self.minerr, key=self.wcskey)
+            else:
+                WCS.__init__(self, ehdr, fobj=phdu, minerr=self.minerr,
+                             key=self.wcskey)
             if self.instrument == 'DEFAULT':
                 self.pc2cd()
             # If input was a `astropy.io.fits.HDUList` object, it's the user's
@@ -153,6 +199,7 @@ class HSTWCS(WCS):
                 phdu.close()
             self.setInstrSpecKw(hdr0, ehdr)
             self.readIDCCoeffs(ehdr)
+            self.apbp_max = ehdr.get('APBP_MAX', None)
             extname = ehdr.get('EXTNAME', '')
             extnum = ehdr.get('EXTVER', None)
             self.extname = (extname, extnum)
@@ -181,6 +228,117 @@ class HSTWCS(WCS):
     def naxis2(self, value):
         self._naxis2 = value
 
+    cpdis1 = _lookup_table_property('cpdis1')
+    cpdis2 = _lookup_table_property('cpdis2')
+    det2im1 = _lookup_table_property('det2im1')
+    det2im2 = _lookup_table_property('det2im2')
+
+    def load_distortion(self):
+        """
+        Read the lookup table distortions of an object created with
+        ``lazy_distortion=True``. Does nothing if they have been read.
+        """
+        lazy = getattr(self, '_lazy_distortion', None)
+        if lazy is None:
+            return
+        (self.det2im1, self.det2im2), (self.cpdis1, self.cpdis2) = lazy.read(self)
+        self._lazy_distortion = None
+
+    def pix2foc(self, *args):
+        self.load_distortion()
+        return super(HSTWCS, self).pix2foc(*args)
+    pix2foc.__doc__ = WCS.pix2foc.__doc__
+
+    def p4_pix2foc(self, *args):
+        self.load_distortion()
+        return super(HSTWCS, self).p4_pix2foc(*args)
+    p4_pix2foc.__doc__ = WCS.p4_pix2foc.__doc__
+
+    def det2im(self, *args):
+        self.load_distortion()
+        return super(HSTWCS, self).det2im(*args)
+    det2im.__doc__ = WCS.det2im.__doc__
+
+    def to_fits(self, *args, **kwargs):
+        self.load_distortion()
+        return super(HSTWCS, self).to_fits(*args, **kwargs)
+    to_fits.__doc__ = WCS.to_fits.__doc__
+
+    def sub(self, axes=None):
+        self.load_distortion()
+        return super(HSTWCS, self).sub(axes=axes)
+    sub.__doc__ = WCS.sub.__doc__
+
+    def linear_copy(self):
+        """
+        Return a copy which shares the distortion model with this object.
+
+        The SIP coefficients and the lookup tables are not copied; they
+        must not be modified in place in either object. The linear WCS
+        (`astropy.wcs.Wcsprm`) and the IDC model coefficients are copied,
+        and so are other attributes when they are assigned. This is much
+        cheaper than `deepcopy` for objects with lookup tables.
+        """
+        new = self.__class__.__new__(self.__class__)
+        WCSBase.__init__(new, self.sip, (self.cpdis1, self.cpdis2),
+                         copy.copy(self.wcs), (self.det2im1, self.det2im2))
+        new.__dict__.update(self.__dict__)
+        if getattr(self, 'idcmodel', None) is not None:
+            new.idcmodel = self.idcmodel.copy()
+        return new
+
+    def to_bytes(self, lookup_tables=True):
+        """
+        Serialize the WCS in a compact binary format, see
+        `~stwcs.wcsutil.serialize`.
+
+        Parameters
+        ----------
+        lookup_tables : bool
+            If False, the NPOL and D2IM lookup tables are not included.
+        """
+        return serialize.dumps(self, lookup_tables=lookup_tables)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Create an HSTWCS object from the output of `to_bytes`.
+        """
+        return serialize.loads(data, cls)
+
+    def __reduce__(self):
+        self.load_distortion()
+        other = serialize.split_attributes(self.__dict__)[2]
+        return (serialize.loads, (self.to_bytes(), self.__class__), other)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def fit_inverse_sip(self, max_error=1e-3, max_order=9):
+        """
+        Fit inverse SIP polynomials (AP, BP) to the SIP coefficients.
+
+        The order is chosen so that the largest residual on a grid covering
+        the image is smaller than ``max_error`` pixels, see
+        `~stwcs.distortion.coeff_converter.fit_inverse_sip`. The residual is
+        saved in `apbp_max`. `all_world2pix` uses the inverse polynomials
+        as a starting point, or as the solution if there are no lookup table
+        distortions and `apbp_max` is smaller than the requested accuracy.
+
+        Returns
+        -------
+        max_residual, rms_residual : float
+            Largest and RMS residual in pixels.
+        """
+        if self.sip is None:
+            raise ValueError("The WCS has no SIP distortion.")
+        ap, bp, max_residual, rms_residual = coeff_converter.fit_inverse_sip(
+            self.sip.a, self.sip.b, self.sip.crpix, (self.naxis1, self.naxis2),
+            max_error=max_error, max_order=max_order)
+        self.sip = Sip(self.sip.a, self.sip.b, ap, bp, self.sip.crpix)
+        self.apbp_max = max_residual
+        return max_residual, rms_residual
+
     def readIDCCoeffs(self, header):
         """
         Reads in first order IDCTAB coefficients if present in the header
@@ -470,7 +628,7 @@ class HSTWCS(WCS):
     def all_world2pix(self, *args, **kwargs):
         """
         all_world2pix(*arg, accuracy=1.0e-4, maxiter=20, adaptive=False, \
-detect_divergence=True, quiet=False)
+detect_divergence=True, quiet=False, method='fixed-point', chunk_size=None)
 
         Performs full inverse transformation using iterative solution
         on full forward transformation with complete distortion model.
@@ -583,6 +741,32 @@ detect_divergence=True, quiet=False)
             within a specified number of maximum iterations set by `maxiter`
             parameter. Instead, simply return the found solution.
 
+        method : {'fixed-point', 'newton'}, optional (Default = 'fixed-point')
+            Numerical method used to invert the distortion model.
+            'fixed-point' is the method of consecutive approximations
+            described in `Notes`. 'newton' uses the Newton-Raphson method:
+            the correction applied at each iteration is the residual of
+            :py:meth:`pix2foc` multiplied by the inverse of the Jacobian of
+            the distortion. The Jacobian of the SIP polynomials is computed
+            analytically and the Jacobian of the lookup table corrections
+            (NPOL and D2IM) with finite differences. The Jacobian is updated
+            for the first two corrections only; afterwards the solution is
+            within a fraction of a pixel and the last Jacobian is used.
+            For strongly distorted detectors (e.g. ACS/WFC) 2-3 iterations
+            are typically needed instead of 5-8. Each iteration is more
+            expensive, so the gain in computation time depends on the cost
+            of the distortion model and on `accuracy`.
+
+        chunk_size : int or None, optional (Default = None)
+            If given, the points are converted in blocks of at most
+            `chunk_size` points. The intermediate arrays of the iterative
+            solution are allocated for one block at a time, which bounds
+            the memory used for large catalogs; inputs can be memory mapped
+            arrays. The convergence diagnostics of all blocks are reported in
+            a single :py:class:`NoConvergence` exception with indices
+            relative to the full input. See also :py:meth:`iter_world2pix`.
+            `adaptive` and `detect_divergence` are supported by both methods.
+
         Raises
         ------
         NoConvergence
@@ -600,6 +784,13 @@ detect_divergence=True, quiet=False)
         with the initial approximation, which is computed using the
         non-distorion-aware :py:meth:`wcs_world2pix` (or equivalent).
 
+        If the WCS has inverse SIP polynomials (AP, BP; see
+        :py:meth:`fit_inverse_sip`) they are applied to the initial
+        approximation. If there are no lookup table distortions, the largest
+        residual of the inverse polynomials (`apbp_max`, APBP_MAX keyword) is
+        smaller than `accuracy` and all points are on the image, this is the
+        solution and no iterations are done.
+
         The :py:meth:`all_world2pix` function uses a vectorized implementation
         of the method of consecutive approximations and therefore it is
         highly efficient (>30x) when *all* data points that need to be
@@ -703,12 +894,16 @@ adaptive=False, detect_divergence=False, quiet=False)
         #####################################################################
         ##                     PROCESS ARGUMENTS:                          ##
         #####################################################################
+        self.load_distortion()
         nargs = len(args)
+        chunk_size = kwargs.pop('chunk_size', None)
+        # in chunked mode blocks are converted one at a time
+        dtype = np.float64 if chunk_size is None else None
 
         if nargs == 3:
             try:
-                ra     = np.asarray(args[0], dtype=np.float64)
-                dec    = np.asarray(args[1], dtype=np.float64)
+                ra     = np.asarray(args[0], dtype=dtype)
+                dec    = np.asarray(args[1], dtype=dtype)
                 # assert( len(ra.shape) == 1 and len(dec.shape) == 1 )
                 origin = int(args[2])
                 vect1D = True
@@ -718,7 +913,7 @@ adaptive=False, detect_divergence=False, quiet=False)
                                 "Nx1 vectors.")
         elif nargs == 2:
             try:
-                rd  = np.asarray(args[0], dtype=np.float64)
+                rd  = np.asarray(args[0], dtype=dtype)
                 ra  = rd[:, 0]
                 dec = rd[:, 1]
                 origin = int(args[1])
@@ -730,13 +925,231 @@ adaptive=False, detect_divergence=False, quiet=False)
             raise TypeError("Expected 2 or 3 arguments, {:d} given.".format(nargs))
 
         # process optional arguments:
-        accuracy          = kwargs.pop('accuracy', 1.0e-4)
-        maxiter           = kwargs.pop('maxiter', 20)
-        adaptive          = kwargs.pop('adaptive', False)
-        detect_divergence = kwargs.pop('detect_divergence', True)
-        quiet             = kwargs.pop('quiet', False)
+        quiet = kwargs.pop('quiet', False)
+        options = _world2pix_options(kwargs)
+
+        npts = ra.shape[0]
+        if chunk_size is None or npts <= chunk_size:
+            x, y, dx, dy, k, ind, inddiv = self._world2pix(ra, dec, origin, **options)
+        else:
+            solution = _World2PixBlocks(npts)
+            for start in range(0, npts, chunk_size):
+                block = slice(start, start + chunk_size)
+                solution.add(start, self._world2pix(ra[block], dec[block], origin,
+                                                    **options))
+            x, y, dx, dy = solution.x, solution.y, solution.dx, solution.dy
+            k, ind, inddiv = solution.diagnostics()
+
+        #####################################################################
+        ##      RAISE EXCEPTION IF DIVERGING OR TOO SLOWLY CONVERGING      ##
+        ##      DATA POINTS HAVE BEEN DETECTED:                            ##
+        #####################################################################
+        if (ind is not None or inddiv is not None) and not quiet:
+            if vect1D:
+                sol  = [x, y]
+                err  = [np.abs(dx), np.abs(dy)]
+            else:
+                sol  = np.dstack([x, y] )[0]
+                err  = np.dstack([np.abs(dx), np.abs(dy)] )[0]
+            raise _noconvergence(k, ind, inddiv, best_solution=sol, accuracy=err)
 
         #####################################################################
+        ##             FINALIZE AND FORMAT DATA FOR RETURN:                ##
+        #####################################################################
+        if vect1D:
+            return [x, y]
+        else:
+            return np.dstack([x, y] )[0]
+
+    def iter_world2pix(self, blocks, origin, **kwargs):
+        """
+        Convert blocks of sky coordinates to pixel coordinates with
+        :py:meth:`all_world2pix`.
+
+        Only one block is converted at a time so the memory used does not
+        depend on the total number of points. Use `iter_chunks` to read
+        blocks from arrays which are memory mapped (``np.load(..., mmap_mode='r')``
+        or a column of a FITS table opened with ``memmap=True``).
+
+        Parameters
+        ----------
+        blocks : iterable
+            Blocks of sky coordinates, each block is either a tuple
+            ``(ra, dec)`` of 1-D arrays or a Nx2 array.
+        origin : int
+            0 or 1, see :py:meth:`all_world2pix`.
+        kwargs : dict
+            Optional arguments of :py:meth:`all_world2pix` (`accuracy`,
+            `maxiter`, `adaptive`, `detect_divergence`, `quiet`, `method`).
+
+        Yields
+        ------
+        pix : list or numpy.ndarray
+            ``[x, y]`` for blocks given as ``(ra, dec)`` and a Nx2 array
+            for blocks given as Nx2 arrays.
+
+        Raises
+        ------
+        NoConvergence
+            After the last block, if the solution did not converge or
+            diverged for some points and `quiet` is False. The indices in
+            `failed2converge` and `divergent` count points from the start
+            of the first block and `niter` is the largest number of
+            iterations over all blocks. The solutions have already been
+            yielded so `best_solution` and `accuracy` are None.
+
+        Examples
+        --------
+        >>> radec = np.load('catalog.npy', mmap_mode='r')
+        >>> for xy in w.iter_world2pix(iter_chunks(radec, chunk_size=10**6), 1):
+        ...     process(xy)
+        """
+        self.load_distortion()
+        quiet = kwargs.pop('quiet', False)
+        options = _world2pix_options(kwargs)
+        offset = 0
+        solution = _World2PixBlocks()
+        for block in blocks:
+            if isinstance(block, tuple):
+                ra, dec = block
+                vect1D = True
+            else:
+                rd = np.asarray(block)
+                ra, dec = rd[:, 0], rd[:, 1]
+                vect1D = False
+            result = self._world2pix(ra, dec, origin, **options)
+            solution.add(offset, result)
+            x, y = result[:2]
+            offset += x.shape[0]
+            if vect1D:
+                yield [x, y]
+            else:
+                yield np.dstack([x, y])[0]
+        k, ind, inddiv = solution.diagnostics()
+        if (ind is not None or inddiv is not None) and not quiet:
+            raise _noconvergence(k, ind, inddiv)
+
+    def all_pix2world(self, *args, **kwargs):
+        """
+        all_pix2world(*args, chunk_size=None)
+
+        Transforms pixel coordinates to world coordinates applying all
+        distortion corrections, see `astropy.wcs.WCS.all_pix2world`.
+
+        Parameters
+        ----------
+        chunk_size : int or None, optional (Default = None)
+            If given, the inputs are converted in blocks of at most
+            `chunk_size` points so that the memory used by intermediate
+            arrays is bounded. Inputs can be memory mapped arrays;
+            they are read one block at a time.
+        """
+        self.load_distortion()
+        chunk_size = kwargs.pop('chunk_size', None)
+        if chunk_size is None or len(args) not in [2, 3]:
+            return super(HSTWCS, self).all_pix2world(*args, **kwargs)
+        if len(args) == 3:
+            x, y, origin = args
+            x = np.asarray(x)
+            y = np.asarray(y)
+            if x.size <= chunk_size:
+                return super(HSTWCS, self).all_pix2world(x, y, origin, **kwargs)
+            # blocks of the flattened arrays (a view for contiguous arrays)
+            xflat = x.ravel()
+            yflat = y.ravel()
+            ra = np.empty(x.size, dtype=np.float64)
+            dec = np.empty(x.size, dtype=np.float64)
+            for start in range(0, x.size, chunk_size):
+                block = slice(start, start + chunk_size)
+                ra[block], dec[block] = super(HSTWCS, self).all_pix2world(
+                    xflat[block], yflat[block], origin, **kwargs)
+            return [ra.reshape(x.shape), dec.reshape(x.shape)]
+        xy, origin = args
+        npts = len(xy)
+        if npts <= chunk_size:
+            return super(HSTWCS, self).all_pix2world(xy, origin, **kwargs)
+        radec = np.empty((npts, 2), dtype=np.float64)
+        for start in range(0, npts, chunk_size):
+            block = slice(start, start + chunk_size)
+            radec[block] = super(HSTWCS, self).all_pix2world(xy[block], origin, **kwargs)
+        return radec
+
+    def iter_pix2world(self, blocks, origin, **kwargs):
+        """
+        Convert blocks of pixel coordinates to sky coordinates with
+        :py:meth:`all_pix2world`.
+
+        Parameters
+        ----------
+        blocks : iterable
+            Blocks of pixel coordinates, each block is either a tuple
+            ``(x, y)`` of 1-D arrays or a Nx2 array.
+        origin : int
+            0 or 1
+
+        Yields
+        ------
+        world : list or numpy.ndarray
+            ``[ra, dec]`` for blocks given as ``(x, y)`` and a Nx2 array
+            for blocks given as Nx2 arrays.
+        """
+        self.load_distortion()
+        for block in blocks:
+            if isinstance(block, tuple):
+                yield super(HSTWCS, self).all_pix2world(block[0], block[1], origin, **kwargs)
+            else:
+                yield super(HSTWCS, self).all_pix2world(block, origin, **kwargs)
+
+    def distortion_grid(self, step=16, order=3, samples=4):
+        """
+        Precompute the distortion model on a grid for fast approximate
+        transformations of many pixels, see `~stwcs.wcsutil.distgrid`.
+
+        Parameters
+        ----------
+        step : int
+            Spacing of the grid nodes in pixels.
+        order : int
+            1 (bilinear) or 3 (bicubic) interpolation.
+        samples : int
+            Number of positions per cell and axis where the interpolation
+            error is measured.
+
+        Returns
+        -------
+        grid : `~stwcs.wcsutil.distgrid.DistortionGrid`
+            The largest interpolation error in pixels is ``grid.max_error``.
+        """
+        self.load_distortion()
+        return DistortionGrid(self, step=step, order=order, samples=samples)
+
+    def _world2pix(self, ra, dec, origin, accuracy=1.0e-4, maxiter=20, adaptive=False,
+                   detect_divergence=True, method='fixed-point'):
+        """
+        Iterative solution of `all_world2pix` for one block of points.
+
+        Returns
+        -------
+        x, y : numpy.ndarray
+            solution
+        dx, dy : numpy.ndarray or None
+            last correction applied to the solution; None if there
+            are no distortions.
+        niter : int
+            number of iterations
+        failed2converge, divergent : numpy.ndarray or None
+            indices of the points which did not converge and which diverged.
+        """
+        ra = np.asarray(ra, dtype=np.float64)
+        dec = np.asarray(dec, dtype=np.float64)
+        # turn off numpy runtime warnings for 'invalid' and 'over':
+        with np.errstate(invalid='ignore', over='ignore'):
+            return self._world2pix_iterate(ra, dec, origin, accuracy, maxiter,
+                                           adaptive, detect_divergence, method)
+
+    def _world2pix_iterate(self, ra, dec, origin, accuracy, maxiter, adaptive,
+                           detect_divergence, method):
+        #####################################################################
         ##                INITIALIZE ITERATIVE PROCESS:                    ##
         #####################################################################
         x0, y0 = self.wcs_world2pix(ra, dec, origin)  # <-- initial approximation
@@ -750,22 +1163,24 @@ adaptive=False, detect_divergence=False, quiet=False)
            self.det2im1 is None and self.det2im2 is None:
             # no non-WCS corrections are detected - return
             # initial approximation
-            if vect1D:
-                return [x0, y0]
-            else:
-                return np.dstack([x0, y0])[0]
+            return x0, y0, None, None, 0, None, None
+
+        if self.sip is not None and self.sip.ap is not None and self.sip.bp is not None:
+            # start from the inverse SIP polynomials
+            x, y = self._sip_foc2pix(x0, y0, origin)
+            if self._inverse_sip_solves(x, y, origin, accuracy):
+                return x, y, None, None, 0, None, None
+        else:
+            x  = x0.copy()  # 0-order solution
+            y  = y0.copy()  # 0-order solution
 
-        x  = x0.copy()  # 0-order solution
-        y  = y0.copy()  # 0-order solution
+        if method == 'newton':
+            correction = self._newton_correction(x0, y0, origin)
+        else:
+            correction = self._fixed_point_correction(x0, y0, origin)
 
         # initial correction:
-        dx, dy = self.pix2foc(x, y, origin)
-        # If pix2foc does not apply all the required distortion
-        # corrections then replace the above line with:
-        # r0, d0 = self.all_pix2world(x, y, origin)
-        # dx, dy = self.wcs_world2pix(r0, d0, origin )
-        dx -= x0
-        dy -= y0
+        dx, dy = correction(x, y)
 
         # update initial solution:
         x -= dx
@@ -783,11 +1198,6 @@ adaptive=False, detect_divergence=False, quiet=False)
 
         npts = x.shape[0]
 
-        # turn off numpy runtime warnings for 'invalid' and 'over':
-        old_invalid = np.geterr()['invalid']
-        old_over = np.geterr()['over']
-        np.seterr(invalid='ignore', over='ignore')
-
         #####################################################################
         ##                     NON-ADAPTIVE ITERATIONS:                    ##
         #####################################################################
@@ -798,13 +1208,7 @@ adaptive=False, detect_divergence=False, quiet=False)
                     break
 
                 # find correction to the previous solution:
-                dx, dy = self.pix2foc(x, y, origin)
-                # If pix2foc does not apply all the required distortion
-                # corrections then replace the above line with:
-                # r0, d0 = self.all_pix2world(x, y, origin)
-                # dx, dy = self.wcs_world2pix(r0, d0, origin )
-                dx -= x0
-                dy -= y0
+                dx, dy = correction(x, y)
 
                 # update norn (L2) squared of the correction:
                 dn2 = dx ** 2 + dy ** 2
@@ -847,13 +1251,7 @@ adaptive=False, detect_divergence=False, quiet=False)
                     break
 
                 # find correction to the previous solution:
-                dx[ind], dy[ind] = self.pix2foc(x[ind], y[ind], origin)
-                # If pix2foc does not apply all the required distortion
-                # corrections then replace the above line with:
-                # r0[ind], d0[ind] = self.all_pix2world(x[ind], y[ind], origin)
-                # dx[ind], dy[ind] = self.wcs_world2pix(r0[ind], d0[ind], origin)
-                dx[ind] -= x0[ind]
-                dy[ind] -= y0[ind]
+                dx[ind], dy[ind] = correction(x[ind], y[ind], ind)
 
                 # update norn (L2) squared of the correction:
                 dn2 = dx ** 2 + dy ** 2
@@ -893,47 +1291,143 @@ adaptive=False, detect_divergence=False, quiet=False)
         else:
             ind = None
 
-        #####################################################################
-        ##      RAISE EXCEPTION IF DIVERGING OR TOO SLOWLY CONVERGING      ##
-        ##      DATA POINTS HAVE BEEN DETECTED:                            ##
-        #####################################################################
-        # raise exception if diverging or too slowly converging
-        if (ind is not None or inddiv is not None) and not quiet:
-            if vect1D:
-                sol  = [x, y]
-                err  = [np.abs(dx), np.abs(dy)]
-            else:
-                sol  = np.dstack([x, y] )[0]
-                err  = np.dstack([np.abs(dx), np.abs(dy)] )[0]
+        return x, y, dx, dy, k, ind, inddiv
+
+    def _sip_foc2pix(self, x, y, origin):
+        """
+        Apply the inverse SIP polynomials to focal plane positions ``(x, y)``.
+        """
+        u = x + ((1 - origin) - self.sip.crpix[0])
+        v = y + ((1 - origin) - self.sip.crpix[1])
+        return x + mutil.horner2d(u, v, self.sip.ap), y + mutil.horner2d(u, v, self.sip.bp)
+
+    def _inverse_sip_solves(self, x, y, origin, accuracy):
+        """
+        True if the inverse SIP solution ``(x, y)`` is within ``accuracy``:
+        there are no lookup table distortions, the residual of the inverse
+        polynomials is smaller than ``accuracy`` and all points are on the
+        image, where the residual was measured.
+        """
+        if self.apbp_max is None or self.apbp_max >= accuracy or \
+           self.cpdis1 is not None or self.cpdis2 is not None or \
+           self.det2im1 is not None or self.det2im2 is not None or \
+           self.naxis1 is None or self.naxis2 is None:
+            return False
+        lower = 0.5 - (1 - origin)
+        return bool(np.all((x >= lower) & (x <= self.naxis1 + lower) &
+                           (y >= lower) & (y <= self.naxis2 + lower)))
+
+    def _fixed_point_correction(self, x0, y0, origin):
+        """
+        Return a function computing the correction to the current solution
+        of `all_world2pix` with the method of consecutive approximations.
+        """
+        def correction(x, y, ind=None):
+            dx, dy = self.pix2foc(x, y, origin)
+            # If pix2foc does not apply all the required distortion
+            # corrections then replace the above line with:
+            # r0, d0 = self.all_pix2world(x, y, origin)
+            # dx, dy = self.wcs_world2pix(r0, d0, origin )
+            if ind is None:
+                return dx - x0, dy - y0
+            return dx - x0[ind], dy - y0[ind]
+        return correction
 
-            # restore previous numpy error settings:
-            np.seterr(invalid=old_invalid, over=old_over)
+    def _newton_correction(self, x0, y0, origin):
+        """
+        Return a function computing the Newton-Raphson correction to the
+        current solution of `all_world2pix`.
 
-            if inddiv is None:
-                raise NoConvergence("'HSTWCS.all_world2pix' failed to "
-                                    "converge to the requested accuracy after {:d} "
-                                    "iterations.".format(k), best_solution=sol,
-                                    accuracy=err, niter=k, failed2converge=ind,
-                                    divergent=None)
+        The Jacobian of ``pix2foc`` is ``(I + Jsip(t) + Jcpdis(t)) Jdet2im(p)``
+        where ``t = det2im(p)``. The Jacobians of the lookup tables are
+        computed with finite differences.
+        """
+        has_det2im = self.det2im1 is not None or self.det2im2 is not None
+        has_cpdis = self.cpdis1 is not None or self.cpdis2 is not None
+
+        def inverse_jacobian(x, y):
+            if has_det2im:
+                t, u = self.det2im(x, y, origin)
+                jdet2im = self._lookup_jacobian(self.det2im, x, y, origin,
+                                                f0=(t, u))
+            else:
+                t, u = x, y
+            j11, j12, j21, j22 = self._sip_jacobian(t, u, origin)
+            j11 += 1.
+            j22 += 1.
+            if has_cpdis:
+                jcpdis = self._lookup_jacobian(self.p4_pix2foc, t, u, origin)
+                j11 += jcpdis[0] - 1.
+                j12 += jcpdis[1]
+                j21 += jcpdis[2]
+                j22 += jcpdis[3] - 1.
+            if has_det2im:
+                d11, d12, d21, d22 = jdet2im
+                j11, j12, j21, j22 = (j11 * d11 + j12 * d21, j11 * d12 + j12 * d22,
+                                      j21 * d11 + j22 * d21, j21 * d12 + j22 * d22)
+            det = j11 * j22 - j12 * j21
+            return [j22 / det, -j12 / det, -j21 / det, j11 / det]
+
+        # The Jacobian is updated for the first `nupdates` corrections;
+        # afterwards the corrections are a small fraction of a pixel and
+        # the Jacobian of the last update is used.
+        jinv = []
+        nupdates = [2]
+
+        def correction(x, y, ind=None):
+            fx, fy = self.pix2foc(x, y, origin)
+            if ind is None:
+                fx -= x0
+                fy -= y0
             else:
-                raise NoConvergence("'HSTWCS.all_world2pix' failed to "
-                                    "converge to the requested accuracy.{0:s}"
-                                    "After {1:d} iterations, the solution is diverging "
-                                    "at least for one input point."
-                                    .format(os.linesep, k), best_solution=sol,
-                                    accuracy=err, niter=k, failed2converge=ind,
-                                    divergent=inddiv)
+                fx -= x0[ind]
+                fy -= y0[ind]
+            if nupdates[0] > 0:
+                nupdates[0] -= 1
+                inv = inverse_jacobian(x, y)
+                if ind is None:
+                    jinv[:] = inv
+                else:
+                    for cached, new in zip(jinv, inv):
+                        cached[ind] = new
+            else:
+                inv = [_select(j, ind) for j in jinv]
+            return inv[0] * fx + inv[1] * fy, inv[2] * fx + inv[3] * fy
+        return correction
 
-        #####################################################################
-        ##             FINALIZE AND FORMAT DATA FOR RETURN:                ##
-        #####################################################################
-        # restore previous numpy error settings:
-        np.seterr(invalid=old_invalid, over=old_over)
+    def _sip_jacobian(self, x, y, origin):
+        """
+        Return the partial derivatives of the SIP corrections,
+        ``dA/du, dA/dv, dB/du, dB/dv``, at pixel positions ``(x, y)``.
+        """
+        if self.sip is None:
+            zeros = np.zeros_like(x, dtype=np.float64)
+            return zeros, zeros.copy(), zeros.copy(), zeros.copy()
+        u = np.asarray(x, dtype=np.float64) + ((1 - origin) - self.sip.crpix[0])
+        v = np.asarray(y, dtype=np.float64) + ((1 - origin) - self.sip.crpix[1])
+        polyder = np.polynomial.polynomial.polyder
+        jac = []
+        for coeffs in [self.sip.a, self.sip.b]:
+            jac.append(mutil.horner2d(u, v, polyder(coeffs, axis=0)))
+            jac.append(mutil.horner2d(u, v, polyder(coeffs, axis=1)))
+        return jac
+
+    @staticmethod
+    def _lookup_jacobian(func, x, y, origin, f0=None, step=1.0):
+        """
+        Return the partial derivatives of a lookup table transformation
+        ``func(x, y, origin)`` computed with forward differences.
 
-        if vect1D:
-            return [x, y]
-        else:
-            return np.dstack([x, y] )[0]
+        The tables are interpolated linearly between nodes spaced by one
+        or more pixels, so a step of one pixel is accurate enough.
+        ``f0`` is ``func(x, y, origin)`` if it is already known.
+        """
+        if f0 is None:
+            f0 = func(x, y, origin)
+        fx1, fy1 = func(x + step, y, origin)
+        fx2, fy2 = func(x, y + step, origin)
+        return [(fx1 - f0[0]) / step, (fx2 - f0[0]) / step,
+                (fy1 - f0[1]) / step, (fy2 - f0[1]) / step]
 
     def _updatehdr(self, ext_hdr):
         # kw2add : OCX10, OCX11, OCY10, OCY11
@@ -963,6 +1457,314 @@ adaptive=False, detect_divergence=False, quiet=False)
         print('ORIENTAT : %r' % self.orientat)
 
 
+class ParallelHSTWCS(object):
+    """
+    Evaluate the coordinate transformations of an `HSTWCS` in a pool
+    of threads.
+
+    The inputs are split in contiguous blocks which are converted in
+    parallel and the results are assembled in the input order. wcslib and
+    NumPy release the GIL so the transformations of different blocks run
+    concurrently. `astropy.wcs.WCS` objects are not thread safe and each
+    block is converted with a copy of the WCS which is used by one thread
+    at a time.
+
+    The copies are made when the object is created; changes to ``wcs``
+    made afterwards are not seen by the copies.
+
+    Parameters
+    ----------
+    wcs : `HSTWCS`
+        WCS with the distortion model.
+    nthreads : int or None
+        Number of threads; defaults to the number of CPUs.
+    min_chunk_size : int
+        Inputs are not split in blocks smaller than this.
+
+    Examples
+    --------
+    >>> with ParallelHSTWCS(w, nthreads=4) as pw:
+    ...     ra, dec = pw.all_pix2world(x, y, 1)
+    ...     x, y = pw.all_world2pix(ra, dec, 1)
+    """
+    def __init__(self, wcs, nthreads=None, min_chunk_size=100000):
+        if nthreads is None:
+            nthreads = os.cpu_count() or 1
+        self.wcs = wcs
+        self.nthreads = nthreads
+        self.min_chunk_size = min_chunk_size
+        wcs.load_distortion()
+        self._copies = queue.Queue()
+        for i in range(nthreads):
+            self._copies.put(copy.deepcopy(wcs))
+        self._executor = futures.ThreadPoolExecutor(max_workers=nthreads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Shut down the pool of threads. """
+        self._executor.shutdown()
+
+    def all_pix2world(self, *args, **kwargs):
+        """ Parallel `HSTWCS.all_pix2world`. """
+        return self._map('all_pix2world', args, kwargs)
+
+    def wcs_pix2world(self, *args, **kwargs):
+        """ Parallel `HSTWCS.wcs_pix2world`. """
+        return self._map('wcs_pix2world', args, kwargs)
+
+    def wcs_world2pix(self, *args, **kwargs):
+        """ Parallel `HSTWCS.wcs_world2pix`. """
+        return self._map('wcs_world2pix', args, kwargs)
+
+    def pix2foc(self, *args, **kwargs):
+        """ Parallel `HSTWCS.pix2foc`. """
+        return self._map('pix2foc', args, kwargs)
+
+    def all_world2pix(self, *args, **kwargs):
+        """
+        Parallel `HSTWCS.all_world2pix`.
+
+        The iterative solution is computed independently for each block.
+        The convergence diagnostics of all blocks are reported in one
+        `NoConvergence` exception with indices relative to the full input.
+        """
+        if len(args) == 3:
+            ra = np.asarray(args[0], dtype=np.float64)
+            dec = np.asarray(args[1], dtype=np.float64)
+            vect1D = True
+        elif len(args) == 2:
+            rd = np.asarray(args[0], dtype=np.float64)
+            ra, dec = rd[:, 0], rd[:, 1]
+            vect1D = False
+        else:
+            raise TypeError("Expected 2 or 3 arguments, {:d} given.".format(len(args)))
+        origin = int(args[-1])
+        quiet = kwargs.pop('quiet', False)
+        options = _world2pix_options(kwargs)
+
+        def solve(w, block):
+            return w._world2pix(ra[block], dec[block], origin, **options)
+
+        blocks = self._blocks(ra.shape[0])
+        solution = _World2PixBlocks(ra.shape[0])
+        for block, result in zip(blocks, self._run(solve, blocks)):
+            solution.add(block.start, result)
+        k, ind, inddiv = solution.diagnostics()
+        if vect1D:
+            sol = [solution.x, solution.y]
+        else:
+            sol = np.dstack([solution.x, solution.y])[0]
+        if (ind is not None or inddiv is not None) and not quiet:
+            if vect1D:
+                err = [np.abs(solution.dx), np.abs(solution.dy)]
+            else:
+                err = np.dstack([np.abs(solution.dx), np.abs(solution.dy)])[0]
+            raise _noconvergence(k, ind, inddiv, best_solution=sol, accuracy=err)
+        return sol
+
+    def _blocks(self, npts):
+        chunk_size = max(self.min_chunk_size, -(-npts // self.nthreads), 1)
+        return [slice(start, start + chunk_size)
+                for start in range(0, max(npts, 1), chunk_size)]
+
+    def _run(self, func, blocks):
+        """ Return ``func(wcs, block)`` for each block, in order. """
+        def task(block):
+            w = self._copies.get()
+            try:
+                return func(w, block)
+            finally:
+                self._copies.put(w)
+        if len(blocks) == 1:
+            return [task(blocks[0])]
+        return list(self._executor.map(task, blocks))
+
+    def _map(self, method, args, kwargs):
+        if len(args) == 3:
+            x = np.asarray(args[0])
+            y = np.asarray(args[1])
+            origin = args[2]
+            blocks = self._blocks(x.shape[0])
+            results = self._run(lambda w, block: getattr(w, method)(
+                x[block], y[block], origin, **kwargs), blocks)
+            return [np.concatenate([r[0] for r in results]),
+                    np.concatenate([r[1] for r in results])]
+        elif len(args) == 2:
+            xy = np.asarray(args[0])
+            origin = args[1]
+            blocks = self._blocks(xy.shape[0])
+            results = self._run(lambda w, block: getattr(w, method)(
+                xy[block], origin, **kwargs), blocks)
+            return np.concatenate(results)
+        raise TypeError("Expected 2 or 3 arguments, {:d} given.".format(len(args)))
+
+
+def _has_lookup_tables(header):
+    """ True if the header refers to WCSDVARR or D2IMARR extensions. """
+    return any(kw in header for kw in ['CPDIS1', 'CPDIS2', 'D2IMDIS1', 'D2IMDIS2',
+                                       'AXISCORR'])
+
+
+def _remove_lookup_tables(header):
+    """ Return a copy of a header without the lookup table distortion keywords. """
+    header = header.copy()
+    for kw in LOOKUP_TABLE_KW:
+        try:
+            del header[kw]
+        except KeyError:
+            pass
+    return header
+
+
+class _LazyDistortion(object):
+    """
+    Source of the lookup table distortions of an HSTWCS created with
+    ``lazy_distortion=True``: a file name or an open HDUList and the
+    original extension header.
+
+    Copies of the HSTWCS share the same source.
+    """
+    def __init__(self, source, header):
+        self.source = source
+        self.header = header
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def read(self, wcs):
+        """ Return the (det2im1, det2im2) and (cpdis1, cpdis2) tables. """
+        if isinstance(self.source, fits.HDUList):
+            fobj = self.source
+        else:
+            fobj = fits.open(self.source)
+        try:
+            # the readers remove the keywords they use from the header
+            header = self.header.copy()
+            det2im = wcs._read_det2im_kw(header, fobj, err=wcs.minerr)
+            cpdis = wcs._read_distortion_kw(header, fobj, dist='CPDIS', err=wcs.minerr)
+        finally:
+            if fobj is not self.source:
+                fobj.close()
+        return det2im, cpdis
+
+
+def iter_chunks(*arrays, **kwargs):
+    """
+    Iterate over blocks of at most ``chunk_size`` rows of arrays.
+
+    Slicing memory mapped arrays reads only the corresponding part of the
+    file, so the blocks can be passed to `HSTWCS.iter_world2pix` or
+    `HSTWCS.iter_pix2world` to convert catalogs which do not fit in memory.
+
+    Parameters
+    ----------
+    arrays : array-like
+        One Nx2 array or several arrays of length N (e.g. RA and Dec).
+    chunk_size : int
+        Number of rows per block (Default = 1000000).
+
+    Yields
+    ------
+    block : array or tuple of arrays
+        A slice of the array if one array is given, else a tuple of slices.
+    """
+    chunk_size = kwargs.pop('chunk_size', 1000000)
+    if kwargs:
+        raise TypeError("Unexpected keyword arguments: {0}".format(list(kwargs)))
+    npts = len(arrays[0])
+    for start in range(0, npts, chunk_size):
+        block = slice(start, start + chunk_size)
+        if len(arrays) == 1:
+            yield arrays[0][block]
+        else:
+            yield tuple(arr[block] for arr in arrays)
+
+
+class _World2PixBlocks(object):
+    """
+    Collect the results of `HSTWCS._world2pix` computed for blocks of points.
+
+    If ``npts`` is given the solutions are copied to arrays of that length,
+    otherwise only the convergence diagnostics are kept.
+    """
+    def __init__(self, npts=None):
+        self.x = self.y = self.dx = self.dy = None
+        if npts is not None:
+            self.x = np.empty(npts, dtype=np.float64)
+            self.y = np.empty(npts, dtype=np.float64)
+            self.dx = np.zeros(npts, dtype=np.float64)
+            self.dy = np.zeros(npts, dtype=np.float64)
+        self.niter = 0
+        self.failed2converge = []
+        self.divergent = []
+
+    def add(self, start, result):
+        x, y, dx, dy, niter, ind, inddiv = result
+        if self.x is not None:
+            block = slice(start, start + x.shape[0])
+            self.x[block] = x
+            self.y[block] = y
+            if dx is not None:
+                self.dx[block] = dx
+                self.dy[block] = dy
+        self.niter = max(self.niter, niter)
+        if ind is not None:
+            self.failed2converge.append(ind + start)
+        if inddiv is not None:
+            self.divergent.append(inddiv + start)
+
+    def diagnostics(self):
+        """ Return niter, failed2converge and divergent for all the blocks. """
+        ind = np.concatenate(self.failed2converge) if self.failed2converge else None
+        inddiv = np.concatenate(self.divergent) if self.divergent else None
+        return self.niter, ind, inddiv
+
+
+def _world2pix_options(kwargs):
+    """ Pop and check the options of the iterative solution of all_world2pix. """
+    options = {'accuracy': kwargs.pop('accuracy', 1.0e-4),
+               'maxiter': kwargs.pop('maxiter', 20),
+               'adaptive': kwargs.pop('adaptive', False),
+               'detect_divergence': kwargs.pop('detect_divergence', True),
+               'method': kwargs.pop('method', 'fixed-point')}
+    if options['method'] not in ['fixed-point', 'newton']:
+        raise ValueError("Unknown method '{0}': expected 'fixed-point' or "
+                         "'newton'.".format(options['method']))
+    return options
+
+
+def _noconvergence(niter, failed2converge, divergent, best_solution=None, accuracy=None):
+    """ Return the `NoConvergence` exception raised by all_world2pix. """
+    if divergent is None:
+        return NoConvergence("'HSTWCS.all_world2pix' failed to "
+                             "converge to the requested accuracy after {:d} "
+                             "iterations.".format(niter), best_solution=best_solution,
+                             accuracy=accuracy, niter=niter,
+                             failed2converge=failed2converge, divergent=None)
+    return NoConvergence("'HSTWCS.all_world2pix' failed to "
+                         "converge to the requested accuracy.{0:s}"
+                         "After {1:d} iterations, the solution is diverging "
+                         "at least for one input point."
+                         .format(os.linesep, niter), best_solution=best_solution,
+                         accuracy=accuracy, niter=niter,
+                         failed2converge=failed2converge, divergent=divergent)
+
+
+def _select(arr, ind):
+    """ Return ``arr[ind]`` or ``arr`` if ``ind`` is None. """
+    if ind is None:
+        return arr
+    return arr[ind]
+
+
 def determine_refframe(phdr):
     """
     Determine the reference frame in standard FITS WCS.
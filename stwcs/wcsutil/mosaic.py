@@ -63,7 +63,7 @@ def vmosaic(fnames, outwcs=None, ref_wcs=None, ext=None, extname=None, undistort
     """
     wcsobjects = readWCS(fnames, ext, extname)
     if outwcs is not None:
-        outwcs = outwcs.deepcopy()
+        outwcs = utils.copy_wcs(outwcs)
     else:
         if ref_wcs is not None:
             outwcs = utils.output_wcs(wcsobjects, ref_wcs=ref_wcs, undistort=undistort)
@@ -78,7 +78,7 @@ def vmosaic(fnames, outwcs=None, ref_wcs=None, ext=None, extname=None, undistort
         outcorners = outwcs.wcs_world2pix(wobj.calc_footprint(), 1)
         if plot:
             plt.plot(outcorners[:, 0], outcorners[:, 1])
-        objwcs = outwcs.deepcopy()
+        objwcs = utils.copy_wcs(outwcs)
         objwcs.wcs.crpix = objwcs.wcs.crpix - (outcorners[0])
         updatehdr(wobj.filename, objwcs, wkey=wkey, wcsname=wname, ext=wobj.extname,
                   clobber=clobber)
@@ -144,7 +144,7 @@ def readWCS(input, exts=None, extname=None):
         # Assume it's simple FITS and the data is in the primary HDU
         for f in filelist:
             try:
-                wcso = wcsutil.HSTWCS(f)
+                wcso = wcsutil.HSTWCS(f, lazy_distortion=True)
             except AttributeError:
                 fomited.append(f)
                 continue
@@ -152,7 +152,7 @@ def readWCS(input, exts=None, extname=None):
         exts = [exts]
         for f in filelist:
             try:
-                wcso.extend([wcsutil.HSTWCS(f, ext=e) for e in exts])
+                wcso.extend([wcsutil.HSTWCS(f, ext=e, lazy_distortion=True) for e in exts])
             except KeyError:
                 fomited.append(f)
                 continue
@@ -165,7 +165,7 @@ def readWCS(input, exts=None, extname=None):
                 except KeyError:
                     continue
                 if ename.lower() == extname.lower():
-                    wcso.append(wcsutil.HSTWCS(f, ext=i))
+                    wcso.append(wcsutil.HSTWCS(f, ext=i, lazy_distortion=True))
                 else:
                     continue
             fobj.close()
@@ -0,0 +1,224 @@
+"""
+Compact binary serialization of `~stwcs.wcsutil.HSTWCS` objects.
+
+The layout is::
+
+    MAGIC (6 bytes) | version (uint8) | metadata length (uint32, little endian)
+    metadata (UTF-8 JSON) | padding to 8 bytes | arrays
+
+The metadata holds the scalar and string values of the linear WCS and of the
+instance attributes, and the dtype, shape and offset of each array. Arrays
+(CRPIX, CD, SIP coefficients, lookup tables, array attributes) are stored in
+little endian byte order, each one aligned to 8 bytes, and are read with
+`numpy.frombuffer`; no FITS header is written or parsed.
+
+Instance attributes which are not numbers, strings, sequences of them or
+arrays (for example ``idcmodel``) are not serialized by `dumps`.
+`HSTWCS` objects are pickled with `dumps` and these attributes are pickled
+separately.
+"""
+import json
+import struct
+
+import numpy as np
+from astropy.wcs import WCSBase, Wcsprm, Sip, DistortionLookupTable
+
+__all__ = ['dumps', 'loads']
+
+MAGIC = b'HSTWCS'
+VERSION = 1
+_PREFIX = struct.Struct('<6sBI')
+ALIGN = 8
+
+# Scalar and string members of Wcsprm
+WCSPRM_VALUES = ['alt', 'name', 'radesys', 'equinox', 'dateobs', 'mjdobs',
+                 'lonpole', 'latpole', 'restfrq', 'restwav',
+                 'specsys', 'ssysobs', 'velosys', 'zsource']
+# Array members of Wcsprm
+WCSPRM_ARRAYS = ['crpix', 'crval', 'mjdref']
+
+LOOKUP_TABLES = ['cpdis1', 'cpdis2', 'det2im1', 'det2im2']
+
+
+def dumps(wcs, lookup_tables=True):
+    """
+    Serialize an HSTWCS object to bytes.
+
+    Parameters
+    ----------
+    wcs : `~stwcs.wcsutil.HSTWCS`
+        WCS to serialize.
+    lookup_tables : bool
+        If False, the NPOL and D2IM lookup tables are not included.
+
+    Returns
+    -------
+    data : bytes
+    """
+    arrays = {}
+    meta = {'wcs': _wcsprm_values(wcs.wcs, arrays), 'sip': None,
+            'tables': [], 'attrs': {}, 'tuples': []}
+
+    if wcs.sip is not None:
+        meta['sip'] = []
+        for name in ['a', 'b', 'ap', 'bp']:
+            value = getattr(wcs.sip, name)
+            if value is not None:
+                arrays['sip.' + name] = value
+                meta['sip'].append(name)
+        arrays['sip.crpix'] = wcs.sip.crpix
+
+    if lookup_tables:
+        wcs.load_distortion()
+        for name in LOOKUP_TABLES:
+            table = getattr(wcs, name)
+            if table is not None:
+                arrays[name + '.data'] = table.data
+                arrays[name + '.crpix'] = table.crpix
+                arrays[name + '.crval'] = table.crval
+                arrays[name + '.cdelt'] = table.cdelt
+                meta['tables'].append(name)
+
+    attrs, attr_arrays, other = split_attributes(wcs.__dict__)
+    if not lookup_tables:
+        attrs['_lazy_distortion'] = None
+    meta['attrs'] = attrs
+    meta['tuples'] = sorted(k for k, v in attrs.items() if isinstance(v, tuple))
+    for name, value in attr_arrays.items():
+        arrays['attr.' + name] = value
+
+    return _pack(meta, arrays)
+
+
+def loads(data, cls=None):
+    """
+    Create an HSTWCS object from bytes written by `dumps`.
+
+    Parameters
+    ----------
+    data : bytes
+        Serialized WCS.
+    cls : type
+        Class of the new object; defaults to `~stwcs.wcsutil.HSTWCS`.
+    """
+    if cls is None:
+        from .hstwcs import HSTWCS as cls
+    meta, arrays = _unpack(data)
+
+    wcsprm = Wcsprm(naxis=2)
+    for name in WCSPRM_ARRAYS:
+        setattr(wcsprm, name, arrays['wcs.' + name])
+    values = meta['wcs']
+    wcsprm.ctype = values['ctype']
+    wcsprm.cunit = values['cunit']
+    if values['has_cd']:
+        wcsprm.cd = arrays['wcs.cd']
+    else:
+        wcsprm.pc = arrays['wcs.pc']
+        wcsprm.cdelt = arrays['wcs.cdelt']
+    if values['pv']:
+        wcsprm.set_pv([tuple(pv) for pv in values['pv']])
+    for name in WCSPRM_VALUES:
+        if name in values:
+            setattr(wcsprm, name, values[name])
+    wcsprm.set()
+
+    sip = None
+    if meta['sip'] is not None:
+        coeffs = dict((name, arrays.get('sip.' + name)) for name in ['a', 'b', 'ap', 'bp'])
+        sip = Sip(coeffs['a'], coeffs['b'], coeffs['ap'], coeffs['bp'], arrays['sip.crpix'])
+
+    tables = dict((name, None) for name in LOOKUP_TABLES)
+    for name in meta['tables']:
+        tables[name] = DistortionLookupTable(
+            arrays[name + '.data'], arrays[name + '.crpix'],
+            arrays[name + '.crval'], arrays[name + '.cdelt'])
+
+    wcs = cls.__new__(cls)
+    WCSBase.__init__(wcs, sip, (tables['cpdis1'], tables['cpdis2']), wcsprm,
+                     (tables['det2im1'], tables['det2im2']))
+    attrs = meta['attrs']
+    for name in meta['tuples']:
+        attrs[name] = tuple(attrs[name])
+    for name, value in arrays.items():
+        if name.startswith('attr.'):
+            attrs[name[5:]] = value
+    wcs.__dict__.update(attrs)
+    return wcs
+
+
+def split_attributes(dct):
+    """
+    Split instance attributes in values which can be stored in the JSON
+    metadata, arrays and other objects.
+    """
+    attrs = {}
+    arrays = {}
+    other = {}
+    for name, value in dct.items():
+        if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+            arrays[name] = value
+            continue
+        if isinstance(value, np.generic):
+            value = value.item()
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            other[name] = value
+        else:
+            attrs[name] = value
+    return attrs, arrays, other
+
+
+def _wcsprm_values(wcsprm, arrays):
+    values = {'ctype': list(wcsprm.ctype), 'cunit': [str(u) for u in wcsprm.cunit],
+              'has_cd': bool(wcsprm.has_cd()), 'pv': [list(pv) for pv in wcsprm.get_pv()]}
+    for name in WCSPRM_VALUES:
+        value = getattr(wcsprm, name)
+        if isinstance(value, np.generic):
+            value = value.item()
+        values[name] = value
+    for name in WCSPRM_ARRAYS:
+        arrays['wcs.' + name] = getattr(wcsprm, name)
+    if values['has_cd']:
+        arrays['wcs.cd'] = wcsprm.cd
+    else:
+        arrays['wcs.pc'] = wcsprm.pc
+        arrays['wcs.cdelt'] = wcsprm.cdelt
+    return values
+
+
+def _pack(meta, arrays):
+    blocks = []
+    meta['arrays'] = []
+    offset = 0
+    for name, value in arrays.items():
+        value = np.asarray(value)
+        value = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+        meta['arrays'].append([name, value.dtype.str, list(value.shape), offset])
+        block = value.tobytes()
+        blocks.append(block)
+        blocks.append(b'\0' * (-len(block) % ALIGN))
+        offset += len(block) + (-len(block) % ALIGN)
+    text = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    head = _PREFIX.pack(MAGIC, VERSION, len(text)) + text
+    head += b'\0' * (-len(head) % ALIGN)
+    return b''.join([head] + blocks)
+
+
+def _unpack(data):
+    magic, version, size = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Data is not a serialized HSTWCS object.")
+    if version > VERSION:
+        raise ValueError("Unsupported HSTWCS serialization version {0}.".format(version))
+    start = _PREFIX.size + size
+    meta = json.loads(bytes(data[_PREFIX.size:start]).decode('utf-8'))
+    start += -start % ALIGN
+    arrays = {}
+    for name, dtype, shape, offset in meta.pop('arrays'):
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        value = np.frombuffer(data, dtype=dtype, count=count, offset=start + offset)
+        arrays[name] = value.reshape(shape).astype(dtype.newbyteorder('='))
+    return meta, arrays
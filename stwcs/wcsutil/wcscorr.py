@@ -68,7 +68,7 @@ def init_wcscorr(input, force=False):
     wcsext.header['EXTVER'] = 1
 
     # define set of WCS keywords which need to be managed and copied to the table
-    wcs1 = stwcs.wcsutil.HSTWCS(fimg, ext=('SCI', 1))
+    wcs1 = stwcs.wcsutil.HSTWCS(fimg, ext=('SCI', 1), lazy_distortion=True)
     idc2header = True
     if wcs1.idcscale is None:
         idc2header = False
@@ -100,7 +100,8 @@ def init_wcscorr(input, force=False):
             altwcs.archiveWCS(fimg, ('SCI', extver), wcskey='O', wcsname='OPUS')
         wkey = 'O'
 
-        wcs = stwcs.wcsutil.HSTWCS(fimg, ext=('SCI', extver), wcskey=wkey)
+        wcs = stwcs.wcsutil.HSTWCS(fimg, ext=('SCI', extver), wcskey=wkey,
+                                   lazy_distortion=True)
         wcshdr = wcs.wcs2header(idc2hdr=idc2header)
 
         if wcsext.data.field('CRVAL1')[rownum] != 0:
@@ -131,7 +132,7 @@ def init_wcscorr(input, force=False):
         for extver in range(1, numsci + 1):
             hdr = fimg['SCI', extver].header
             wcs = stwcs.wcsutil.HSTWCS(fimg, ext=('SCI', extver),
-                                       wcskey=uwkey)
+                                       wcskey=uwkey, lazy_distortion=True)
             wcshdr = wcs.wcs2header()
             if 'WCSNAME' + uwkey not in wcshdr:
                 wcsid = utils.build_default_wcsname(fimg[0].header['idctab'])
@@ -317,7 +318,8 @@ def update_wcscorr(dest, source=None, extname='SCI', wcs_id=None, active=True):
         if len(wkeys) > 1 and ' ' in wkeys:
             wkeys.remove(' ')
         wcs_keys = wkeys
-    wcshdr = stwcs.wcsutil.HSTWCS(source, ext=(extname, 1)).wcs2header()
+    wcshdr = stwcs.wcsutil.HSTWCS(source, ext=(extname, 1),
+                                  lazy_distortion=True).wcs2header()
     wcs_keywords = list(wcshdr.keys())
 
     if 'O' in wcs_keys:
@@ -363,7 +365,8 @@ def update_wcscorr(dest, source=None, extname='SCI', wcs_id=None, active=True):
 
             idx += 1
 
-            wcs = stwcs.wcsutil.HSTWCS(source, ext=extn, wcskey=wcs_key)
+            wcs = stwcs.wcsutil.HSTWCS(source, ext=extn, wcskey=wcs_key,
+                                       lazy_distortion=True)
             wcshdr = wcs.wcs2header()
 
             # Update selection column values
@@ -443,7 +446,7 @@ def restore_file_from_wcscorr(image, id='OPUS', wcskey=''):
     wcs_table = fimg['WCSCORR']
     orig_rows = (wcs_table.data.field('WCS_ID') == 'OPUS')
     # create an HSTWCS object to figure out what WCS keywords need to be updated
-    wcsobj = stwcs.wcsutil.HSTWCS(fimg, ext=('sci', 1))
+    wcsobj = stwcs.wcsutil.HSTWCS(fimg, ext=('sci', 1), lazy_distortion=True)
     wcshdr = wcsobj.wcs2header()
     for extn in range(1, numsci + 1):
         # find corresponding row from table